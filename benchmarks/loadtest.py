@@ -0,0 +1,370 @@
+"""
+flask_sync 与 fastapi_async 的端到端压测。
+
+依次启动两个服务（flask 使用 uwsgi 或 gunicorn，fastapi 使用 uvicorn），对每个路由按给定的并发数
+持续施压，输出 JSON 结果：吞吐量、延迟分位数、错误数以及服务进程（含所有 worker）的最大 RSS。
+
+    python benchmarks/loadtest.py --concurrency 10,100 --duration 15 --output results.json
+    python benchmarks/loadtest.py --targets fastapi --fastapi-workers 8 --routes ping,orders
+    python benchmarks/loadtest.py --database-url postgresql://localhost:5432/bench
+
+未指定 --database-url 时使用临时目录中的 SQLite 文件代替 Postgres。数据库结构由 fastapi_async 的
+Alembic 迁移创建，并预先写入 --seed-users 个用户和 --seed-orders 个订单。
+服务没有 users/orders 路由（如较早版本的 flask_sync）时，跳过依赖数据库的路由，结果中不包含这些条目。
+压测客户端与服务运行在同一台机器上，高并发时客户端本身也会占用 CPU，比较不同配置时应保持客户端参数一致。
+依赖 fastapi_async 的开发环境（httpx、sqlalchemy、alembic），flask 服务需要能找到 uwsgi 或 gunicorn。
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import httpx
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+FLASK_DIR = os.path.join(ROOT, "flask_sync")
+FASTAPI_DIR = os.path.join(ROOT, "fastapi_async")
+
+# 路由名称到请求路径的映射，order 随机读取一个已存在的订单
+ROUTES = {
+    "ping": lambda seed: "/ping",
+    "sleep": lambda seed: "/sleep",
+    "users": lambda seed: "/users/",
+    "orders": lambda seed: "/orders/",
+    "order": lambda seed: f"/orders/{random.randint(1, max(1, seed['orders']))}",
+}
+# 依赖数据库的路由；flask_sync 在加入 users/orders API 之前没有这些路由，压测前先探测
+DATABASE_ROUTES = ("users", "orders", "order")
+
+
+def database_urls(url):
+    """返回 (同步 URL, 异步 URL)，分别给 flask 和 fastapi 使用"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    async_drivers = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+    if backend not in async_drivers:
+        raise SystemExit(f"Unsupported database backend: {backend}")
+    sync_url = url.set(drivername=backend)
+    async_url = url.set(drivername=f"{backend}+{async_drivers[backend]}")
+    return sync_url.render_as_string(hide_password=False), async_url.render_as_string(hide_password=False)
+
+
+def prepare_database(sync_url, async_url, users, orders):
+    """执行迁移并写入压测数据"""
+    env = {**os.environ, "DATABASE_URL": async_url}
+    subprocess.run([sys.executable, "-m", "alembic", "upgrade", "head"], cwd=FASTAPI_DIR, env=env, check=True)
+
+    engine = create_engine(sync_url)
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM orders"))
+        conn.execute(text("DELETE FROM users"))
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        conn.execute(
+            text("INSERT INTO users (id, username, email, hashed_password, created_at, updated_at) "
+                 "VALUES (:id, :username, :email, 'x', :now, :now)"),
+            [{"id": i, "username": f"user{i}", "email": f"user{i}@example.com", "now": now}
+             for i in range(1, users + 1)],
+        )
+        conn.execute(
+            text("INSERT INTO orders (id, user_id, amount, status, created_at, updated_at) "
+                 "VALUES (:id, :user_id, :amount, 'pending', :now, :now)"),
+            [{"id": i, "user_id": random.randint(1, users), "amount": round(random.uniform(1, 500), 2), "now": now}
+             for i in range(1, orders + 1)],
+        )
+    engine.dispose()
+
+
+def server_command(target, args):
+    if target == "fastapi":
+        return [
+            sys.executable, "-m", "uvicorn", "app:app",
+            "--host", "127.0.0.1", "--port", str(args.fastapi_port),
+            "--workers", str(args.fastapi_workers), "--log-level", "warning", "--no-access-log",
+        ], FASTAPI_DIR
+    if args.flask_server == "gunicorn":
+        return [
+            "gunicorn", "app:app", "--bind", f"127.0.0.1:{args.flask_port}",
+            "--workers", str(args.flask_processes), "--threads", str(args.flask_threads),
+            "--log-level", "warning",
+        ], FLASK_DIR
+    return [
+        "uwsgi", "--http", f"127.0.0.1:{args.flask_port}", "--master", "--die-on-term",
+        "--processes", str(args.flask_processes), "--threads", str(args.flask_threads),
+        "--wsgi-file", "app.py", "--callable", "app", "--disable-logging",
+    ], FLASK_DIR
+
+
+def logging_env(target):
+    """关闭两个服务的请求日志，避免只有一边承担日志格式化和写入的开销
+
+    fastapi_async 通过 LOG_SAMPLE_RATES 丢弃 INFO 级别的请求日志，flask_sync 只读取 LOG_LEVEL。
+    """
+    if target == "fastapi":
+        return {"LOG_SAMPLE_RATES": os.environ.get("LOG_SAMPLE_RATES", "/*=0")}
+    return {"LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING")}
+
+
+def start_server(target, args, sync_url, async_url):
+    command, cwd = server_command(target, args)
+    if shutil.which(command[0]) is None and command[0] != sys.executable:
+        raise SystemExit(f"{command[0]} not found, install it to benchmark {target}")
+    env = {
+        **os.environ,
+        "DATABASE_URL": async_url if target == "fastapi" else sync_url,
+        "WEB_CONCURRENCY": str(args.fastapi_workers if target == "fastapi" else args.flask_processes),
+        **logging_env(target),
+    }
+    # 新建进程组，结束时连同所有 worker 一起终止
+    return subprocess.Popen(
+        command, cwd=cwd, env=env, start_new_session=True,
+        stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL,
+    )
+
+
+def stop_server(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=15)
+    except ProcessLookupError:
+        pass
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+async def wait_ready(base_url, process, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url, timeout=1.0) as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise SystemExit(f"Server at {base_url} exited with code {process.returncode}")
+            try:
+                if (await client.get("/ping")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise SystemExit(f"Server at {base_url} did not become ready in {timeout}s")
+
+
+async def available_routes(base_url, routes):
+    """返回服务实际提供的路由：/orders/ 返回 404 时跳过所有依赖数据库的路由"""
+    if not any(route in DATABASE_ROUTES for route in routes):
+        return routes
+    async with httpx.AsyncClient(base_url=base_url, timeout=5.0) as client:
+        response = await client.get("/orders/", params={"limit": 1})
+    if response.status_code != 404:
+        return routes
+    skipped = [route for route in routes if route in DATABASE_ROUTES]
+    print(f"{base_url} does not serve the users/orders API, skipping routes: {','.join(skipped)}", file=sys.stderr)
+    return [route for route in routes if route not in DATABASE_ROUTES]
+
+
+def _children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def _rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def process_tree_rss_mb(pid):
+    """主进程及所有子进程的 RSS 之和（MB），仅支持 Linux"""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        total += _rss_kb(current)
+        pending.extend(_children(current))
+    return round(total / 1024, 1)
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+async def run_level(base_url, route, concurrency, duration, timeout, seed, pid):
+    """以固定并发持续请求 duration 秒"""
+    latencies = []
+    statuses = Counter()
+    errors = 0
+    max_rss = process_tree_rss_mb(pid)
+    make_path = ROUTES[route]
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + duration
+
+        async def worker():
+            nonlocal errors
+            while loop.time() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(make_path(seed))
+                except httpx.HTTPError as exc:
+                    errors += 1
+                    statuses[type(exc).__name__] += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+                statuses[str(response.status_code)] += 1
+                if response.status_code >= 400:
+                    errors += 1
+
+        async def sample_rss():
+            nonlocal max_rss
+            while True:
+                await asyncio.sleep(0.5)
+                max_rss = max(max_rss, process_tree_rss_mb(pid))
+
+        sampler = asyncio.create_task(sample_rss())
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+
+    latencies.sort()
+    completed = sum(statuses.values())
+    return {
+        "route": route,
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 3),
+        "requests": completed,
+        "errors": errors,
+        "status_codes": dict(statuses),
+        "throughput_rps": round((completed - errors) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            name: round(value * 1000, 3) if value is not None else None
+            for name, value in (
+                ("p50", percentile(latencies, 50)),
+                ("p90", percentile(latencies, 90)),
+                ("p99", percentile(latencies, 99)),
+                ("max", latencies[-1] if latencies else None),
+                ("mean", sum(latencies) / len(latencies) if latencies else None),
+            )
+        },
+        "rss_mb_max": max_rss,
+    }
+
+
+async def benchmark_target(target, args, sync_url, async_url, seed):
+    port = args.fastapi_port if target == "fastapi" else args.flask_port
+    base_url = f"http://127.0.0.1:{port}"
+    process = start_server(target, args, sync_url, async_url)
+    results = []
+    try:
+        await wait_ready(base_url, process)
+        idle_rss = process_tree_rss_mb(process.pid)
+        for route in await available_routes(base_url, args.routes):
+            if args.warmup > 0:
+                await run_level(base_url, route, 1, args.warmup, args.timeout, seed, process.pid)
+            for concurrency in args.concurrency:
+                result = await run_level(base_url, route, concurrency, args.duration, args.timeout, seed, process.pid)
+                result.update(target=target, idle_rss_mb=idle_rss)
+                results.append(result)
+                print(f"{target:8} {route:7} c={concurrency:<5} {result['throughput_rps']:>10} req/s  "
+                      f"p50={result['latency_ms']['p50']}ms p99={result['latency_ms']['p99']}ms  "
+                      f"errors={result['errors']}  rss={result['rss_mb_max']}MB", file=sys.stderr)
+    finally:
+        stop_server(process)
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", default="flask,fastapi", help="逗号分隔：flask,fastapi")
+    parser.add_argument("--routes", default="ping,sleep,users,orders,order",
+                        help=f"逗号分隔，可选 {','.join(ROUTES)}")
+    parser.add_argument("--concurrency", default="10,100", help="逗号分隔的并发数")
+    parser.add_argument("--duration", type=float, default=10.0, help="每个并发级别持续的秒数")
+    parser.add_argument("--warmup", type=float, default=2.0, help="每个路由正式压测前的预热秒数")
+    parser.add_argument("--timeout", type=float, default=30.0, help="单个请求的超时秒数")
+    parser.add_argument("--database-url", default=None, help="默认使用临时 SQLite 文件")
+    parser.add_argument("--seed-users", type=int, default=100)
+    parser.add_argument("--seed-orders", type=int, default=1000)
+    parser.add_argument("--flask-server", choices=("uwsgi", "gunicorn"), default="uwsgi")
+    parser.add_argument("--flask-processes", type=int, default=4)
+    parser.add_argument("--flask-threads", type=int, default=2)
+    parser.add_argument("--flask-port", type=int, default=5000)
+    parser.add_argument("--fastapi-workers", type=int, default=4)
+    parser.add_argument("--fastapi-port", type=int, default=5050)
+    parser.add_argument("--label", default="", help="写入结果的标签，便于区分不同配置")
+    parser.add_argument("--output", default="-", help="结果 JSON 文件，- 表示输出到 stdout")
+    parser.add_argument("--verbose", action="store_true", help="显示服务端的 stderr")
+    args = parser.parse_args(argv)
+
+    args.targets = [t.strip() for t in args.targets.split(",") if t.strip()]
+    args.routes = [r.strip() for r in args.routes.split(",") if r.strip()]
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    for target in args.targets:
+        if target not in ("flask", "fastapi"):
+            parser.error(f"unknown target: {target}")
+    for route in args.routes:
+        if route not in ROUTES:
+            parser.error(f"unknown route: {route}")
+    return args
+
+
+async def main(argv=None):
+    args = parse_args(argv)
+    started_at = datetime.now(timezone.utc).isoformat()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database_url = args.database_url or f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+        sync_url, async_url = database_urls(database_url)
+        prepare_database(sync_url, async_url, args.seed_users, args.seed_orders)
+        seed = {"users": args.seed_users, "orders": args.seed_orders}
+
+        results = []
+        for target in args.targets:
+            results.extend(await benchmark_target(target, args, sync_url, async_url, seed))
+
+    report = {
+        "label": args.label,
+        "started_at": started_at,
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "config": {
+            "database": make_url(database_url).get_backend_name(),
+            "duration_s": args.duration,
+            "flask": {"server": args.flask_server, "processes": args.flask_processes, "threads": args.flask_threads,
+                      "logging": logging_env("flask")},
+            "fastapi": {"workers": args.fastapi_workers, "logging": logging_env("fastapi")},
+            "seed": seed,
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(output)
+    else:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
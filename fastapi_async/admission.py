@@ -0,0 +1,207 @@
+"""
+准入控制：按路由限制并发，过载时快速拒绝。
+
+数据库变慢时，不加限制地接收请求只会让协程堆积在连接池签出上，最后全部超时。
+每个路由（方法 + 路由模板，如 "POST /orders/"）一个并发上限，超过上限的请求进入有界等待队列，
+队列已满或等待超过 ADMISSION_QUEUE_TIMEOUT 秒时直接返回 503 和 Retry-After。
+
+设置 ADMISSION_TARGET_LATENCY_MS 后按 AIMD 自适应调整上限：请求耗时超过目标时上限乘以 0.9
+（每秒最多一次），未超过时每个请求把上限增加 1/上限，最多回到配置值。
+上限只在事件循环线程中修改，不需要加锁。
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from fastapi.responses import JSONResponse
+from starlette.routing import Match
+import config
+import metrics
+
+# 获取 logger
+logger = logging.getLogger(__name__)
+
+# 乘性减小的系数与两次减小之间的最短间隔（秒）
+DECREASE_FACTOR = 0.9
+DECREASE_INTERVAL = 1.0
+
+admission_rejected_total = metrics.Counter(
+    "admission_rejected_total", "Requests rejected with 503 by admission control", ("route", "reason"),
+)
+admission_in_flight = metrics.Gauge("admission_in_flight", "Admitted requests being processed", ("route",))
+admission_queue_depth = metrics.Gauge("admission_queue_depth", "Requests waiting for a concurrency slot", ("route",))
+admission_limit = metrics.Gauge("admission_limit", "Current concurrency limit", ("route",))
+
+
+def parse_limits(value):
+    """解析 "POST /orders/=20,GET /orders/{order_id}=100,*=200" 形式的并发上限配置"""
+    limits = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        key, limit = item.rsplit("=", 1)
+        limits[" ".join(key.split())] = int(limit)
+    return limits
+
+
+class RouteLimiter:
+    """单个路由的并发上限与等待队列"""
+
+    def __init__(self, key, limit, queue_size):
+        self.key = key
+        self.max_limit = limit
+        self.limit = float(limit)
+        self.queue_size = queue_size
+        self.in_flight = 0
+        self._waiters = deque()
+        self._last_decrease = 0.0
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    def _has_slot(self):
+        return self.in_flight < max(1, int(self.limit))
+
+    async def acquire(self, timeout):
+        """获取一个并发名额，成功返回 None，否则返回拒绝原因 "queue_full" 或 "timeout" """
+        if self._has_slot() and not self._waiters:
+            self.in_flight += 1
+            return None
+        if len(self._waiters) >= self.queue_size:
+            return "queue_full"
+
+        # 名额由 release 直接转交给等待者（in_flight 在转交时已经加一）
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait((waiter,), timeout=timeout)
+        except asyncio.CancelledError:
+            if waiter.done():
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+        if waiter.done():
+            return None
+        self._waiters.remove(waiter)
+        waiter.cancel()
+        return "timeout"
+
+    def release(self, latency=None):
+        self.in_flight -= 1
+        if latency is not None:
+            self._adapt(latency)
+        while self._waiters and self._has_slot():
+            self._waiters.popleft().set_result(None)
+            self.in_flight += 1
+
+    def _adapt(self, latency):
+        target = config.ADMISSION_TARGET_LATENCY_MS / 1000
+        if target <= 0:
+            return
+        if latency > target:
+            now = time.monotonic()
+            if now - self._last_decrease >= DECREASE_INTERVAL:
+                self._last_decrease = now
+                self.limit = max(float(config.ADMISSION_MIN_LIMIT), self.limit * DECREASE_FACTOR)
+                logger.warning("Latency %.1f ms above target on %s, concurrency limit lowered to %s",
+                               latency * 1000, self.key, int(self.limit))
+        else:
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+
+    def to_dict(self):
+        return {
+            "limit": int(self.limit),
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+        }
+
+
+# 配置的上限，键为 "METHOD 模板"、"模板"（任意方法）或 "*"（其他所有路由）
+_limits = {}
+# 已创建的限流器，键为 "METHOD 模板"
+_limiters = {}
+
+
+def configure(limits):
+    _limits.clear()
+    _limits.update(limits)
+    _limiters.clear()
+
+
+def _find_route(scope):
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route
+    return None
+
+
+def get_limiter(scope):
+    """按方法和路由模板返回限流器，未配置上限的路由返回 None"""
+    route = _find_route(scope)
+    if route is None:
+        return None
+    # 提前写入路由，被拒绝的请求在指标中也按路由模板统计
+    scope["route"] = route
+    key = f"{scope['method']} {route.path}"
+    limiter = _limiters.get(key)
+    if limiter is None:
+        limit = _limits.get(key, _limits.get(route.path, _limits.get("*")))
+        if not limit:
+            return None
+        limiter = _limiters[key] = RouteLimiter(key, limit, config.ADMISSION_QUEUE_SIZE)
+    return limiter
+
+
+def get_admission_stats() -> dict:
+    return {key: limiter.to_dict() for key, limiter in _limiters.items()}
+
+
+def _collect_admission_metrics():
+    for key, limiter in _limiters.items():
+        admission_in_flight.set(limiter.in_flight, key)
+        admission_queue_depth.set(limiter.queued, key)
+        admission_limit.set(int(limiter.limit), key)
+
+
+metrics.add_collector(_collect_admission_metrics)
+configure(parse_limits(config.ADMISSION_LIMITS))
+
+
+class AdmissionControlMiddleware:
+    """纯 ASGI 中间件，需要放在 RequestContextMiddleware 内层，拒绝的请求也带 X-Request-ID"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _limits or scope["path"] in config.ADMISSION_EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = get_limiter(scope)
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        reason = await limiter.acquire(config.ADMISSION_QUEUE_TIMEOUT)
+        if reason is not None:
+            admission_rejected_total.inc(limiter.key, reason)
+            logger.warning("Rejected %s: %s (limit %s, queued %s)",
+                           limiter.key, reason, int(limiter.limit), limiter.queued)
+            response = JSONResponse(
+                {"detail": "Server is overloaded, retry later"},
+                status_code=503,
+                headers={"Retry-After": str(config.ADMISSION_RETRY_AFTER)},
+            )
+            await response(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.perf_counter() - start)
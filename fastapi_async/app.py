@@ -1,9 +1,19 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 import asyncio
 from contextlib import asynccontextmanager
-import uuid
-import time
-from context import request_id_var, setup_logging
+from context import setup_logging, get_logging_stats
+from middleware import RequestContextMiddleware
+from db import engine, read_engines, get_pool_metrics, pool_status, dispose_engines
+import admission
+import config
+import executors
+import loop_monitor
+import metrics
+import profiler
+import warmup
+from services import order_batcher
+from services import order_stats
 
 # 初始化日志，设置 sql_echo=False 避免冗余的 SQL 日志
 logger = setup_logging(sql_echo=False)
@@ -12,49 +22,53 @@ logger = setup_logging(sql_echo=False)
 async def lifespan(app: FastAPI):
     # Application startup and shutdown logic
     # We no longer need to create tables here since we'll use Alembic migrations
+    order_stats.check_rollup_support(engine)
+    metrics.start_flusher()
+    executors.start()
+    order_batcher.start()
+    loop_monitor.start()
+    # 预热连接池、编译语句缓存和 OpenAPI 文档，完成前 /ready 返回 503
+    await warmup.start(app)
     yield
+    # 服务器已经等待进行中的请求结束（SERVER_GRACEFUL_TIMEOUT），这里停止预热重试后关闭执行器和连接池
+    await warmup.stop()
+    await loop_monitor.stop()
+    await executors.stop()
+    # 写入队列中剩余的订单后再关闭连接池
+    await order_batcher.stop()
+    await dispose_engines()
+    await metrics.stop_flusher()
 
 app = FastAPI(lifespan=lifespan)
 
+# SQL 分析中间件需要读取 request_id，放在 RequestContextMiddleware 内层
+app.add_middleware(profiler.QueryProfilerMiddleware)
+# 准入控制放在 RequestContextMiddleware 内层，被拒绝的请求也有 request_id 和日志
+app.add_middleware(admission.AdmissionControlMiddleware)
 # 添加中间件来生成请求 ID 并将其添加到日志上下文
-@app.middleware("http")
-async def add_request_id(request: Request, call_next):
-    # 生成一个唯一的请求ID
-    request_id = str(uuid.uuid4())
-    
-    # 将请求 ID 设置到上下文变量中
-    token = request_id_var.set(request_id)
-    
-    # 将请求 ID 绑定到请求状态
-    request.state.request_id = request_id
-    
-    try:
-        # 记录请求开始
-        logger.info(f"Request started: {request.method} {request.url.path}")
-        
-        # 记录处理时间
-        start_time = time.time()
-        
-        # 处理请求
-        response = await call_next(request)
-        
-        # 计算处理时间
-        process_time = time.time() - start_time
-        
-        # 记录请求结束
-        logger.info(f"Request completed: {request.method} {request.url.path} - "
-                    f"Took: {process_time:.4f}s - Status: {response.status_code}")
-        
-        # 将请求 ID 添加到响应头
-        response.headers["X-Request-ID"] = request_id
-        
-        return response
-    except Exception as e:
-        logger.exception(f"Error processing request: {str(e)}")
-        raise
-    finally:
-        # 重置上下文变量，避免泄漏到其他请求
-        request_id_var.reset(token)
+app.add_middleware(RequestContextMiddleware)
+# 指标中间件放在最外层，统计包含其他中间件在内的完整耗时
+app.add_middleware(metrics.MetricsMiddleware)
+
+# 数据库查询计时与分析
+for _engine in {engine, *read_engines}:
+    metrics.instrument_engine(_engine.sync_engine)
+
+# 连接池与日志队列的指标在导出时读取
+db_pool_checked_out = metrics.Gauge("db_pool_checked_out", "Connections currently checked out", ("engine",))
+db_pool_overflow = metrics.Gauge("db_pool_overflow", "Overflow connections in use", ("engine",))
+db_pool_wait_seconds_total = metrics.Counter("db_pool_wait_seconds_total", "Total time spent waiting for a connection", ("engine",))
+log_records_dropped_total = metrics.Gauge("log_records_dropped_total", "Log records dropped because the queue was full")
+
+def _collect_runtime_metrics():
+    for name, pool_engine in [("write", engine)] + [(f"read{i}", e) for i, e in enumerate(read_engines) if e is not engine]:
+        status = pool_status(pool_engine)
+        db_pool_checked_out.set(status.get("checked_out", 0), name)
+        db_pool_overflow.set(status.get("overflow", 0), name)
+        db_pool_wait_seconds_total.set(status.get("wait_time_total", 0.0), name)
+    log_records_dropped_total.set(get_logging_stats()["dropped"])
+
+metrics.add_collector(_collect_runtime_metrics)
 
 # 导入 routers
 from routers import users, orders
@@ -68,6 +82,47 @@ async def ping():
     logger.info("Ping request received")
     return {"message": "pong"}
 
+@app.get("/ready")
+async def ready():
+    """就绪检查：预热完成前和关闭排空期间返回 503"""
+    status = warmup.get_status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus 文本格式指标，多 worker 时汇总所有 worker"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/pool")
+async def debug_pool():
+    """连接池实时状态：签出连接数、溢出连接数与签出等待时间"""
+    return get_pool_metrics()
+
+@app.get("/debug/logging")
+async def debug_logging():
+    """异步日志队列状态：排队中的记录数与被丢弃的记录数"""
+    return get_logging_stats()
+
+@app.get("/debug/admission")
+async def debug_admission():
+    """各路由的并发上限、执行中和排队中的请求数"""
+    return admission.get_admission_stats()
+
+@app.get("/debug/executor")
+async def debug_executor():
+    """CPU 执行器状态：排队和执行中的任务数"""
+    return executors.get_executor_stats()
+
+@app.get("/debug/loop")
+async def debug_loop():
+    """事件循环延迟分位数与最近的慢回调"""
+    return loop_monitor.get_loop_stats()
+
+@app.get("/debug/queries")
+async def debug_queries():
+    """最近请求执行的 SQL，需开启 QUERY_PROFILING"""
+    return {"enabled": config.QUERY_PROFILING, "requests": profiler.get_recent_profiles()}
+
 @app.get("/sleep")
 async def sleep_endpoint():
     logger.info("Sleep request received, waiting for 5 seconds")
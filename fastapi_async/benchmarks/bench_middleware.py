@@ -0,0 +1,115 @@
+"""
+对比 @app.middleware("http")（BaseHTTPMiddleware）与纯 ASGI 的 RequestContextMiddleware
+在每个请求上的额外开销。
+
+    python benchmarks/bench_middleware.py --requests 20000
+
+直接以 ASGI 方式调用应用（不经过网络和 HTTP 客户端），日志被禁用，
+结果中的差值就是中间件本身的开销。
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi import FastAPI, Request
+
+from context import request_id_var
+from middleware import RequestContextMiddleware
+
+
+def build_plain_app():
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"message": "pong"}
+
+    return app
+
+
+def build_base_http_middleware_app():
+    """与改写前 app.add_request_id 相同的实现"""
+    app = build_plain_app()
+
+    @app.middleware("http")
+    async def add_request_id(request: Request, call_next):
+        request_id = str(uuid.uuid4())
+        token = request_id_var.set(request_id)
+        request.state.request_id = request_id
+        try:
+            start_time = time.time()
+            response = await call_next(request)
+            process_time = time.time() - start_time
+            logging.getLogger(__name__).info("Request completed: %.4fs", process_time)
+            response.headers["X-Request-ID"] = request_id
+            return response
+        finally:
+            request_id_var.reset(token)
+
+    return app
+
+
+def build_asgi_middleware_app():
+    app = build_plain_app()
+    app.add_middleware(RequestContextMiddleware)
+    return app
+
+
+async def run(app, requests):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/ping",
+        "raw_path": b"/ping",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    # 预热
+    for _ in range(200):
+        await app(dict(scope), receive, send)
+
+    start = time.perf_counter_ns()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter_ns() - start) / requests / 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000, help="每种中间件的请求次数")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    results = {
+        "none": asyncio.run(run(build_plain_app(), args.requests)),
+        "base_http_middleware": asyncio.run(run(build_base_http_middleware_app(), args.requests)),
+        "asgi_middleware": asyncio.run(run(build_asgi_middleware_app(), args.requests)),
+    }
+
+    print(f"requests={args.requests}")
+    for name, per_request in results.items():
+        overhead = per_request - results["none"]
+        print(f"{name:<22} {per_request:8.1f} us/request  overhead: {overhead:7.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+对比 GET /orders/ 默认响应路径与快速响应模式（FAST_JSON）的耗时。
+
+    python benchmarks/bench_serialization.py --rows 1000 --repeat 50
+
+1. serialization：只比较序列化本身
+   - default：ORM 对象 -> pydantic 校验 -> jsonable_encoder -> json.dumps（FastAPI response_model 的路径）
+   - fast：列查询得到的 dict -> orjson.dumps
+2. endpoint：通过 ASGI 调用完整的 GET /orders/（SQLite 内存数据库），分别关闭和打开 FAST_JSON
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import List
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi.encoders import jsonable_encoder
+from httpx import ASGITransport, AsyncClient
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import config
+from app import app
+from db import Base, get_read_session
+from models import Order, User
+from responses import dumps
+from routers.orders import OrderResponse
+
+
+def _timeit(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def bench_serialization(rows, repeat):
+    orders = [
+        Order(id=i, user_id=1, amount=float(i), status="pending", created_at=datetime.utcnow())
+        for i in range(1, rows + 1)
+    ]
+    order_rows = [
+        {"id": o.id, "user_id": o.user_id, "amount": o.amount, "status": o.status}
+        for o in orders
+    ]
+    adapter = TypeAdapter(List[OrderResponse])
+
+    def default_path():
+        validated = adapter.validate_python(orders, from_attributes=True)
+        json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+    def fast_path():
+        dumps(order_rows)
+
+    return {
+        "default": _timeit(default_path, repeat),
+        "fast": _timeit(fast_path, repeat),
+    }
+
+
+async def bench_endpoint(rows, repeat):
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with session_factory() as session:
+        session.add(User(id=1, username="bench", email="bench@example.com", hashed_password="x"))
+        session.add_all([Order(user_id=1, amount=float(i), status="pending") for i in range(rows)])
+        await session.commit()
+
+    async def _override_read_session():
+        async with session_factory() as session:
+            yield session
+
+    app.dependency_overrides[get_read_session] = _override_read_session
+    results = {}
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+            for mode, fast in (("default", False), ("fast", True)):
+                config.FAST_JSON = fast
+                await client.get("/orders/", params={"limit": rows})  # 预热
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    response = await client.get("/orders/", params={"limit": rows})
+                    assert response.status_code == 200
+                results[mode] = (time.perf_counter() - start) / repeat
+    finally:
+        app.dependency_overrides.clear()
+        await engine.dispose()
+    return results
+
+
+def _report(name, results):
+    speedup = results["default"] / results["fast"] if results["fast"] else float("inf")
+    print(f"{name:<14} default: {results['default'] * 1000:8.3f} ms  "
+          f"fast: {results['fast'] * 1000:8.3f} ms  speedup: {speedup:5.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000, help="每次响应的订单数量（不超过 1000）")
+    parser.add_argument("--repeat", type=int, default=50, help="每种模式的重复次数")
+    args = parser.parse_args()
+
+    print(f"rows={args.rows} repeat={args.repeat}")
+    _report("serialization", bench_serialization(args.rows, args.repeat))
+    _report("endpoint", asyncio.run(bench_endpoint(args.rows, args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+应用配置，全部从环境变量读取，未设置时使用本地开发的默认值。
+"""
+import os
+
+
+def _env_str(name, default=None):
+    value = os.getenv(name)
+    return default if value is None or value == "" else value
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return default if value is None or value == "" else int(value)
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return default if value is None or value == "" else float(value)
+
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_list(name):
+    value = os.getenv(name, "")
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def _cgroup_cpu_limit():
+    """容器的 CPU 配额（cgroup v2 的 cpu.max 或 v1 的 cfs_quota_us/cfs_period_us），未限制时返回 None"""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        if quota == "max":
+            return None
+        return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+    except (OSError, ValueError):
+        return None
+    return quota / period if quota > 0 and period > 0 else None
+
+
+def available_cpus():
+    """本进程实际可用的 CPU 数：CPU 亲和性（taskset/cpuset）与容器 CPU 配额中较小的一个，至少为 1。
+    os.cpu_count() 返回的是宿主机的核数，在限制了 CPU 的容器中会偏大"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # 非 Linux
+        cpus = os.cpu_count() or 1
+    limit = _cgroup_cpu_limit()
+    if limit is not None:
+        # 配额 1.5 个 CPU 时按 2 个计算
+        cpus = min(cpus, int(-(-limit // 1)))
+    return max(1, cpus)
+
+
+# 数据库连接：写库 URL 与可选的只读副本 URL 列表（逗号分隔，为空时读写共用主库）
+DATABASE_URL = _env_str("DATABASE_URL", "postgresql+asyncpg://localhost:5432/fastapi")
+DATABASE_READ_URLS = _env_list("DATABASE_READ_URLS")
+
+# 每个进程的 uvicorn worker 数，用于把数据库总连接数平均分配到各个 worker
+WEB_CONCURRENCY = _env_int("WEB_CONCURRENCY", 1)
+
+# 生产启动入口 server.py 的配置：uvicorn 或 gunicorn（管理 UvicornWorker）
+SERVER = _env_str("SERVER", "uvicorn")
+SERVER_HOST = _env_str("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = _env_int("SERVER_PORT", 5050)
+SERVER_BACKLOG = _env_int("SERVER_BACKLOG", 2048)
+# keep-alive 超时（秒），在负载均衡器后面时应大于负载均衡器的空闲超时，避免连接被服务端先关闭
+SERVER_KEEPALIVE = _env_int("SERVER_KEEPALIVE", 75)
+# 关闭或回收 worker 时等待处理中请求的秒数
+SERVER_GRACEFUL_TIMEOUT = _env_int("SERVER_GRACEFUL_TIMEOUT", 30)
+# gunicorn 判定 worker 卡死的秒数
+SERVER_WORKER_TIMEOUT = _env_int("SERVER_WORKER_TIMEOUT", 60)
+# 每个 worker 处理多少请求后回收（0 表示不回收），抖动只在 gunicorn 下生效
+SERVER_MAX_REQUESTS = _env_int("SERVER_MAX_REQUESTS", 0)
+SERVER_MAX_REQUESTS_JITTER = _env_int("SERVER_MAX_REQUESTS_JITTER", 0)
+SERVER_FORWARDED_ALLOW_IPS = _env_str("SERVER_FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+# 连接池配置
+# 如果设置了 DB_MAX_CONNECTIONS（数据库允许本服务使用的总连接数），
+# 则 pool_size 默认取 DB_MAX_CONNECTIONS // WEB_CONCURRENCY，避免多 worker 时把数据库连接打满
+DB_MAX_CONNECTIONS = _env_int("DB_MAX_CONNECTIONS", 0)
+DB_POOL_SIZE = _env_int(
+    "DB_POOL_SIZE",
+    max(1, DB_MAX_CONNECTIONS // max(1, WEB_CONCURRENCY)) if DB_MAX_CONNECTIONS else 5,
+)
+DB_MAX_OVERFLOW = _env_int("DB_MAX_OVERFLOW", 0 if DB_MAX_CONNECTIONS else 10)
+DB_POOL_TIMEOUT = _env_float("DB_POOL_TIMEOUT", 30.0)
+DB_POOL_RECYCLE = _env_int("DB_POOL_RECYCLE", 1800)
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", False)
+
+# 启动预热：每个引擎预先打开的连接数（0 表示不预开连接），
+# lifespan 等待第一轮预热的最长秒数，以及失败后后台重试的间隔
+WARMUP_CONNECTIONS = _env_int("WARMUP_CONNECTIONS", DB_POOL_SIZE)
+WARMUP_TIMEOUT = _env_float("WARMUP_TIMEOUT", 10.0)
+WARMUP_RETRY_INTERVAL = _env_float("WARMUP_RETRY_INTERVAL", 5.0)
+# 收到 SIGTERM 后先让 /ready 返回 503，延迟多少秒再开始关闭（0 表示立即关闭）；
+# 进行中请求的排空由服务器完成，见 SERVER_GRACEFUL_TIMEOUT
+SHUTDOWN_DRAIN_DELAY = _env_float("SHUTDOWN_DRAIN_DELAY", 0.0)
+
+# 准入控制：按路由的并发上限，如 "POST /orders/=20,GET /orders/{order_id}=100,*=200"，为空时不限制
+ADMISSION_LIMITS = _env_str("ADMISSION_LIMITS", "")
+# 每个路由的等待队列长度和最长等待秒数，超过时返回 503，Retry-After 为 ADMISSION_RETRY_AFTER 秒
+ADMISSION_QUEUE_SIZE = _env_int("ADMISSION_QUEUE_SIZE", 50)
+ADMISSION_QUEUE_TIMEOUT = _env_float("ADMISSION_QUEUE_TIMEOUT", 1.0)
+ADMISSION_RETRY_AFTER = _env_int("ADMISSION_RETRY_AFTER", 1)
+# 自适应上限的目标请求耗时（毫秒，0 表示固定上限）与上限的最小值
+ADMISSION_TARGET_LATENCY_MS = _env_float("ADMISSION_TARGET_LATENCY_MS", 0.0)
+ADMISSION_MIN_LIMIT = _env_int("ADMISSION_MIN_LIMIT", 1)
+# 不受准入控制的路径（健康检查和指标）
+ADMISSION_EXEMPT_PATHS = _env_list("ADMISSION_EXEMPT_PATHS") or ["/ping", "/ready", "/metrics"]
+
+# asyncpg 预编译语句缓存大小；通过 pgbouncer 的事务模式连接时需要设置为 0
+DB_STATEMENT_CACHE_SIZE = _env_int("DB_STATEMENT_CACHE_SIZE", 100)
+
+# 只读副本选择策略：round_robin 或 least_connections
+DB_READ_STRATEGY = _env_str("DB_READ_STRATEGY", "round_robin")
+# 写入后在该时间窗口内（秒）同一客户端的读请求走主库，保证 read-your-writes
+DB_READ_YOUR_WRITES_WINDOW = _env_float("DB_READ_YOUR_WRITES_WINDOW", 5.0)
+
+# 已知用户 ID 缓存，用于创建订单时跳过用户存在性检查
+USER_CACHE_SIZE = _env_int("USER_CACHE_SIZE", 10000)
+USER_CACHE_TTL = _env_float("USER_CACHE_TTL", 300.0)
+
+# GET /users/?include=orders 时每个用户最多返回的订单数，更多订单通过 GET /users/{user_id}/orders 分页获取
+ORDERS_PER_USER = _env_int("ORDERS_PER_USER", 100)
+# 创建订单时如何校验用户：lookup 先查询（带缓存），foreign_key 直接依赖 orders.user_id 外键约束
+ORDER_USER_CHECK = _env_str("ORDER_USER_CHECK", "lookup")
+
+# 合并提交：POST /orders/ 的订单进入后台队列，最多等待 ORDER_BATCH_MAX_WAIT_MS 毫秒或凑够
+# ORDER_BATCH_MAX_ITEMS 个后在一个事务中写入；队列长度超过 ORDER_BATCH_QUEUE_SIZE 时请求等待
+ORDER_BATCHING = _env_bool("ORDER_BATCHING", False)
+ORDER_BATCH_MAX_ITEMS = _env_int("ORDER_BATCH_MAX_ITEMS", 100)
+ORDER_BATCH_MAX_WAIT_MS = _env_float("ORDER_BATCH_MAX_WAIT_MS", 5.0)
+ORDER_BATCH_QUEUE_SIZE = _env_int("ORDER_BATCH_QUEUE_SIZE", 10000)
+
+# 订单统计是否读取预汇总表 order_daily_rollups（插入订单时在同一事务中增量更新）
+ORDER_STATS_ROLLUP = _env_bool("ORDER_STATS_ROLLUP", False)
+
+# CPU 密集型任务（如密码哈希）的执行器：process 或 thread，以及每个 worker 的执行器大小。
+# 总进程数是 WEB_CONCURRENCY × CPU_EXECUTOR_WORKERS，默认把 CPU 核数平均分给各个 worker
+CPU_EXECUTOR = _env_str("CPU_EXECUTOR", "process")
+CPU_EXECUTOR_WORKERS = _env_int("CPU_EXECUTOR_WORKERS", max(1, available_cpus() // max(1, WEB_CONCURRENCY)))
+
+# scrypt 密码哈希参数，n 越大越慢
+SCRYPT_N = _env_int("SCRYPT_N", 2 ** 14)
+SCRYPT_R = _env_int("SCRYPT_R", 8)
+SCRYPT_P = _env_int("SCRYPT_P", 1)
+
+# GET 响应缓存（进程内 LRU），TTL 同时限制了多 worker 之间缓存不一致的时间
+RESPONSE_CACHE_SIZE = _env_int("RESPONSE_CACHE_SIZE", 1024)
+RESPONSE_CACHE_TTL = _env_float("RESPONSE_CACHE_TTL", 30.0)
+
+# 快速响应模式：列表接口只查询需要的列并直接用 orjson 序列化，跳过 pydantic 校验
+FAST_JSON = _env_bool("FAST_JSON", False)
+
+# 日志：异步模式下日志写入有界队列，由后台线程批量写出，避免 stdout 阻塞事件循环
+LOG_ASYNC = _env_bool("LOG_ASYNC", True)
+LOG_QUEUE_SIZE = _env_int("LOG_QUEUE_SIZE", 10000)
+# 队列满时的策略：drop 丢弃并计数，block 阻塞等待
+LOG_QUEUE_POLICY = _env_str("LOG_QUEUE_POLICY", "drop")
+LOG_BATCH_SIZE = _env_int("LOG_BATCH_SIZE", 256)
+# 日志格式：text 或 json
+LOG_FORMAT = _env_str("LOG_FORMAT", "text")
+# 日志采样率，如 "/ping=0.01,sqlalchemy.engine=0.1"；WARNING 及以上级别不受采样影响
+LOG_SAMPLE_RATES = _env_str("LOG_SAMPLE_RATES", "")
+
+# 多 worker 指标汇总目录，为空时 /metrics 只返回当前 worker 的指标
+METRICS_DIR = _env_str("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = _env_float("METRICS_FLUSH_INTERVAL", 5.0)
+
+# 按请求的 SQL 分析（开发/预发环境使用）：响应头返回查询次数与耗时，并检测 N+1 查询
+QUERY_PROFILING = _env_bool("QUERY_PROFILING", False)
+QUERY_PROFILE_HISTORY = _env_int("QUERY_PROFILE_HISTORY", 100)
+# 同一形态的语句在一个请求中执行达到该次数时视为疑似 N+1
+QUERY_N_PLUS_ONE_THRESHOLD = _env_int("QUERY_N_PLUS_ONE_THRESHOLD", 5)
+
+# 事件循环延迟监控：采样间隔（秒，0 表示关闭）和保留的样本数
+LOOP_MONITOR_INTERVAL = _env_float("LOOP_MONITOR_INTERVAL", 0.1)
+LOOP_LAG_HISTORY = _env_int("LOOP_LAG_HISTORY", 3000)
+# 单个回调执行超过该毫秒数时记录警告，0 表示关闭慢回调检测
+LOOP_SLOW_CALLBACK_MS = _env_float("LOOP_SLOW_CALLBACK_MS", 0.0)
@@ -1,14 +1,82 @@
+import atexit
 import contextvars
+import json
 import logging
+import queue
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+import config
 
 # 创建请求ID的上下文变量
 request_id_var = contextvars.ContextVar("request_id", default="undefined")
+# 当前请求的方法和路径，供结构化日志和采样使用
+request_method_var = contextvars.ContextVar("request_method", default=None)
+request_path_var = contextvars.ContextVar("request_path", default=None)
+# 当前请求的 INFO 及以下级别日志是否被采样保留
+log_sampled_var = contextvars.ContextVar("log_sampled", default=True)
+
+# 当前上下文中最近开始的请求 (request_id, method, path)，请求结束时不重置。
+# 请求可能在一次回调内开始并结束，结束时上面的上下文变量已被重置，事件循环监控用它找到阻塞回调所属的请求；
+# 每个请求在自己的任务上下文中设置，并发请求之间互不覆盖
+last_request_var = contextvars.ContextVar("last_request", default=None)
 
 # 创建过滤器来添加 request_id
 class RequestIdFilter(logging.Filter):
     def filter(self, record):
         # 始终设置 request_id 属性，无论是否已存在
         record.request_id = request_id_var.get()
+        record.method = request_method_var.get()
+        record.path = request_path_var.get()
+        return True
+
+def parse_sample_rates(value):
+    """解析 "/ping=0.01,sqlalchemy.engine=0.1" 形式的采样率配置"""
+    rates = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        key, rate = item.split("=", 1)
+        rates[key.strip()] = float(rate)
+    return rates
+
+# 采样配置：以 / 开头的键按请求路径采样（以 * 结尾表示前缀匹配），其余按 logger 名称采样
+_route_sample_rates = {}
+_logger_sample_rates = {}
+
+def configure_sampling(rates):
+    _route_sample_rates.clear()
+    _logger_sample_rates.clear()
+    for key, rate in rates.items():
+        if key.startswith("/"):
+            _route_sample_rates[key] = rate
+        else:
+            _logger_sample_rates[key] = rate
+
+def sample_request(path):
+    """在请求开始时决定该请求的日志是否保留，同一请求的日志要么全部保留要么全部丢弃"""
+    rate = _route_sample_rates.get(path)
+    if rate is None:
+        for key, prefix_rate in _route_sample_rates.items():
+            if key.endswith("*") and path.startswith(key[:-1]):
+                rate = prefix_rate
+                break
+    return rate is None or random.random() < rate
+
+# 采样过滤器：WARNING 及以上级别始终保留
+class SamplingFilter(logging.Filter):
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        if not log_sampled_var.get():
+            return False
+        if _logger_sample_rates:
+            name = record.name
+            while name:
+                rate = _logger_sample_rates.get(name)
+                if rate is not None:
+                    return random.random() < rate
+                name = name.rpartition(".")[0]
         return True
 
 # 自定义 Formatter 来处理 request_id
@@ -19,57 +87,225 @@ class RequestIdFormatter(logging.Formatter):
             record.request_id = request_id_var.get()
         return super().format(record)
 
+# 结构化 JSON 日志，每条记录输出一行 JSON
+class JsonFormatter(logging.Formatter):
+    # 通过 extra 传入的请求字段
+    extra_fields = ("duration", "status")
+
+    def format(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = request_id_var.get()
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": record.request_id,
+        }
+        if getattr(record, "method", None):
+            entry["method"] = record.method
+            entry["path"] = record.path
+        for field in self.extra_fields:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+# 非阻塞的 QueueHandler：事件循环线程只负责入队，格式化和写 stdout 都在后台线程完成
+class AsyncQueueHandler(QueueHandler):
+    def __init__(self, log_queue, block=False):
+        super().__init__(log_queue)
+        self.block = block
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 只合并 msg % args 固定消息内容（参数对象之后可能被修改），
+        # 时间戳、格式化等工作留给后台线程；request_id 已由过滤器在当前上下文中写入
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        if self.block:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # 队列已满时丢弃，绝不阻塞事件循环
+            self.dropped += 1
+
+# 批量写入的 StreamHandler：一批记录只写一次、flush 一次
+class BatchStreamHandler(logging.StreamHandler):
+    def emit_batch(self, records):
+        lines = []
+        for record in records:
+            if record.levelno < self.level or not self.filter(record):
+                continue
+            try:
+                lines.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+        if not lines:
+            return
+        self.acquire()
+        try:
+            self.stream.write(self.terminator.join(lines) + self.terminator)
+            self.flush()
+        finally:
+            self.release()
+
+# 后台线程一次取出队列中已有的多条记录，交给 BatchStreamHandler 批量写入
+class BatchingQueueListener(QueueListener):
+    def __init__(self, log_queue, *handlers, batch_size=256):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.batch_size = batch_size
+
+    def enqueue_sentinel(self):
+        # 有界队列可能已满，结束标记必须阻塞入队
+        self.queue.put(self._sentinel)
+
+    def _monitor(self):
+        log_queue = self.queue
+        has_task_done = hasattr(log_queue, 'task_done')
+        stopping = False
+        while not stopping:
+            batch = [log_queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(log_queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = []
+            for record in batch:
+                if record is self._sentinel:
+                    stopping = True
+                else:
+                    records.append(record)
+            if records:
+                for handler in self.handlers:
+                    if isinstance(handler, BatchStreamHandler):
+                        handler.emit_batch(records)
+                        continue
+                    for record in records:
+                        if record.levelno >= handler.level:
+                            handler.handle(record)
+            if has_task_done:
+                for _ in batch:
+                    log_queue.task_done()
+
+# 当前生效的异步日志组件
+_queue_handler = None
+_listener = None
+
+def stop_logging():
+    """停止后台日志线程并写出队列中剩余的记录"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(stop_logging)
+
+def get_logging_stats():
+    """返回异步日志队列的状态，包括因队列已满被丢弃的记录数"""
+    if _queue_handler is None:
+        return {"async": False, "queued": 0, "dropped": 0}
+    return {
+        "async": True,
+        "queued": _queue_handler.queue.qsize(),
+        "dropped": _queue_handler.dropped,
+    }
+
 # 初始化日志配置
-def setup_logging(sql_echo=False):
-    # 清除所有已存在的处理器
+def setup_logging(sql_echo=False, async_logging=None, queue_size=None, block=None, batch_size=None,
+                  log_format=None, sample_rates=None):
+    global _queue_handler, _listener
+    if log_format is None:
+        log_format = config.LOG_FORMAT
+    if sample_rates is None:
+        sample_rates = parse_sample_rates(config.LOG_SAMPLE_RATES)
+    if async_logging is None:
+        async_logging = config.LOG_ASYNC
+    if queue_size is None:
+        queue_size = config.LOG_QUEUE_SIZE
+    if block is None:
+        block = config.LOG_QUEUE_POLICY == "block"
+    if batch_size is None:
+        batch_size = config.LOG_BATCH_SIZE
+
+    # 清除所有已存在的处理器，并停止之前的后台日志线程
     root_logger = logging.getLogger()
     for handler in root_logger.handlers[:]:
         root_logger.removeHandler(handler)
-        
+    stop_logging()
+    _queue_handler = None
+
     # 创建处理器
-    console_handler = logging.StreamHandler()
-    
+    console_handler = BatchStreamHandler()
+
     # 创建格式化器
-    formatter = RequestIdFormatter(
-        '%(asctime)s - %(levelname)s - [%(request_id)s] - %(name)s - %(message)s'
-    )
+    if log_format == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = RequestIdFormatter(
+            '%(asctime)s - %(levelname)s - [%(request_id)s] - %(name)s - %(message)s'
+        )
     console_handler.setFormatter(formatter)
-    
-    # 添加过滤器到处理器
+
     request_id_filter = RequestIdFilter()
-    console_handler.addFilter(request_id_filter)
-    
+    configure_sampling(sample_rates)
+    sampling_filter = SamplingFilter()
+
+    # 异步模式下日志先进入有界队列，由后台线程批量写出
+    if async_logging:
+        _queue_handler = AsyncQueueHandler(queue.Queue(maxsize=queue_size), block=block)
+        # request_id 必须在调用方的上下文中读取，所以过滤器挂在入队的处理器上，
+        # 不能挂在后台线程的处理器上（后台线程中读到的永远是默认值）
+        _queue_handler.addFilter(sampling_filter)
+        _queue_handler.addFilter(request_id_filter)
+        _listener = BatchingQueueListener(_queue_handler.queue, console_handler, batch_size=batch_size)
+        _listener.start()
+        log_handler = _queue_handler
+    else:
+        # 添加过滤器到处理器
+        console_handler.addFilter(sampling_filter)
+        console_handler.addFilter(request_id_filter)
+        log_handler = console_handler
+
     # 设置根日志记录器
     root_logger.setLevel(logging.INFO)
-    root_logger.addHandler(console_handler)
-    
+    root_logger.addHandler(log_handler)
+
     # 确保我们的过滤器在根日志记录器上
     if not any(isinstance(f, RequestIdFilter) for f in root_logger.filters):
         root_logger.addFilter(request_id_filter)
-    
+
     # 配置 SQLAlchemy 日志
     sqlalchemy_logger = logging.getLogger('sqlalchemy.engine')
-    
+
     # 根据配置设置 SQLAlchemy 日志级别
     if sql_echo:
         sqlalchemy_logger.setLevel(logging.INFO)
     else:
         sqlalchemy_logger.setLevel(logging.WARNING)  # 只显示警告及以上级别
-    
+
     # 停止 SQLAlchemy 日志向上传播，避免重复
     sqlalchemy_logger.propagate = False
-    
+
     # 清除现有处理器并添加新的处理器
     sqlalchemy_logger.handlers = []
-    sqlalchemy_logger.addHandler(console_handler)
+    sqlalchemy_logger.addHandler(log_handler)
     sqlalchemy_logger.addFilter(request_id_filter)
-    
+
     # # 禁用其他库的过多日志
     # logging.getLogger('uvicorn.access').setLevel(logging.WARNING)
     # uvicorn_logger = logging.getLogger('uvicorn.error')
     # uvicorn_logger.handlers = []
     # uvicorn_logger.addHandler(console_handler)
     # uvicorn_logger.propagate = False
-    
+
     # 返回根日志记录器以便可以在其他地方使用
-    return root_logger 
\ No newline at end of file
+    return root_logger
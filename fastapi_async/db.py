@@ -1,13 +1,186 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+import itertools
+import time
+from fastapi import Depends, Request, Response
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+import config
 
-DATABASE_URL = "postgresql+asyncpg://localhost:5432/fastapi"
+DATABASE_URL = config.DATABASE_URL
+
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """记录连接签出等待时间的连接池，用于发现连接池饥饿"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_count = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.wait_count += 1
+            self.wait_time_total += elapsed
+            if elapsed > self.wait_time_max:
+                self.wait_time_max = elapsed
+
+
+def create_engine_from_settings(url: str, **overrides) -> AsyncEngine:
+    """根据 config 中的连接池配置创建异步引擎"""
+    url = make_url(url)
+    # echo=False 禁用 SQLAlchemy 的内置日志，我们使用自定义日志处理
+    kwargs = {"echo": False}
+
+    # SQLite 使用自己的连接池实现，不支持 QueuePool 的参数
+    if url.get_backend_name() != "sqlite":
+        kwargs.update(
+            poolclass=InstrumentedAsyncPool,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pool_recycle=config.DB_POOL_RECYCLE,
+            pool_pre_ping=config.DB_POOL_PRE_PING,
+        )
+
+    if url.get_driver_name() == "asyncpg":
+        url = url.update_query_dict(
+            {"prepared_statement_cache_size": str(config.DB_STATEMENT_CACHE_SIZE)}
+        )
+
+    kwargs.update(overrides)
+    return create_async_engine(url, **kwargs)
+
+
+def pool_status(engine: AsyncEngine) -> dict:
+    """返回连接池的实时状态"""
+    pool = engine.sync_engine.pool
+    if not isinstance(pool, AsyncAdaptedQueuePool):
+        return {"pool": type(pool).__name__}
+
+    status = {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        # overflow() 在连接池未满时为负数
+        "overflow": max(0, pool.overflow()),
+    }
+    if isinstance(pool, InstrumentedAsyncPool):
+        status.update(
+            wait_count=pool.wait_count,
+            wait_time_total=round(pool.wait_time_total, 6),
+            wait_time_avg=round(pool.wait_time_total / pool.wait_count, 6) if pool.wait_count else 0.0,
+            wait_time_max=round(pool.wait_time_max, 6),
+            timeouts=pool.timeouts,
+        )
+    return status
+
+
+engine = create_engine_from_settings(config.DATABASE_URL)
+# 未配置只读副本时，读请求与写请求共用主库引擎
+read_engines = [create_engine_from_settings(url) for url in config.DATABASE_READ_URLS] or [engine]
 
-# echo=False 禁用 SQLAlchemy 的内置日志，我们使用自定义日志处理
-engine = create_async_engine(DATABASE_URL, echo=False)
 async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+read_session_factories = [
+    async_session if read_engine is engine
+    else sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+    for read_engine in read_engines
+]
 Base = declarative_base()
 
-async def get_session():
+# 写入后把客户端固定到主库的 cookie，值为截止时间戳
+READ_PRIMARY_COOKIE = "read_primary_until"
+
+_read_counter = itertools.count()
+
+
+def get_pool_metrics() -> dict:
+    """返回主库与只读副本连接池的实时状态"""
+    return {
+        "write": pool_status(engine),
+        "read": [pool_status(read_engine) for read_engine in read_engines if read_engine is not engine],
+    }
+
+
+async def dispose_engines() -> None:
+    """关闭主库与只读副本的连接池，在 lifespan 关闭时调用"""
+    for pool_engine in {engine, *read_engines}:
+        await pool_engine.dispose()
+
+
+def has_read_replicas() -> bool:
+    return read_engines[0] is not engine
+
+
+def reads_pinned_to_primary(request: Request) -> bool:
+    """配置了只读副本且客户端刚写入过（read_primary_until 未过期）时，读请求需要走主库"""
+    if not has_read_replicas():
+        return False
+    try:
+        pinned_until = float(request.cookies.get(READ_PRIMARY_COOKIE, 0))
+    except ValueError:
+        pinned_until = 0
+    return pinned_until > time.time()
+
+
+def choose_read_session_factory(request: Request):
+    """为读请求选择会话工厂：刚写入过的客户端走主库，否则按策略选择只读副本"""
+    if not has_read_replicas() or reads_pinned_to_primary(request):
+        return async_session
+
+    if config.DB_READ_STRATEGY == "least_connections":
+        index = min(
+            range(len(read_engines)),
+            key=lambda i: read_engines[i].sync_engine.pool.checkedout(),
+        )
+    else:
+        index = next(_read_counter) % len(read_engines)
+    return read_session_factories[index]
+
+
+def pin_reads_to_primary(response: Response) -> None:
+    """设置 read_primary_until cookie，客户端在 DB_READ_YOUR_WRITES_WINDOW 秒内的读请求走主库"""
+    if not has_read_replicas():
+        return
+    window = config.DB_READ_YOUR_WRITES_WINDOW
+    response.set_cookie(
+        READ_PRIMARY_COOKIE,
+        str(time.time() + window),
+        max_age=int(window) + 1,
+        httponly=True,
+    )
+
+
+async def get_session(response: Response):
     async with async_session() as session:
-        yield session 
\ No newline at end of file
+        if has_read_replicas():
+            # 提交成功后通知客户端短时间内从主库读取，避免副本延迟导致读不到刚写入的数据
+            event.listen(session.sync_session, "after_commit", lambda sync_session: pin_reads_to_primary(response))
+        yield session
+
+
+def get_read_session_factory(request: Request):
+    """返回只读会话工厂，用法同 get_session_factory；FastAPI 在同一请求内缓存依赖结果，每个请求只选择一次副本"""
+    return choose_read_session_factory(request)
+
+
+async def get_read_session(session_factory=Depends(get_read_session_factory)):
+    """只读会话依赖，路由到只读副本；与 get_read_session_factory 共用同一次副本选择"""
+    async with session_factory() as session:
+        yield session
+
+
+def get_session_factory():
+    """返回会话工厂，供需要在依赖生命周期之外自行管理会话的场景（如流式响应）使用"""
+    return async_session
@@ -0,0 +1,99 @@
+"""
+CPU 密集型任务的执行器。
+
+每个 worker 一个进程池（或线程池），在 lifespan 中启动和关闭；未启动时（如测试中）第一次使用时创建。
+任务通过 run_cpu_bound 提交，事件循环只等待结果，不会被阻塞。
+进程池适合纯 Python 计算；哈希等会释放 GIL 的 C 扩展调用也可以使用线程池，省去进程间传参的开销。
+"""
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+import config
+import metrics
+
+# 获取 logger
+logger = logging.getLogger(__name__)
+
+_executor: Optional[Executor] = None
+_workers = 0
+# 已提交但尚未完成的任务数（包括正在执行的）
+_in_flight = 0
+
+executor_tasks_total = metrics.Counter("executor_tasks_total", "Tasks submitted to the CPU executor")
+executor_tasks_in_flight = metrics.Gauge("executor_tasks_in_flight", "CPU executor tasks queued or running")
+executor_queue_depth = metrics.Gauge("executor_queue_depth", "CPU executor tasks waiting for a free worker")
+executor_task_duration_seconds = metrics.Histogram(
+    "executor_task_duration_seconds", "CPU executor task latency including queue wait",
+)
+
+
+def start(kind: Optional[str] = None, workers: Optional[int] = None) -> Executor:
+    """创建执行器，已创建时直接返回"""
+    global _executor, _workers
+    if _executor is not None:
+        return _executor
+    kind = kind or config.CPU_EXECUTOR
+    _workers = workers or config.CPU_EXECUTOR_WORKERS
+    if kind == "thread":
+        _executor = ThreadPoolExecutor(max_workers=_workers, thread_name_prefix="cpu")
+    else:
+        # 事件循环进程中有日志线程等后台线程，fork 可能复制到被其他线程持有的锁，所以使用 spawn
+        _executor = ProcessPoolExecutor(max_workers=_workers, mp_context=multiprocessing.get_context("spawn"))
+    logger.info("Started %s CPU executor with %s workers", kind, _workers)
+    return _executor
+
+
+async def stop() -> None:
+    """关闭执行器，等待正在执行的任务完成，取消排队中的任务"""
+    global _executor
+    if _executor is None:
+        return
+    executor, _executor = _executor, None
+    # shutdown 会阻塞到所有任务结束，放到线程中执行
+    await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+    logger.info("Stopped CPU executor")
+
+
+async def warm_up() -> None:
+    """提交与 worker 数相同的空任务，让进程池提前启动所有子进程"""
+    executor = start()
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(executor, os.getpid) for _ in range(_workers)))
+
+
+async def run_cpu_bound(func, *args, **kwargs):
+    """在执行器中运行 func(*args, **kwargs)；使用进程池时 func 和参数必须可以 pickle"""
+    global _in_flight
+    executor = start()
+    executor_tasks_total.inc()
+    _in_flight += 1
+    start_time = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(func, *args, **kwargs))
+    finally:
+        _in_flight -= 1
+        executor_task_duration_seconds.observe(time.perf_counter() - start_time)
+
+
+def get_executor_stats() -> dict:
+    return {
+        "started": _executor is not None,
+        "kind": type(_executor).__name__ if _executor is not None else None,
+        "workers": _workers,
+        "in_flight": _in_flight,
+        "queue_depth": max(0, _in_flight - _workers),
+    }
+
+
+def _collect_executor_metrics():
+    stats = get_executor_stats()
+    executor_tasks_in_flight.set(stats["in_flight"])
+    executor_queue_depth.set(stats["queue_depth"])
+
+
+metrics.add_collector(_collect_executor_metrics)
@@ -0,0 +1,166 @@
+"""
+事件循环延迟监控与慢回调检测。
+
+后台任务按固定间隔 sleep，用实际唤醒时间与计划唤醒时间之差衡量事件循环延迟：
+任何阻塞事件循环的同步调用（CPU 计算、同步 IO、阻塞的日志写入）都会推迟唤醒。
+
+慢回调检测（LOOP_SLOW_CALLBACK_MS，默认关闭）通过包装 asyncio.Handle._run 实现，
+每个回调只多两次计时；执行超过阈值时才读取该回调的 contextvars 上下文，
+记录警告，日志带有触发它的请求的 request_id 和路由。
+uvloop 的 Handle 是 C 实现，无法包装，此时只有延迟监控生效。
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from context import request_id_var, request_method_var, request_path_var, last_request_var
+import config
+import metrics
+
+# 获取 logger
+logger = logging.getLogger(__name__)
+
+event_loop_lag_seconds = metrics.Histogram(
+    "event_loop_lag_seconds", "Event loop wakeup delay",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+event_loop_slow_callbacks_total = metrics.Counter(
+    "event_loop_slow_callbacks_total", "Event loop callbacks that ran longer than the slow callback threshold",
+)
+
+# 最近的延迟样本（秒）与慢回调记录
+_lag_samples = deque(maxlen=config.LOOP_LAG_HISTORY)
+_slow_callbacks = deque(maxlen=100)
+_monitor_task = None
+_original_run = None
+
+
+def _describe_callback(handle) -> str:
+    callback = handle._callback
+    task = getattr(callback, "__self__", None)
+    if isinstance(task, asyncio.Task):
+        coro = task.get_coro()
+        return f"Task {task.get_name()} {getattr(coro, '__qualname__', coro)}"
+    return getattr(callback, "__qualname__", repr(callback))
+
+
+def _record_slow_callback(handle, duration):
+    event_loop_slow_callbacks_total.inc()
+    ctx = handle._context
+    request = (ctx.get(request_id_var, None), ctx.get(request_method_var, None), ctx.get(request_path_var, None))
+    if request[0] is None:
+        # 回调结束时请求已处理完并重置了上下文变量，取该上下文中最近开始的请求
+        request = ctx.get(last_request_var, None) or request
+    request_id, method, path = request
+    entry = {
+        "duration_ms": round(duration * 1000, 3),
+        "callback": _describe_callback(handle),
+        "request_id": request_id,
+        "method": method,
+        "path": path,
+        "timestamp": time.time(),
+    }
+    _slow_callbacks.append(entry)
+    # 回调已经结束，临时设置上下文变量，使日志带上所属请求的 request_id 和路由
+    tokens = [(var, var.set(value)) for var, value in
+              ((request_id_var, request_id), (request_method_var, method), (request_path_var, path))
+              if value is not None]
+    try:
+        logger.warning("Slow callback took %.1f ms in %s %s: %s", entry["duration_ms"], method, path, entry["callback"])
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def _install_slow_callback_hook(threshold):
+    global _original_run
+    if _original_run is not None:
+        return
+    original_run = asyncio.events.Handle._run
+
+    def _timed_run(self):
+        # 热路径上只计时，超过阈值后才读取上下文
+        start = time.perf_counter()
+        original_run(self)
+        duration = time.perf_counter() - start
+        if duration >= threshold:
+            try:
+                _record_slow_callback(self, duration)
+            except Exception:
+                logger.exception("Failed to record slow callback")
+
+    asyncio.events.Handle._run = _timed_run
+    _original_run = original_run
+
+
+def _uninstall_slow_callback_hook():
+    global _original_run
+    if _original_run is not None:
+        asyncio.events.Handle._run = _original_run
+        _original_run = None
+
+
+async def _monitor_loop(interval):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - expected)
+        _lag_samples.append(lag)
+        event_loop_lag_seconds.observe(lag)
+
+
+def start():
+    """在 lifespan 启动时调用；LOOP_MONITOR_INTERVAL 为 0 时不启动"""
+    global _monitor_task
+    if config.LOOP_MONITOR_INTERVAL <= 0 or _monitor_task is not None:
+        return
+    _monitor_task = asyncio.create_task(_monitor_loop(config.LOOP_MONITOR_INTERVAL))
+    if config.LOOP_SLOW_CALLBACK_MS > 0:
+        if isinstance(asyncio.get_running_loop(), asyncio.BaseEventLoop):
+            _install_slow_callback_hook(config.LOOP_SLOW_CALLBACK_MS / 1000)
+        else:
+            logger.warning("Slow callback detection is not supported on %s", type(asyncio.get_running_loop()).__name__)
+
+
+async def stop():
+    global _monitor_task
+    _uninstall_slow_callback_hook()
+    if _monitor_task is not None:
+        _monitor_task.cancel()
+        try:
+            await _monitor_task
+        except asyncio.CancelledError:
+            pass
+        _monitor_task = None
+
+
+def _percentile(sorted_values, q):
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def get_loop_stats() -> dict:
+    samples = sorted(_lag_samples)
+    lag_ms = {}
+    if samples:
+        lag_ms = {
+            "p50": round(_percentile(samples, 50) * 1000, 3),
+            "p90": round(_percentile(samples, 90) * 1000, 3),
+            "p99": round(_percentile(samples, 99) * 1000, 3),
+            "max": round(samples[-1] * 1000, 3),
+        }
+    return {
+        "running": _monitor_task is not None,
+        "interval_ms": config.LOOP_MONITOR_INTERVAL * 1000,
+        "samples": len(samples),
+        "lag_ms": lag_ms,
+        "slow_callback_threshold_ms": config.LOOP_SLOW_CALLBACK_MS,
+        "slow_callback_detection": _original_run is not None,
+        "slow_callbacks": list(reversed(_slow_callbacks)),
+    }
+
+
+def clear():
+    _lag_samples.clear()
+    _slow_callbacks.clear()
@@ -0,0 +1,485 @@
+"""
+Prometheus 文本格式的进程内指标。
+
+指标只在事件循环线程中更新，普通的 dict/list 操作即可，不需要加锁。
+多 worker 部署时设置 METRICS_DIR，每个 worker 定期把自己的快照写入该目录，
+GET /metrics 读取所有快照并汇总，因此任意 worker 返回的都是全部 worker 的合计。
+快照文件名包含 pid 和进程启动时间，pid 被复用时不会覆盖已退出 worker 的快照；
+已退出 worker 的计数器和直方图合并进 metrics_archive.json 后删除其快照，合计值不会回退，文件数也不会无限增长。
+"""
+import asyncio
+import bisect
+import contextvars
+import json
+import logging
+import os
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import config
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# 获取 logger
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = {}
+_collectors = []
+# 每条 SQL 执行完成后调用的回调 (statement, elapsed)，如按请求的 SQL 分析
+_query_listeners = []
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry[name] = self
+
+    def clear(self):
+        self._values.clear()
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def set(self, value, *labels):
+        """同步外部维护的累计值（如连接池的等待时间合计），值只能增加"""
+        self._values[labels] = value
+
+    def get(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        if not self._values and not self.labelnames:
+            return [[[], 0]]
+        return [[list(labels), value] for labels, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value, *labels):
+        self._values[labels] = value
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def get(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        if not self._values and not self.labelnames:
+            return [[[], 0]]
+        return [[list(labels), value] for labels, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        state = self._values.get(labels)
+        if state is None:
+            # 每个桶单独计数（非累积），最后一个为 +Inf；之后依次是 sum 和 count
+            state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def get(self, *labels):
+        state = self._values.get(labels)
+        return (state[2], state[1]) if state else (0, 0.0)
+
+    def samples(self):
+        if not self._values and not self.labelnames:
+            return [[[], [0] * (len(self.buckets) + 1), 0.0, 0]]
+        return [[list(labels), state[0], state[1], state[2]] for labels, state in self._values.items()]
+
+
+def add_collector(callback):
+    """注册在导出前调用的回调，用于刷新连接池等按需读取的 Gauge"""
+    _collectors.append(callback)
+
+
+def add_query_listener(callback):
+    """注册每条 SQL 执行完成后调用的回调，与指标共用 instrument_engine 注册的一组游标事件"""
+    _query_listeners.append(callback)
+
+
+def _collect():
+    for callback in _collectors:
+        try:
+            callback()
+        except Exception:
+            logger.exception("Metrics collector failed")
+
+
+def snapshot():
+    """返回当前进程所有指标的快照"""
+    _collect()
+    return {
+        "pid": os.getpid(),
+        "metrics": {
+            name: {
+                "type": metric.type,
+                "help": metric.documentation,
+                "labelnames": list(metric.labelnames),
+                "buckets": list(getattr(metric, "buckets", ())),
+                "samples": metric.samples(),
+            }
+            for name, metric in _registry.items()
+        },
+    }
+
+
+# 本进程的启动时间，与 pid 一起组成快照文件名
+_process_started = time.time_ns()
+ARCHIVE_FILENAME = "metrics_archive.json"
+
+
+def _reset_process_started():
+    global _process_started
+    _process_started = time.time_ns()
+
+
+# fork 出的子进程（如 gunicorn worker）使用自己的启动时间
+os.register_at_fork(after_in_child=_reset_process_started)
+
+
+def _snapshot_path(pid, started=None):
+    started = _process_started if started is None else started
+    return os.path.join(config.METRICS_DIR, f"metrics_{pid}_{started}.json")
+
+
+def _parse_snapshot_filename(filename):
+    """返回 (pid, started)，不是 worker 快照文件时返回 None"""
+    if not filename.startswith("metrics_") or not filename.endswith(".json"):
+        return None
+    try:
+        pid, started = filename[len("metrics_"):-len(".json")].split("_")
+        return int(pid), int(started)
+    except ValueError:
+        return None
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_snapshot():
+    """把当前进程的快照原子写入 METRICS_DIR"""
+    if not config.METRICS_DIR:
+        return
+    os.makedirs(config.METRICS_DIR, exist_ok=True)
+    _write_json(_snapshot_path(os.getpid()), snapshot())
+
+
+def clear_snapshots(directory=None):
+    """删除目录中的所有快照和归档，由启动入口在拉起 worker 前调用"""
+    directory = directory or config.METRICS_DIR
+    if not directory or not os.path.isdir(directory):
+        return
+    for filename in os.listdir(directory):
+        if filename.startswith("metrics_") and (filename.endswith(".json") or filename.endswith(".tmp")):
+            try:
+                os.remove(os.path.join(directory, filename))
+            except FileNotFoundError:
+                pass
+
+
+def _pid_alive(pid):
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _to_snapshot(merged):
+    """把 aggregate 的结果转换回快照格式（不含 Gauge），用于写入归档"""
+    return {"pid": None, "metrics": {
+        name: {
+            "type": data["type"],
+            "help": data["help"],
+            "labelnames": data["labelnames"],
+            "buckets": data["buckets"],
+            "samples": [
+                [list(labels), *value] if data["type"] == "histogram" else [list(labels), value]
+                for labels, value in data["values"].items()
+            ],
+        }
+        for name, data in merged.items() if data["type"] != "gauge"
+    }}
+
+
+def _archive_dead_snapshots(directory):
+    """把已退出 worker 的快照合并进归档文件并删除；同一 pid 有更新的快照时旧快照也视为已退出"""
+    files = {}
+    for filename in os.listdir(directory):
+        parsed = _parse_snapshot_filename(filename)
+        if parsed is not None:
+            files[filename] = parsed
+    latest = {}
+    for pid, started in files.values():
+        latest[pid] = max(started, latest.get(pid, started))
+    dead = [filename for filename, (pid, started) in files.items()
+            if started < latest[pid] or not _pid_alive(pid)]
+    if not dead:
+        return
+
+    lock = open(os.path.join(directory, ".metrics.lock"), "w")
+    try:
+        if fcntl is not None:
+            # 多个 worker 可能同时归档，加锁避免同一个快照被合并两次
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        archive_path = os.path.join(directory, ARCHIVE_FILENAME)
+        snapshots = [snap for snap in [_read_json(archive_path)] if snap is not None]
+        archived = []
+        for filename in dead:
+            snap = _read_json(os.path.join(directory, filename))
+            if snap is not None:
+                snapshots.append(snap)
+                archived.append(filename)
+        if not archived:
+            return
+        _write_json(archive_path, _to_snapshot(aggregate(snapshots)))
+        for filename in archived:
+            os.remove(os.path.join(directory, filename))
+        logger.info("Archived metrics snapshots of %s exited workers", len(archived))
+    finally:
+        lock.close()
+
+
+def _load_snapshots():
+    """读取所有 worker 的快照和归档，当前进程使用实时数据"""
+    snapshots = [snapshot()]
+    if not config.METRICS_DIR or not os.path.isdir(config.METRICS_DIR):
+        return snapshots
+    try:
+        _archive_dead_snapshots(config.METRICS_DIR)
+    except OSError:
+        logger.exception("Failed to archive metrics snapshots")
+    own = os.path.basename(_snapshot_path(os.getpid()))
+    for filename in os.listdir(config.METRICS_DIR):
+        if filename == own or (filename != ARCHIVE_FILENAME and _parse_snapshot_filename(filename) is None):
+            continue
+        snap = _read_json(os.path.join(config.METRICS_DIR, filename))
+        if snap is not None:
+            snapshots.append(snap)
+    return snapshots
+
+
+def aggregate(snapshots):
+    """汇总多个进程的快照：计数器和直方图求和，Gauge 只汇总仍存活的进程"""
+    merged = {}
+    for snap in snapshots:
+        alive = snap["pid"] == os.getpid() or _pid_alive(snap["pid"])
+        for name, data in snap["metrics"].items():
+            if data["type"] == "gauge" and not alive:
+                continue
+            target = merged.setdefault(name, {**data, "values": {}})
+            values = target["values"]
+            for sample in data["samples"]:
+                labels = tuple(sample[0])
+                if data["type"] == "histogram":
+                    state = values.setdefault(labels, [[0] * len(sample[1]), 0.0, 0])
+                    state[0] = [a + b for a, b in zip(state[0], sample[1])]
+                    state[1] += sample[2]
+                    state[2] += sample[3]
+                else:
+                    values[labels] = values.get(labels, 0) + sample[1]
+    return merged
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, labels, extra=()):
+    pairs = list(zip(labelnames, labels)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """以 Prometheus 文本格式导出所有 worker 汇总后的指标"""
+    lines = []
+    for name, data in sorted(aggregate(_load_snapshots()).items()):
+        lines.append(f"# HELP {name} {data['help']}")
+        lines.append(f"# TYPE {name} {data['type']}")
+        labelnames = data["labelnames"]
+        for labels, value in sorted(data["values"].items()):
+            if data["type"] != "histogram":
+                lines.append(f"{name}{_format_labels(labelnames, labels)} {_format_value(value)}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(list(data["buckets"]) + [float("inf")], counts):
+                cumulative += bucket_count
+                le = _format_value(float(bound))
+                lines.append(f"{name}_bucket{_format_labels(labelnames, labels, [('le', le)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labelnames, labels)} {_format_value(float(total))}")
+            lines.append(f"{name}_count{_format_labels(labelnames, labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+# 后台定期写快照的任务
+_flush_task = None
+
+
+async def _flush_loop(interval):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            write_snapshot()
+        except OSError:
+            logger.exception("Failed to write metrics snapshot")
+
+
+def start_flusher():
+    """在 lifespan 启动时调用；未配置 METRICS_DIR 时什么也不做"""
+    global _flush_task
+    if config.METRICS_DIR and _flush_task is None:
+        write_snapshot()
+        _flush_task = asyncio.create_task(_flush_loop(config.METRICS_FLUSH_INTERVAL))
+
+
+async def stop_flusher():
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        try:
+            await _flush_task
+        except asyncio.CancelledError:
+            pass
+        _flush_task = None
+        write_snapshot()
+
+
+# HTTP 指标
+http_requests_total = Counter(
+    "http_requests_total", "Total HTTP requests", ("method", "route", "status"),
+)
+http_requests_in_flight = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being processed",
+)
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route"),
+)
+
+# 数据库指标
+db_queries_total = Counter("db_queries_total", "Total SQL statements executed")
+db_query_duration_seconds = Histogram("db_query_duration_seconds", "SQL statement latency")
+http_request_db_queries = Histogram(
+    "http_request_db_queries", "SQL statements executed per HTTP request", ("method", "route"),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+http_request_db_seconds = Histogram(
+    "http_request_db_seconds", "Time spent in SQL per HTTP request", ("method", "route"),
+)
+
+# 当前请求的 [查询次数, 查询总耗时]，由数据库事件累加
+_request_db_stats = contextvars.ContextVar("request_db_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["metrics_query_start"].pop()
+    db_queries_total.inc()
+    db_query_duration_seconds.observe(elapsed)
+    stats = _request_db_stats.get()
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += elapsed
+    for callback in _query_listeners:
+        callback(statement, elapsed)
+
+
+def instrument_engine(engine: Engine):
+    """在同步引擎（AsyncEngine.sync_engine）上注册查询计时事件，指标和 add_query_listener 的回调共用"""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class MetricsMiddleware:
+    """纯 ASGI 中间件：按路由模板记录请求数、进行中的请求数、延迟以及每个请求的 SQL 次数和耗时"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        db_stats = [0, 0.0]
+        token = _request_db_stats.set(db_stats)
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_requests_in_flight.dec()
+            _request_db_stats.reset(token)
+
+            # 使用路由模板（如 /orders/{order_id}）而不是实际路径，避免标签基数失控
+            route = scope.get("route")
+            route_path = getattr(route, "path", "<unmatched>")
+            method = scope["method"]
+            http_requests_total.inc(method, route_path, str(status_code))
+            http_request_duration_seconds.observe(elapsed, method, route_path)
+            http_request_db_queries.observe(db_stats[0], method, route_path)
+            http_request_db_seconds.observe(db_stats[1], method, route_path)
@@ -0,0 +1,78 @@
+"""
+纯 ASGI 中间件。
+
+与 @app.middleware("http")（BaseHTTPMiddleware）相比，不会为每个请求额外创建任务和内存流，
+也不会缓冲流式响应。
+"""
+import logging
+import time
+import uuid
+from context import (
+    request_id_var, request_method_var, request_path_var, log_sampled_var, last_request_var,
+    sample_request,
+)
+
+# 获取 logger
+logger = logging.getLogger(__name__)
+
+
+class RequestContextMiddleware:
+    """生成请求 ID 并写入日志上下文，记录请求耗时，添加 X-Request-ID 响应头"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # 生成一个唯一的请求ID
+        request_id = str(uuid.uuid4())
+        method = scope["method"]
+        path = scope["path"]
+
+        # 将请求 ID 设置到上下文变量中
+        token = request_id_var.set(request_id)
+        method_token = request_method_var.set(method)
+        path_token = request_path_var.set(path)
+        # 按路由决定本次请求的日志是否采样保留
+        sampled_token = log_sampled_var.set(sample_request(path))
+        last_request_var.set((request_id, method, path))
+
+        # 将请求 ID 绑定到请求状态（request.state.request_id）
+        scope.setdefault("state", {})["request_id"] = request_id
+
+        request_id_header = (b"x-request-id", request_id.encode("latin-1"))
+        status_code = 500
+
+        async def send_with_request_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                # 将请求 ID 添加到响应头
+                message["headers"] = [*message.get("headers", ()), request_id_header]
+            await send(message)
+
+        try:
+            # 记录请求开始
+            logger.info("Request started: %s %s", method, path)
+
+            start_time = time.perf_counter_ns()
+            await self.app(scope, receive, send_with_request_id)
+            process_time = (time.perf_counter_ns() - start_time) / 1e9
+
+            # 记录请求结束（流式响应在最后一块发送完后才结束），服务端错误使用 ERROR 级别，不受采样影响
+            logger.log(logging.ERROR if status_code >= 500 else logging.INFO,
+                       "Request completed: %s %s - Took: %.4fs - Status: %s",
+                       method, path, process_time, status_code,
+                       extra={"duration": round(process_time, 6), "status": status_code})
+        except Exception as e:
+            logger.exception("Error processing request: %s", e)
+            raise
+        finally:
+            # 重置上下文变量，避免泄漏到其他请求
+            request_id_var.reset(token)
+            request_method_var.reset(method_token)
+            request_path_var.reset(path_token)
+            log_sampled_var.reset(sampled_token)
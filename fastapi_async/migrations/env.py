@@ -2,6 +2,7 @@ from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
+from sqlalchemy.engine import make_url
 from sqlalchemy.engine import Connection
 from sqlalchemy.ext.asyncio import AsyncEngine
 
@@ -26,9 +27,10 @@ if config.config_file_name is not None:
 # target_metadata = mymodel.Base.metadata
 target_metadata = Base.metadata
 
-# Convert async PostgreSQL URL to sync URL for Alembic
-# Replace postgresql+asyncpg:// with postgresql:// 
-sync_db_url = str(DATABASE_URL).replace("postgresql+asyncpg://", "postgresql://")
+# Convert async URL to sync URL for Alembic
+# e.g. postgresql+asyncpg:// -> postgresql://, sqlite+aiosqlite:// -> sqlite://
+_url = make_url(DATABASE_URL)
+sync_db_url = _url.set(drivername=_url.get_backend_name()).render_as_string(hide_password=False)
 
 # Override the sqlalchemy.url from alembic.ini with our sync DATABASE_URL
 config.set_main_option("sqlalchemy.url", sync_db_url)
@@ -0,0 +1,41 @@
+"""add orders indexes and drop redundant id indexes
+
+Revision ID: 5c2a7e9d41b3
+Revises: 76f46008b84b
+Create Date: 2026-10-18 10:12:40.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c2a7e9d41b3'
+down_revision: Union[str, None] = '76f46008b84b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_orders_user_id'), 'orders', ['user_id'], unique=False)
+    op.create_index('ix_orders_user_id_created_at', 'orders', ['user_id', 'created_at'], unique=False)
+    op.create_index(
+        'ix_orders_pending_id', 'orders', ['id'], unique=False,
+        postgresql_where=sa.text("status = 'pending'"),
+        sqlite_where=sa.text("status = 'pending'"),
+    )
+    # 主键本身已有唯一索引，这两个索引是重复的
+    op.drop_index(op.f('ix_orders_id'), table_name='orders')
+    op.drop_index(op.f('ix_users_id'), table_name='users')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index(op.f('ix_users_id'), 'users', ['id'], unique=False)
+    op.create_index(op.f('ix_orders_id'), 'orders', ['id'], unique=False)
+    op.drop_index('ix_orders_pending_id', table_name='orders')
+    op.drop_index('ix_orders_user_id_created_at', table_name='orders')
+    op.drop_index(op.f('ix_orders_user_id'), table_name='orders')
@@ -0,0 +1,42 @@
+"""add order_daily_rollups table
+
+Revision ID: a81f3c6d2e90
+Revises: 5c2a7e9d41b3
+Create Date: 2026-10-18 11:03:27.551902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a81f3c6d2e90'
+down_revision: Union[str, None] = '5c2a7e9d41b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('order_daily_rollups',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('order_count', sa.Integer(), nullable=False),
+    sa.Column('total_amount', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'user_id', 'status')
+    )
+    # 用已有订单回填
+    op.execute(
+        "INSERT INTO order_daily_rollups (day, user_id, status, order_count, total_amount) "
+        "SELECT date(created_at), user_id, status, count(id), coalesce(sum(amount), 0) "
+        "FROM orders WHERE created_at IS NOT NULL AND user_id IS NOT NULL AND status IS NOT NULL "
+        "GROUP BY date(created_at), user_id, status"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('order_daily_rollups')
@@ -1,6 +1,7 @@
 from db import Base
 from models.user import User
 from models.order import Order
+from models.order_daily_rollup import OrderDailyRollup
 
 # Re-export models for backwards compatibility
-__all__ = ["User", "Order", "Base"] 
\ No newline at end of file
+__all__ = ["User", "Order", "OrderDailyRollup", "Base"] 
\ No newline at end of file
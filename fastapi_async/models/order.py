@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Index, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from db import Base
@@ -6,12 +6,23 @@ from db import Base
 class Order(Base):
     __tablename__ = "orders"
 
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     amount = Column(Float)
     status = Column(String, default="pending")
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationship with User
-    user = relationship("User", back_populates="orders") 
\ No newline at end of file
+    user = relationship("User", back_populates="orders")
+    
+    __table_args__ = (
+        # 按用户查询订单并按时间排序
+        Index("ix_orders_user_id_created_at", "user_id", "created_at"),
+        # 只索引待处理订单，按 status=pending 过滤时使用，体积远小于全表索引
+        Index(
+            "ix_orders_pending_id", "id",
+            postgresql_where=text("status = 'pending'"),
+            sqlite_where=text("status = 'pending'"),
+        ),
+    ) 
\ No newline at end of file
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, Integer, String, Float, Date
+from db import Base
+
+class OrderDailyRollup(Base):
+    """按 (日期, 用户, 状态) 预先汇总的订单数量和金额，插入订单时增量更新"""
+    __tablename__ = "order_daily_rollups"
+
+    day = Column(Date, primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+    status = Column(String, primary_key=True)
+    order_count = Column(Integer, nullable=False, default=0)
+    total_amount = Column(Float, nullable=False, default=0.0)
@@ -0,0 +1,125 @@
+"""
+开发/预发环境使用的按请求 SQL 分析器。
+
+开启 QUERY_PROFILING 后记录每个请求（按 request_id_var）执行的所有 SQL（计时来自 metrics 的游标事件），
+在响应头中返回查询次数和数据库总耗时，并把同一形态的语句重复执行多次的请求标记为疑似 N+1。
+最近的请求记录可以通过 GET /debug/queries 查看。
+"""
+import logging
+import re
+from collections import Counter, deque
+from context import request_id_var
+import config
+import metrics
+
+# 获取 logger
+logger = logging.getLogger(__name__)
+
+# 进行中的请求，键为 request_id
+_active_profiles = {}
+# 最近完成的请求
+_recent_profiles = deque(maxlen=config.QUERY_PROFILE_HISTORY)
+
+_whitespace = re.compile(r"\s+")
+# IN (?, ?, ?) 之类的参数列表长度不同也视为同一形态
+_param_list = re.compile(r"\(\s*(?:\?|\$\d+|%\(\w+\)s|%s|:\w+)(?:\s*,\s*(?:\?|\$\d+|%\(\w+\)s|%s|:\w+))*\s*\)")
+_number_literal = re.compile(r"\b\d+\b")
+
+
+def normalize_statement(statement: str) -> str:
+    """把 SQL 归一化为语句形态，用于识别重复执行的相同查询"""
+    shape = _whitespace.sub(" ", statement).strip()
+    shape = _param_list.sub("(?)", shape)
+    return _number_literal.sub("?", shape)
+
+
+class RequestProfile:
+    def __init__(self, request_id, method, path):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.queries = []
+        self.total_time = 0.0
+
+    def record(self, statement, duration):
+        self.queries.append((statement, duration))
+        self.total_time += duration
+
+    def repeated_shapes(self, threshold=None):
+        """返回执行次数达到阈值的语句形态及次数"""
+        if threshold is None:
+            threshold = config.QUERY_N_PLUS_ONE_THRESHOLD
+        shapes = Counter(normalize_statement(statement) for statement, _ in self.queries)
+        return {shape: count for shape, count in shapes.items() if count >= threshold}
+
+    def to_dict(self):
+        return {
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "query_count": len(self.queries),
+            "db_time_ms": round(self.total_time * 1000, 3),
+            "n_plus_one": self.repeated_shapes(),
+            "queries": [
+                {"statement": statement, "duration_ms": round(duration * 1000, 3)}
+                for statement, duration in self.queries
+            ],
+        }
+
+
+def _record_query(statement, elapsed):
+    if not _active_profiles:
+        return
+    profile = _active_profiles.get(request_id_var.get())
+    if profile is not None:
+        profile.record(statement, elapsed)
+
+
+# 查询计时由 metrics.instrument_engine 注册的游标事件完成，这里只按 request_id 归集
+metrics.add_query_listener(_record_query)
+
+
+def get_recent_profiles():
+    return [profile.to_dict() for profile in reversed(_recent_profiles)]
+
+
+def clear_profiles():
+    _recent_profiles.clear()
+
+
+class QueryProfilerMiddleware:
+    """纯 ASGI 中间件，需要放在 RequestContextMiddleware 内层以读取 request_id"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not config.QUERY_PROFILING:
+            await self.app(scope, receive, send)
+            return
+
+        request_id = request_id_var.get()
+        profile = RequestProfile(request_id, scope["method"], scope["path"])
+        _active_profiles[request_id] = profile
+
+        async def send_with_profile(message):
+            if message["type"] == "http.response.start":
+                headers = [
+                    *message.get("headers", ()),
+                    (b"x-db-query-count", str(len(profile.queries)).encode()),
+                    (b"x-db-time-ms", f"{profile.total_time * 1000:.3f}".encode()),
+                ]
+                repeated = profile.repeated_shapes()
+                if repeated:
+                    headers.append((b"x-db-n-plus-one", str(max(repeated.values())).encode()))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            _active_profiles.pop(request_id, None)
+            _recent_profiles.append(profile)
+            for shape, count in profile.repeated_shapes().items():
+                logger.warning("Possible N+1 query in %s %s: executed %s times: %s",
+                               profile.method, profile.path, count, shape)
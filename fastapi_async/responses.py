@@ -0,0 +1,27 @@
+"""
+快速 JSON 响应。
+
+安装了 orjson 时使用 orjson 序列化，否则退回标准库 json，
+配合只查询列的 SQL 直接序列化行数据，跳过 pydantic 校验和 jsonable_encoder。
+"""
+import json
+from typing import Any
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson 是可选依赖
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """直接序列化 dict/list 的 JSON 响应，不经过 jsonable_encoder"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
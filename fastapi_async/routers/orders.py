@@ -1,10 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from db import get_session
+from db import (
+    get_session, get_session_factory, get_read_session, get_read_session_factory,
+    pin_reads_to_primary, reads_pinned_to_primary,
+)
 from models import Order
-from pydantic import BaseModel, ConfigDict
-from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Literal, Optional, Union
+from datetime import date
 from services import orders as orders_service
+from services import order_batcher
+from services import order_stats
+from services import response_cache
+from services import singleflight
+from responses import FastJSONResponse, dumps
+import config
 import logging
 
 # 获取 logger
@@ -24,43 +35,175 @@ class OrderResponse(BaseModel):
     
     model_config = ConfigDict(from_attributes=True)
 
+class OrderBulkCreate(BaseModel):
+    orders: List[OrderCreate] = Field(..., min_length=1, max_length=1000)
+
+class OrderBulkItemResult(BaseModel):
+    index: int
+    order: Optional[OrderResponse] = None
+    error: Optional[str] = None
+
+class OrderBulkResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[OrderBulkItemResult]
+
+class OrderStatsItem(BaseModel):
+    # user_id、status 或 YYYY-MM-DD 格式的日期
+    key: Union[int, str, None]
+    count: int
+    total: float
+    average: float
+
+# 分页参数
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
 # Create router
+# FAST_JSON 在每个请求中读取（GET /orders/ 显式返回 FastJSONResponse），其他路由使用默认的 JSONResponse
 router = APIRouter(
     prefix="/orders",
     tags=["orders"],
 )
 
 @router.post("/", response_model=OrderResponse)
-async def create_order(order: OrderCreate, db: AsyncSession = Depends(get_session)):
+async def create_order(order: OrderCreate, response: Response, session_factory = Depends(get_session_factory)):
     """创建新订单"""
-    logger.info(f"Creating new order for user_id: {order.user_id}, amount: {order.amount}")
+    logger.info("Creating new order for user_id: %s, amount: %s", order.user_id, order.amount)
     
-    result = await orders_service.create_order(
-        db=db, 
-        user_id=order.user_id, 
-        amount=order.amount, 
-        status=order.status
-    )
+    if order_batcher.is_running():
+        # 合并提交模式：与同一时间窗口内的其他订单在一个事务中写入，请求本身不打开会话
+        result = await order_batcher.submit(order.user_id, order.amount, order.status)
+    else:
+        async with session_factory() as db:
+            result = await orders_service.create_order(
+                db=db, 
+                user_id=order.user_id, 
+                amount=order.amount, 
+                status=order.status
+            )
+    # 写入成功后客户端短时间内从主库读取
+    pin_reads_to_primary(response)
     
-    logger.info(f"Order created successfully with ID: {result.id}")
+    logger.info("Order created successfully with ID: %s", result.id)
     return result
 
+@router.post("/bulk", response_model=OrderBulkResponse)
+async def create_orders_bulk(payload: OrderBulkCreate, db: AsyncSession = Depends(get_session)):
+    """批量创建订单，逐条返回成功或失败原因"""
+    logger.info("Creating %s orders in bulk", len(payload.orders))
+    
+    results = await orders_service.create_orders_bulk(
+        db=db,
+        items=[order.model_dump() for order in payload.orders],
+    )
+    
+    items = [
+        OrderBulkItemResult(
+            index=index,
+            order=OrderResponse.model_validate(order) if order is not None else None,
+            error=error,
+        )
+        for index, (order, error) in enumerate(results)
+    ]
+    created = sum(1 for item in items if item.error is None)
+    
+    logger.info("Bulk order creation finished, created: %s, failed: %s", created, len(items) - created)
+    return OrderBulkResponse(created=created, failed=len(items) - created, results=items)
+
+async def _stream_orders_ndjson(session_factory, after: Optional[int], **filters):
+    """逐批序列化订单为 NDJSON，会话由生成器自己持有直到流结束"""
+    async with session_factory() as session:
+        if config.FAST_JSON:
+            async for rows in orders_service.stream_order_batches(db=session, after=after, as_rows=True, **filters):
+                yield b"".join(dumps(row) + b"\n" for row in rows)
+        else:
+            async for batch in orders_service.stream_order_batches(db=session, after=after, **filters):
+                yield "".join(OrderResponse.model_validate(order).model_dump_json() + "\n" for order in batch)
+
+
 @router.get("/", response_model=List[OrderResponse])
-async def get_orders(db: AsyncSession = Depends(get_session)):
-    """获取所有订单"""
-    logger.info("Retrieving all orders")
+async def get_orders(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[int] = Query(None, description="上一页最后一个订单的 ID"),
+    stream: bool = Query(False, description="以 NDJSON 流式返回全部订单"),
+    user_id: Optional[int] = Query(None, description="只返回该用户的订单"),
+    status: Optional[str] = Query(None, description="只返回该状态的订单"),
+    db: AsyncSession = Depends(get_read_session),
+    session_factory = Depends(get_read_session_factory),
+):
+    """分页获取订单，可按用户和状态过滤，下一页游标通过 X-Next-Cursor 响应头返回"""
+    filters = {"user_id": user_id, "status": status}
+    if stream:
+        logger.info("Streaming orders after: %s, filters: %s", after, filters)
+        return StreamingResponse(
+            _stream_orders_ndjson(session_factory, after, **filters),
+            media_type="application/x-ndjson",
+        )
+    
+    logger.info("Retrieving orders, limit: %s, after: %s, filters: %s", limit, after, filters)
     
-    orders = await orders_service.get_all_orders(db=db)
+    if config.FAST_JSON:
+        # 快速模式：只查询列并直接序列化，不经过 response_model 校验
+        rows = await orders_service.get_order_rows(db=db, limit=limit + 1, after=after, **filters)
+        headers = {}
+        if len(rows) > limit:
+            rows = rows[:limit]
+            headers["X-Next-Cursor"] = str(rows[-1]["id"])
+        logger.info("Retrieved %s order rows", len(rows))
+        return FastJSONResponse(rows, headers=headers)
     
-    logger.info(f"Retrieved {len(orders)} orders")
+    # 多取一条用于判断是否还有下一页
+    orders = await orders_service.get_all_orders(db=db, limit=limit + 1, after=after, **filters)
+    if len(orders) > limit:
+        orders = orders[:limit]
+        response.headers["X-Next-Cursor"] = str(orders[-1].id)
+    
+    logger.info("Retrieved %s orders", len(orders))
     return orders
 
+@router.get("/stats", response_model=List[OrderStatsItem])
+async def get_order_stats(
+    group_by: Literal["user_id", "status", "day"] = Query("day"),
+    start: Optional[date] = Query(None, description="起始日期（含）"),
+    end: Optional[date] = Query(None, description="结束日期（含）"),
+    user_id: Optional[int] = Query(None),
+    status: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_read_session),
+):
+    """在数据库中按用户、状态或日期汇总订单数量、金额合计和平均值"""
+    logger.info("Retrieving order stats grouped by %s", group_by)
+    
+    stats = await order_stats.get_order_stats(
+        db=db, group_by=group_by, start=start, end=end, user_id=user_id, status=status,
+    )
+    
+    logger.info("Retrieved %s order stats groups", len(stats))
+    return stats
+
 @router.get("/{order_id}", response_model=OrderResponse)
-async def get_order(order_id: int, db: AsyncSession = Depends(get_session)):
-    """根据ID获取订单"""
-    logger.info(f"Retrieving order with ID: {order_id}")
+async def get_order(order_id: int, request: Request, db: AsyncSession = Depends(get_read_session)):
+    """根据ID获取订单，响应带 ETag/Last-Modified 并缓存"""
+    logger.info("Retrieving order with ID: %s", order_id)
     
-    order = await orders_service.get_order_by_id(db=db, order_id=order_id)
+    key = response_cache.cache_key("orders", order_id)
+    # 刚写入过的客户端直接读主库：缓存是每个 worker 各自一份，其他 worker 上可能还是写入前的结果
+    use_cache = not reads_pinned_to_primary(request)
+    entry = await response_cache.lookup(key) if use_cache else None
+    if entry is None:
+        async def load_order():
+            order = await orders_service.get_order_by_id(db=db, order_id=order_id)
+            body = OrderResponse.model_validate(order).model_dump_json().encode()
+            loaded = response_cache.CachedResponse(
+                body, response_cache.make_etag(order.id, order.updated_at), response_cache.http_date(order.updated_at),
+            )
+            if use_cache:
+                await response_cache.store(key, loaded)
+            return loaded
+        
+        # 缓存未命中时，同一订单的并发请求只查询和序列化一次
+        entry = await singleflight.do(singleflight.read_key(request, key), load_order)
     
-    logger.info(f"Retrieved order with ID: {order_id}")
-    return order 
\ No newline at end of file
+    logger.info("Retrieved order with ID: %s", order_id)
+    return response_cache.to_response(request, entry)
@@ -1,10 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from db import get_session
+from db import get_session, get_read_session, reads_pinned_to_primary
 from models import User
-from pydantic import BaseModel, ConfigDict
-from typing import List
+from services import users as users_service
+from services import response_cache
+from services import singleflight
+import executors
+import security
+from routers.orders import OrderResponse, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from pydantic import BaseModel, ConfigDict, TypeAdapter
+from typing import List, Literal, Optional, Union
 import logging
 
 # 获取 logger
@@ -23,6 +29,12 @@ class UserResponse(BaseModel):
     
     model_config = ConfigDict(from_attributes=True)
 
+class UserWithOrdersResponse(UserResponse):
+    orders: List[OrderResponse]
+
+_user_list_adapter = TypeAdapter(List[UserResponse])
+_user_with_orders_list_adapter = TypeAdapter(List[UserWithOrdersResponse])
+
 # Create router
 router = APIRouter(
     prefix="/users",
@@ -31,23 +43,91 @@ router = APIRouter(
 
 @router.post("/", response_model=UserResponse)
 async def create_user(user: UserCreate, db: AsyncSession = Depends(get_session)):
-    logger.info(f"Creating new user with username: {user.username}, email: {user.email}")
+    logger.info("Creating new user with username: %s, email: %s", user.username, user.email)
     
-    # In a real app, hash the password
-    db_user = User(username=user.username, email=user.email, hashed_password=user.password)
+    # 哈希是 CPU 密集型操作，放到执行器中运行，避免阻塞事件循环
+    hashed_password = await executors.run_cpu_bound(security.hash_password, user.password)
+    db_user = User(username=user.username, email=user.email, hashed_password=hashed_password)
     db.add(db_user)
-    await db.commit()
+    try:
+        await db.commit()
+    except IntegrityError:
+        # username 和 email 有唯一约束，与 flask_sync 一样返回 409
+        await db.rollback()
+        logger.warning("Failed to create user: username %s or email %s already exists", user.username, user.email)
+        raise HTTPException(status_code=409, detail="Username or email already registered")
     await db.refresh(db_user)
+    users_service.remember_user(db_user.id)
+    await response_cache.invalidate_prefix("users:")
     
-    logger.info(f"User created successfully with ID: {db_user.id}")
+    logger.info("User created successfully with ID: %s", db_user.id)
     return db_user
 
-@router.get("/", response_model=List[UserResponse])
-async def get_users(db: AsyncSession = Depends(get_session)):
-    logger.info("Retrieving all users")
+@router.get("/", response_model=List[Union[UserWithOrdersResponse, UserResponse]])
+async def get_users(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[int] = Query(None, description="上一页最后一个用户的 ID"),
+    include: Optional[Literal["orders"]] = Query(None, description="include=orders 时同时返回每个用户的订单"),
+    db: AsyncSession = Depends(get_read_session),
+):
+    """分页获取用户，下一页游标通过 X-Next-Cursor 响应头返回"""
+    logger.info("Retrieving users, limit: %s, after: %s, include: %s", limit, after, include)
+    include_orders = include == "orders"
+    
+    # 带订单的响应会随订单写入而变化，只计算 ETag 不做缓存，避免每次下单都要清空用户列表缓存；
+    # 刚写入过的客户端直接读主库，不读写缓存（其他 worker 的缓存可能还是写入前的结果）
+    key = response_cache.cache_key("users", limit=limit, after=after)
+    use_cache = not include_orders and not reads_pinned_to_primary(request)
+    entry = await response_cache.lookup(key) if use_cache else None
+    if entry is None:
+        async def load_users():
+            # 多取一条用于判断是否还有下一页
+            users = await users_service.get_users(db=db, limit=limit + 1, after=after, include_orders=include_orders)
+            headers = ()
+            if len(users) > limit:
+                users = users[:limit]
+                headers = (("X-Next-Cursor", str(users[-1].id)),)
+            
+            # ETag 由每个用户（以及订单）的 id 和 updated_at 计算，任何变化都会改变 ETag
+            parts = [(u.id, u.updated_at) for u in users]
+            updated = [u.updated_at for u in users if u.updated_at is not None]
+            if include_orders:
+                for u in users:
+                    parts.extend(("order", o.id, o.updated_at) for o in u.orders)
+                    updated.extend(o.updated_at for o in u.orders if o.updated_at is not None)
+            etag = response_cache.make_etag(*parts)
+            last_modified = response_cache.http_date(max(updated)) if updated else None
+            
+            adapter = _user_with_orders_list_adapter if include_orders else _user_list_adapter
+            body = adapter.dump_json(adapter.validate_python(users, from_attributes=True))
+            loaded = response_cache.CachedResponse(body, etag, last_modified, headers)
+            if use_cache:
+                await response_cache.store(key, loaded)
+            logger.info("Retrieved %s users", len(users))
+            return loaded
+        
+        # 缓存未命中时，相同参数的并发请求只查询和序列化一次
+        flight_key = f"{key}&include={include}" if include_orders else key
+        entry = await singleflight.do(singleflight.read_key(request, flight_key), load_users)
+    
+    return response_cache.to_response(request, entry)
+
+@router.get("/{user_id}/orders", response_model=List[OrderResponse])
+async def get_user_orders(
+    user_id: int,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[int] = Query(None, description="上一页最后一个订单的 ID"),
+    db: AsyncSession = Depends(get_read_session),
+):
+    """分页获取某个用户的订单，下一页游标通过 X-Next-Cursor 响应头返回"""
+    logger.info("Retrieving orders for user_id: %s, limit: %s, after: %s", user_id, limit, after)
     
-    result = await db.execute(select(User))
-    users = result.scalars().all()
+    orders = await users_service.get_user_orders(db=db, user_id=user_id, limit=limit + 1, after=after)
+    if len(orders) > limit:
+        orders = orders[:limit]
+        response.headers["X-Next-Cursor"] = str(orders[-1].id)
     
-    logger.info(f"Retrieved {len(users)} users")
-    return users 
\ No newline at end of file
+    logger.info("Retrieved %s orders for user_id: %s", len(orders), user_id)
+    return orders
@@ -0,0 +1,45 @@
+"""
+密码哈希，使用标准库的 scrypt，不引入额外依赖。
+
+哈希是 CPU 密集型操作（默认参数约几十毫秒），在请求处理中必须通过
+executors.run_cpu_bound 调用，不能直接在事件循环中执行。
+"""
+import base64
+import hashlib
+import hmac
+import os
+import config
+
+_ALGORITHM = "scrypt"
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+def hash_password(password: str) -> str:
+    """返回 scrypt$n$r$p$salt$hash 格式的哈希，参数随哈希保存，调整配置不影响已有密码的校验"""
+    n, r, p = config.SCRYPT_N, config.SCRYPT_R, config.SCRYPT_P
+    salt = os.urandom(16)
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=_maxmem(n, r), dklen=32)
+    return f"{_ALGORITHM}${n}${r}${p}${_b64encode(salt)}${_b64encode(digest)}"
+
+
+def verify_password(password: str, hashed_password: str) -> bool:
+    try:
+        algorithm, n, r, p, salt, expected = hashed_password.split("$")
+        n, r, p = int(n), int(r), int(p)
+    except ValueError:
+        return False
+    if algorithm != _ALGORITHM:
+        return False
+    expected = base64.b64decode(expected)
+    digest = hashlib.scrypt(
+        password.encode(), salt=base64.b64decode(salt), n=n, r=r, p=p, maxmem=_maxmem(n, r), dklen=len(expected),
+    )
+    return hmac.compare_digest(digest, expected)
+
+
+def _maxmem(n: int, r: int) -> int:
+    # scrypt 需要约 128 * n * r 字节内存，OpenSSL 默认上限只有 32MB
+    return 128 * n * r * 2
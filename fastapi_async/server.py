@@ -0,0 +1,112 @@
+"""
+生产环境启动入口。
+
+    python server.py
+
+默认用 uvicorn 启动 WEB_CONCURRENCY 个 worker（未设置时等于容器可用的 CPU 数，见 config.available_cpus），安装了 uvloop/httptools
+（prod 可选依赖）时自动使用。SERVER=gunicorn 时由 gunicorn 管理 UvicornWorker，
+支持带随机抖动的 worker 回收（max_requests_jitter），避免所有 worker 同时重启。
+
+worker 数在这里确定后写回 WEB_CONCURRENCY 环境变量，各 worker 进程导入 config 时据此分配数据库连接。
+"""
+import importlib
+import importlib.util
+import logging
+import os
+import config
+import metrics
+
+# 获取 logger
+logger = logging.getLogger(__name__)
+
+APP = "app:app"
+
+
+def worker_count() -> int:
+    """WEB_CONCURRENCY，未设置时为容器可用的 CPU 数（考虑 CPU 亲和性和 cgroup 配额）"""
+    return int(os.getenv("WEB_CONCURRENCY") or config.available_cpus())
+
+
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def run_uvicorn(workers: int):
+    import uvicorn
+
+    uvicorn.run(
+        APP,
+        host=config.SERVER_HOST,
+        port=config.SERVER_PORT,
+        workers=workers,
+        loop="uvloop" if _available("uvloop") else "asyncio",
+        http="httptools" if _available("httptools") else "h11",
+        backlog=config.SERVER_BACKLOG,
+        timeout_keep_alive=config.SERVER_KEEPALIVE,
+        timeout_graceful_shutdown=config.SERVER_GRACEFUL_TIMEOUT,
+        # worker 处理完这么多请求后退出，用于回收内存；多 worker 时由 uvicorn 主进程重新拉起，
+        # 只有一个 worker 时整个服务退出，需要由容器或进程管理器重启
+        limit_max_requests=config.SERVER_MAX_REQUESTS or None,
+        forwarded_allow_ips=config.SERVER_FORWARDED_ALLOW_IPS,
+        # 请求日志由 RequestContextMiddleware 记录
+        access_log=False,
+        log_config=None,
+    )
+
+
+def run_gunicorn(workers: int):
+    from gunicorn.app.base import BaseApplication
+
+    worker_class = "uvicorn_worker.UvicornWorker" if _available("uvicorn_worker") else "uvicorn.workers.UvicornWorker"
+    options = {
+        "bind": f"{config.SERVER_HOST}:{config.SERVER_PORT}",
+        "workers": workers,
+        "worker_class": worker_class,
+        "backlog": config.SERVER_BACKLOG,
+        "keepalive": config.SERVER_KEEPALIVE,
+        "graceful_timeout": config.SERVER_GRACEFUL_TIMEOUT,
+        "timeout": config.SERVER_WORKER_TIMEOUT,
+        "max_requests": config.SERVER_MAX_REQUESTS,
+        "max_requests_jitter": config.SERVER_MAX_REQUESTS_JITTER,
+        "forwarded_allow_ips": config.SERVER_FORWARDED_ALLOW_IPS,
+        "accesslog": None,
+    }
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from app import app
+            return app
+
+    Application().run()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+    workers = worker_count()
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    # config 已在本进程中导入；gunicorn 的 worker 由本进程 fork 而来，不会重新导入，
+    # 重新加载使连接池和执行器大小按最终的 worker 数计算
+    importlib.reload(config)
+    # 上一次运行留下的指标快照不属于本次启动的 worker，计数器从零开始
+    metrics.clear_snapshots()
+    logger.info(
+        "Starting %s with %s workers on %s:%s (loop: %s, http: %s)",
+        config.SERVER, workers, config.SERVER_HOST, config.SERVER_PORT,
+        "uvloop" if _available("uvloop") else "asyncio",
+        "httptools" if _available("httptools") else "h11",
+    )
+    if config.SERVER != "gunicorn" and workers == 1 and config.SERVER_MAX_REQUESTS:
+        logger.warning("SERVER_MAX_REQUESTS with a single uvicorn worker stops the server after %s requests, "
+                       "it must be restarted by the container or process manager", config.SERVER_MAX_REQUESTS)
+    if config.SERVER == "gunicorn":
+        run_gunicorn(workers)
+    else:
+        run_uvicorn(workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+进程内缓存工具。
+"""
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+
+class TTLCache:
+    """容量有上限的 LRU 缓存，条目在 ttl 秒后过期"""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        value, expires_at = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        # 超出容量时淘汰最久未使用的条目
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def keys(self):
+        return list(self._data.keys())
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CacheBackend(ABC):
+    """缓存后端接口，方法均为异步，Redis 等外部缓存继承并实现这些方法即可替换默认的进程内实现"""
+
+    @abstractmethod
+    async def get(self, key):
+        ...
+
+    @abstractmethod
+    async def set(self, key, value, ttl: float = None):
+        ...
+
+    @abstractmethod
+    async def delete(self, key):
+        ...
+
+    @abstractmethod
+    async def delete_prefix(self, prefix: str):
+        ...
+
+    @abstractmethod
+    async def clear(self):
+        ...
+
+
+class LocalCacheBackend(CacheBackend):
+    """基于 TTLCache 的进程内缓存后端，每个 worker 各自一份"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key):
+        return self._cache.get(key)
+
+    async def set(self, key, value, ttl: float = None):
+        self._cache.set(key, value, ttl)
+
+    async def delete(self, key):
+        self._cache.delete(key)
+
+    async def delete_prefix(self, prefix: str):
+        for key in self._cache.keys():
+            if key.startswith(prefix):
+                self._cache.delete(key)
+
+    async def clear(self):
+        self._cache.clear()
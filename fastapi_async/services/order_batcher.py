@@ -0,0 +1,196 @@
+"""
+订单合并提交（group commit）。
+
+高峰期 POST /orders/ 每个订单一个事务，吞吐受限于数据库提交（fsync）延迟。
+开启 ORDER_BATCHING 后，lifespan 启动一个后台任务，把 ORDER_BATCH_MAX_WAIT_MS 毫秒内
+（最多 ORDER_BATCH_MAX_ITEMS 个）到达的订单合并，通过 create_orders_bulk 在一个事务中写入，
+再把各自的订单（含 ID）或错误交还给等待的请求。
+同一时间只有一个批次在提交，提交期间到达的订单自然组成下一批。
+
+整批写入失败时（如缓存中的用户刚被删除导致外键冲突，或 ORDER_USER_CHECK=foreign_key 时用户不存在），
+逐条重新写入，只有出错的订单失败。后台任务意外退出时，排队中的请求立即收到 503，之后的请求退回逐条提交。
+"""
+import asyncio
+import logging
+import time
+from typing import Optional
+from fastapi import HTTPException
+from models import Order
+from services import orders as orders_service
+import config
+import db
+import metrics
+
+# 获取 logger
+logger = logging.getLogger(__name__)
+
+order_batch_size = metrics.Histogram(
+    "order_batch_size", "Orders inserted per group commit",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+order_batch_flush_seconds = metrics.Histogram("order_batch_flush_seconds", "Time to insert and commit one batch")
+order_batch_wait_seconds = metrics.Histogram(
+    "order_batch_wait_seconds", "Time from submitting an order to its batch being committed",
+)
+order_batch_fallbacks_total = metrics.Counter(
+    "order_batch_fallbacks_total", "Batches that failed as a whole and were retried one order at a time",
+)
+order_batch_queue_depth = metrics.Gauge("order_batch_queue_depth", "Orders waiting for the next batch")
+
+_queue: Optional[asyncio.Queue] = None
+_task: Optional[asyncio.Task] = None
+_session_factory = None
+
+
+def _unavailable() -> HTTPException:
+    return HTTPException(status_code=503, detail="Order could not be saved, retry later")
+
+
+def is_running() -> bool:
+    return _task is not None and not _task.done()
+
+
+def start(session_factory=None) -> None:
+    """在 lifespan 启动时调用；ORDER_BATCHING 关闭时不启动，调用方退回逐条提交"""
+    global _queue, _task, _session_factory
+    if not config.ORDER_BATCHING or _task is not None:
+        return
+    _session_factory = session_factory or db.async_session
+    _queue = asyncio.Queue(maxsize=config.ORDER_BATCH_QUEUE_SIZE)
+    _task = asyncio.create_task(_run(config.ORDER_BATCH_MAX_ITEMS, config.ORDER_BATCH_MAX_WAIT_MS / 1000))
+    _task.add_done_callback(_on_stopped)
+    logger.info("Started order batcher, max items: %s, max wait: %s ms",
+                config.ORDER_BATCH_MAX_ITEMS, config.ORDER_BATCH_MAX_WAIT_MS)
+
+
+async def stop() -> None:
+    """提交队列中剩余的订单后停止"""
+    global _queue, _task
+    if _task is None:
+        return
+    if not _task.done():
+        # None 作为结束标记，排在已提交的订单之后
+        await _queue.put(None)
+        await asyncio.wait((_task,))
+    _queue = _task = None
+    logger.info("Stopped order batcher")
+
+
+async def submit(user_id: int, amount: float, status: str = "pending") -> Order:
+    """提交一个订单并等待所在批次提交完成；用户不存在时抛出 404"""
+    if not is_running():
+        raise _unavailable()
+    future = asyncio.get_running_loop().create_future()
+    # 队列满时在这里等待，形成背压
+    await _queue.put(({"user_id": user_id, "amount": amount, "status": status}, future, time.perf_counter()))
+    if _task.done():
+        # 等待入队期间后台任务已退出，不会再有人处理这个订单
+        _fail_queued()
+    return await future
+
+
+def _fail(futures) -> None:
+    for future in futures:
+        if not future.done():
+            future.set_exception(_unavailable())
+
+
+def _fail_queued() -> None:
+    while True:
+        try:
+            item = _queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        if item is not None:
+            _fail([item[1]])
+
+
+def _on_stopped(task: asyncio.Task) -> None:
+    # 正常停止时队列已经为空；意外退出时让排队中的请求立即失败
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Order batcher stopped unexpectedly", exc_info=task.exception())
+    _fail_queued()
+
+
+async def _run(max_items: int, max_wait: float) -> None:
+    loop = asyncio.get_running_loop()
+    stopping = False
+    batch = []
+    try:
+        while not stopping:
+            first = await _queue.get()
+            if first is None:
+                break
+            batch = [first]
+            deadline = loop.time() + max_wait
+            while len(batch) < max_items:
+                try:
+                    # 已经排队的订单直接取出，否则最多等到截止时间
+                    item = _queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(_queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await _flush(batch)
+            batch = []
+    finally:
+        _fail([future for _, future, _ in batch])
+
+
+async def _insert_batch(items):
+    async with _session_factory() as session:
+        return await orders_service.create_orders_bulk(
+            session, items, check_users=config.ORDER_USER_CHECK != "foreign_key",
+        )
+
+
+async def _insert_one(item):
+    """逐条写入，create_order 把外键冲突和用户不存在转换为 404"""
+    try:
+        async with _session_factory() as session:
+            return await orders_service.create_order(session, item["user_id"], item["amount"], item["status"]), None
+    except HTTPException as e:
+        return None, e
+    except Exception:
+        logger.exception("Failed to insert order for user_id: %s", item["user_id"])
+        return None, _unavailable()
+
+
+async def _flush(batch) -> None:
+    start = time.perf_counter()
+    items = [item for item, _, _ in batch]
+    try:
+        results = [(order, None if error is None else HTTPException(status_code=404, detail=error))
+                   for order, error in await _insert_batch(items)]
+    except Exception as e:
+        order_batch_fallbacks_total.inc()
+        logger.warning("Batch of %s orders failed (%s), retrying one at a time", len(batch), e)
+        results = [await _insert_one(item) for item in items]
+
+    finished = time.perf_counter()
+    order_batch_size.observe(len(batch))
+    order_batch_flush_seconds.observe(finished - start)
+    for (_, future, submitted), (order, error) in zip(batch, results):
+        order_batch_wait_seconds.observe(finished - submitted)
+        # 请求已被取消（如客户端断开）时订单仍然写入，只是没有人等待结果
+        if future.done():
+            continue
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(order)
+
+
+def _collect_batcher_metrics():
+    order_batch_queue_depth.set(_queue.qsize() if _queue is not None else 0)
+
+
+metrics.add_collector(_collect_batcher_metrics)
@@ -0,0 +1,141 @@
+"""
+订单统计：按用户、状态或日期汇总订单数量、金额合计和平均值，全部在 SQL 中完成。
+
+开启 ORDER_STATS_ROLLUP 后，插入订单时在同一事务中增量更新 order_daily_rollups，
+统计查询改为读取预汇总表，耗时只与天数 × 用户数 × 状态数有关，与订单表大小无关。
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from models import Order, OrderDailyRollup
+import config
+from typing import Iterable, List, Optional
+import logging
+
+# 获取 logger
+logger = logging.getLogger(__name__)
+
+GROUP_BY_FIELDS = ("user_id", "status", "day")
+
+# 支持 INSERT ... ON CONFLICT DO UPDATE 的方言
+_upsert_inserts = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+def check_rollup_support(engine) -> None:
+    """在 lifespan 启动时调用：开启 ORDER_STATS_ROLLUP 但数据库不支持 upsert 时拒绝启动，
+    而不是在写订单的事务中途失败"""
+    if config.ORDER_STATS_ROLLUP and engine.dialect.name not in _upsert_inserts:
+        raise RuntimeError(
+            f"ORDER_STATS_ROLLUP is not supported on {engine.dialect.name}, "
+            f"supported databases: {', '.join(_upsert_inserts)}"
+        )
+
+
+async def record_orders(db: AsyncSession, orders: Iterable[Order]) -> None:
+    """把新插入的订单累加到预汇总表，调用方负责提交事务
+    
+    订单需要已经 flush（created_at 已有值）。
+    """
+    increments = defaultdict(lambda: [0, 0.0])
+    for order in orders:
+        key = (order.created_at.date(), order.user_id, order.status)
+        increments[key][0] += 1
+        increments[key][1] += order.amount or 0.0
+    if not increments:
+        return
+    
+    # 方言已在启动时由 check_rollup_support 校验
+    stmt = _upsert_inserts[db.get_bind().dialect.name](OrderDailyRollup)
+    # 冲突时在数据库中原子累加，多个 worker 并发写入同一行也不会丢失更新
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[OrderDailyRollup.day, OrderDailyRollup.user_id, OrderDailyRollup.status],
+        set_={
+            "order_count": OrderDailyRollup.order_count + stmt.excluded.order_count,
+            "total_amount": OrderDailyRollup.total_amount + stmt.excluded.total_amount,
+        },
+    )
+    await db.execute(stmt, [
+        {"day": day, "user_id": user_id, "status": status, "order_count": count, "total_amount": total}
+        for (day, user_id, status), (count, total) in increments.items()
+    ])
+
+
+async def rebuild_rollups(db: AsyncSession) -> None:
+    """从订单表全量重建预汇总表，首次开启 ORDER_STATS_ROLLUP 时使用"""
+    logger.info("Rebuilding order rollups")
+    
+    await db.execute(delete(OrderDailyRollup))
+    source = select(
+        func.date(Order.created_at),
+        Order.user_id,
+        Order.status,
+        func.count(Order.id),
+        func.coalesce(func.sum(Order.amount), 0.0),
+    ).where(
+        Order.created_at.is_not(None), Order.user_id.is_not(None), Order.status.is_not(None),
+    ).group_by(func.date(Order.created_at), Order.user_id, Order.status)
+    await db.execute(insert(OrderDailyRollup).from_select(
+        ["day", "user_id", "status", "order_count", "total_amount"], source,
+    ))
+    await db.commit()
+
+
+def _day_key(value) -> Optional[str]:
+    # SQLite 的 date() 返回字符串，PostgreSQL 返回 date
+    if value is None:
+        return None
+    return value.isoformat() if isinstance(value, date) else str(value)
+
+
+async def get_order_stats(db: AsyncSession, group_by: str, start: Optional[date] = None, end: Optional[date] = None,
+                          user_id: Optional[int] = None, status: Optional[str] = None) -> List[dict]:
+    """按 group_by 汇总订单，start/end 为包含两端的日期范围"""
+    if group_by not in GROUP_BY_FIELDS:
+        raise ValueError(f"Unsupported group_by: {group_by}")
+    use_rollup = config.ORDER_STATS_ROLLUP
+    logger.info("Computing order stats, group_by: %s, start: %s, end: %s, rollup: %s",
+                group_by, start, end, use_rollup)
+    
+    if use_rollup:
+        day = OrderDailyRollup.day
+        keys = {"user_id": OrderDailyRollup.user_id, "status": OrderDailyRollup.status, "day": day}
+        count = func.sum(OrderDailyRollup.order_count)
+        total = func.sum(OrderDailyRollup.total_amount)
+        user_column, status_column = OrderDailyRollup.user_id, OrderDailyRollup.status
+    else:
+        day = func.date(Order.created_at)
+        keys = {"user_id": Order.user_id, "status": Order.status, "day": day}
+        count = func.count(Order.id)
+        total = func.sum(Order.amount)
+        user_column, status_column = Order.user_id, Order.status
+    
+    key = keys[group_by]
+    query = select(key.label("key"), count.label("count"), total.label("total")).group_by(key).order_by(key)
+    if start is not None:
+        # 订单表直接比较 created_at，才能用上 (user_id, created_at) 索引
+        query = query.where(day >= start if use_rollup else Order.created_at >= datetime.combine(start, time.min))
+    if end is not None:
+        query = query.where(day <= end if use_rollup else Order.created_at < datetime.combine(end + timedelta(days=1), time.min))
+    if user_id is not None:
+        query = query.where(user_column == user_id)
+    if status is not None:
+        query = query.where(status_column == status)
+    
+    result = await db.execute(query)
+    stats = []
+    for row in result:
+        total_amount = float(row.total or 0.0)
+        stats.append({
+            "key": _day_key(row.key) if group_by == "day" else row.key,
+            "count": int(row.count),
+            "total": total_amount,
+            "average": total_amount / row.count if row.count else 0.0,
+        })
+    
+    logger.info("Computed %s order stats groups", len(stats))
+    return stats
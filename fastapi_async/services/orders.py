@@ -1,69 +1,212 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
 from models import User, Order
 from fastapi import HTTPException
-from typing import List, Optional
+from services import users as users_service
+from services import response_cache
+from services import order_stats
+import config
+from typing import AsyncIterator, List, Optional, Tuple
 import logging
 
 # 获取 logger
 logger = logging.getLogger(__name__)
 
+# 快速响应模式只查询接口需要的列
+ORDER_RESPONSE_COLUMNS = (Order.id, Order.user_id, Order.amount, Order.status)
+
 async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[User]:
     """获取用户，如不存在返回None"""
-    logger.info(f"Looking up user with ID: {user_id}")
+    logger.info("Looking up user with ID: %s", user_id)
     
     result = await db.execute(select(User).where(User.id == user_id))
     user = result.scalars().first()
     
     if user:
-        logger.info(f"Found user with ID: {user_id}")
+        logger.info("Found user with ID: %s", user_id)
     else:
-        logger.warning(f"User with ID: {user_id} not found")
+        logger.warning("User with ID: %s not found", user_id)
     
     return user
 
 
 async def create_order(db: AsyncSession, user_id: int, amount: float, status: str = "pending") -> Order:
     """创建订单业务逻辑"""
-    logger.info(f"Creating order for user_id: {user_id}, amount: {amount}, status: {status}")
+    logger.info("Creating order for user_id: %s, amount: %s, status: %s", user_id, amount, status)
     
-    # 检查用户是否存在
-    user = await get_user_by_id(db, user_id)
-    if not user:
-        logger.error(f"Failed to create order: User with ID {user_id} not found")
+    # 检查用户是否存在；foreign_key 模式下跳过查询，由外键约束兜底
+    check_by_lookup = config.ORDER_USER_CHECK != "foreign_key"
+    if check_by_lookup and not await users_service.user_exists(db, user_id):
+        logger.error("Failed to create order: User with ID %s not found", user_id)
         raise HTTPException(status_code=404, detail="User not found")
     
     # 创建订单
     db_order = Order(user_id=user_id, amount=amount, status=status)
     db.add(db_order)
-    await db.commit()
+    try:
+        if config.ORDER_STATS_ROLLUP:
+            # 先 flush 拿到 created_at，预汇总与订单在同一事务中提交
+            await db.flush()
+            await order_stats.record_orders(db, [db_order])
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        logger.error("Failed to create order: User with ID %s violates foreign key", user_id)
+        raise HTTPException(status_code=404, detail="User not found")
     await db.refresh(db_order)
+    users_service.remember_user(user_id)
+    # 清理可能残留的同 ID 缓存条目（例如表被清空后 ID 被复用）
+    await response_cache.invalidate(response_cache.cache_key("orders", db_order.id))
     
-    logger.info(f"Order created successfully with ID: {db_order.id}")
+    logger.info("Order created successfully with ID: %s", db_order.id)
     return db_order
 
 
-async def get_all_orders(db: AsyncSession) -> List[Order]:
-    """获取所有订单业务逻辑"""
-    logger.info("Retrieving all orders from database")
+async def _existing_user_ids(db: AsyncSession, user_ids: set, use_cache: bool = True) -> set:
+    """返回 user_ids 中存在的用户；use_cache=True 时缓存中已知的用户不再查询"""
+    existing_user_ids = {user_id for user_id in user_ids if use_cache and users_service.is_known_user(user_id)}
+    unknown_user_ids = user_ids - existing_user_ids
+    if unknown_user_ids:
+        result = await db.execute(select(User.id).where(User.id.in_(unknown_user_ids)))
+        for user_id in result.scalars().all():
+            users_service.remember_user(user_id)
+            existing_user_ids.add(user_id)
+    for user_id in unknown_user_ids - existing_user_ids:
+        users_service.forget_user(user_id)
+    return existing_user_ids
+
+
+async def create_orders_bulk(db: AsyncSession, items: List[dict],
+                             check_users: bool = True) -> List[Tuple[Optional[Order], Optional[str]]]:
+    """批量创建订单业务逻辑
+    
+    用一次 IN 查询校验所有用户，再用一条多行 INSERT ... RETURNING 在同一事务中写入。
+    返回与 items 一一对应的 (order, error)，单个用户不存在不会影响其他订单。
+    缓存中的用户已被删除导致外键冲突时，回滚后不使用缓存重新校验所有用户，再写入一次。
+    check_users=False 时跳过查询，由外键约束兜底，任何一个用户不存在都会使整条 INSERT 抛出 IntegrityError。
+    """
+    logger.info("Creating %s orders in bulk", len(items))
+    
+    user_ids = {item["user_id"] for item in items}
+    if not check_users:
+        return await _insert_orders(db, items, user_ids)
+    
+    # 一次性检查所有引用且不在缓存中的用户是否存在
+    existing_user_ids = await _existing_user_ids(db, user_ids)
+    try:
+        return await _insert_orders(db, items, existing_user_ids)
+    except IntegrityError:
+        await db.rollback()
+        logger.warning("Bulk order insert violated a foreign key, re-checking %s users without the cache", len(user_ids))
+    existing_user_ids = await _existing_user_ids(db, user_ids, use_cache=False)
+    return await _insert_orders(db, items, existing_user_ids)
+
+
+async def _insert_orders(db: AsyncSession, items: List[dict],
+                         existing_user_ids: set) -> List[Tuple[Optional[Order], Optional[str]]]:
+    """写入用户存在的订单并提交，其余订单返回 "User not found" """
+    results: List[Tuple[Optional[Order], Optional[str]]] = [(None, None)] * len(items)
+    rows = []
+    positions = []
+    for index, item in enumerate(items):
+        if item["user_id"] not in existing_user_ids:
+            results[index] = (None, "User not found")
+            continue
+        rows.append({"user_id": item["user_id"], "amount": item["amount"], "status": item.get("status", "pending")})
+        positions.append(index)
+    
+    if rows:
+        result = await db.execute(
+            insert(Order).returning(Order, sort_by_parameter_order=True),
+            rows,
+        )
+        orders = result.scalars().all()
+        if config.ORDER_STATS_ROLLUP:
+            await order_stats.record_orders(db, orders)
+        await db.commit()
+        for index, order in zip(positions, orders):
+            results[index] = (order, None)
+            users_service.remember_user(order.user_id)
+            await response_cache.invalidate(response_cache.cache_key("orders", order.id))
+    
+    logger.info("Bulk created %s orders, %s failed", len(rows), len(items) - len(rows))
+    return results
+
+
+def _filter_orders(query, after: Optional[int] = None, user_id: Optional[int] = None, status: Optional[str] = None):
+    """追加 keyset 游标和过滤条件；user_id 走 ix_orders_user_id，status=pending 走部分索引 ix_orders_pending_id"""
+    if after is not None:
+        query = query.where(Order.id > after)
+    if user_id is not None:
+        query = query.where(Order.user_id == user_id)
+    if status is not None:
+        query = query.where(Order.status == status)
+    return query
+
+
+async def get_all_orders(db: AsyncSession, limit: Optional[int] = None, after: Optional[int] = None,
+                         user_id: Optional[int] = None, status: Optional[str] = None) -> List[Order]:
+    """获取订单业务逻辑，按 Order.id 做 keyset 分页，可按用户和状态过滤"""
+    logger.info("Retrieving orders from database, limit: %s, after: %s, user_id: %s, status: %s",
+                limit, after, user_id, status)
     
-    result = await db.execute(select(Order))
+    query = _filter_orders(select(Order).order_by(Order.id), after, user_id, status)
+    if limit is not None:
+        query = query.limit(limit)
+    
+    result = await db.execute(query)
     orders = result.scalars().all()
     
-    logger.info(f"Retrieved {len(orders)} orders from database")
+    logger.info("Retrieved %s orders from database", len(orders))
     return orders
 
 
+async def get_order_rows(db: AsyncSession, limit: Optional[int] = None, after: Optional[int] = None,
+                         user_id: Optional[int] = None, status: Optional[str] = None) -> List[dict]:
+    """只查询响应需要的列，返回可直接序列化的 dict，分页和过滤方式同 get_all_orders"""
+    logger.info("Retrieving order rows from database, limit: %s, after: %s, user_id: %s, status: %s",
+                limit, after, user_id, status)
+    
+    query = _filter_orders(select(*ORDER_RESPONSE_COLUMNS).order_by(Order.id), after, user_id, status)
+    if limit is not None:
+        query = query.limit(limit)
+    
+    result = await db.execute(query)
+    rows = [dict(row) for row in result.mappings()]
+    
+    logger.info("Retrieved %s order rows from database", len(rows))
+    return rows
+
+
+async def stream_order_batches(db: AsyncSession, after: Optional[int] = None, batch_size: int = 500, as_rows: bool = False,
+                               user_id: Optional[int] = None, status: Optional[str] = None) -> AsyncIterator[list]:
+    """以服务端游标流式读取订单，每次产出一批，内存占用与结果集大小无关
+    
+    as_rows=True 时只查询响应需要的列，产出 dict 而不是 ORM 对象。
+    """
+    logger.info("Streaming orders from database, after: %s, batch_size: %s", after, batch_size)
+    
+    query = select(*ORDER_RESPONSE_COLUMNS) if as_rows else select(Order)
+    query = query.order_by(Order.id).execution_options(yield_per=batch_size)
+    query = _filter_orders(query, after, user_id, status)
+    
+    result = await db.stream(query)
+    batches = result.mappings().partitions() if as_rows else result.scalars().partitions()
+    async for batch in batches:
+        yield [dict(row) for row in batch] if as_rows else batch
+
+
 async def get_order_by_id(db: AsyncSession, order_id: int) -> Optional[Order]:
     """根据ID获取订单"""
-    logger.info(f"Looking up order with ID: {order_id}")
+    logger.info("Looking up order with ID: %s", order_id)
     
     result = await db.execute(select(Order).where(Order.id == order_id))
     order = result.scalars().first()
     
     if not order:
-        logger.error(f"Order with ID: {order_id} not found")
+        logger.error("Order with ID: %s not found", order_id)
         raise HTTPException(status_code=404, detail="Order not found")
     
-    logger.info(f"Found order with ID: {order_id}")
+    logger.info("Found order with ID: %s", order_id)
     return order 
\ No newline at end of file
@@ -0,0 +1,107 @@
+"""
+GET 响应缓存，支持 ETag / Last-Modified 条件请求。
+
+缓存条目保存已序列化的响应体，命中时不访问数据库也不做序列化；
+客户端携带匹配的 If-None-Match 时直接返回 304。
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import NamedTuple, Optional, Tuple
+from fastapi import Request, Response
+from services.cache import CacheBackend, LocalCacheBackend
+import config
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    last_modified: Optional[str]
+    # 需要随缓存一起返回的其他响应头，如分页游标 X-Next-Cursor
+    headers: Tuple[Tuple[str, str], ...] = ()
+
+
+_backend: CacheBackend = LocalCacheBackend(
+    maxsize=config.RESPONSE_CACHE_SIZE,
+    ttl=config.RESPONSE_CACHE_TTL,
+)
+
+
+def set_backend(backend: CacheBackend) -> None:
+    """替换缓存后端，例如使用 Redis 实现"""
+    global _backend
+    _backend = backend
+
+
+def cache_key(route: str, *args, **params) -> str:
+    """按路由和参数生成缓存键，如 orders:1 或 users:after=None&limit=100"""
+    parts = [str(arg) for arg in args]
+    parts.extend(f"{name}={params[name]}" for name in sorted(params))
+    return f"{route}:" + "&".join(parts)
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.blake2b("|".join(str(part) for part in parts).encode(), digest_size=16)
+    return f'W/"{digest.hexdigest()}"'
+
+
+def http_date(value: Optional[datetime]) -> Optional[str]:
+    """数据库中的时间为 UTC naive datetime，转换为 HTTP 日期格式"""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # 弱比较：忽略 W/ 前缀
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+def _validator_headers(etag: str, last_modified: Optional[str]) -> dict:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+    return headers
+
+
+def not_modified(etag: str, last_modified: Optional[str] = None) -> Response:
+    return Response(status_code=304, headers=_validator_headers(etag, last_modified))
+
+
+def to_response(request: Request, entry: CachedResponse) -> Response:
+    """根据条件请求头返回 304 或完整的缓存响应"""
+    if etag_matches(request, entry.etag):
+        return not_modified(entry.etag, entry.last_modified)
+    return Response(
+        content=entry.body,
+        media_type="application/json",
+        headers={**dict(entry.headers), **_validator_headers(entry.etag, entry.last_modified)},
+    )
+
+
+async def lookup(key: str) -> Optional[CachedResponse]:
+    return await _backend.get(key)
+
+
+async def store(key: str, entry: CachedResponse) -> None:
+    await _backend.set(key, entry)
+
+
+async def invalidate(key: str) -> None:
+    await _backend.delete(key)
+
+
+async def invalidate_prefix(prefix: str) -> None:
+    await _backend.delete_prefix(prefix)
+
+
+async def clear() -> None:
+    await _backend.clear()
@@ -0,0 +1,91 @@
+"""
+请求合并（single-flight）。
+
+同一 worker 内同时到达的相同读请求（相同的 key）只执行一次查询和序列化，
+其余请求等待第一个请求的结果并共享它（包括异常，如 404），缓存失效瞬间的并发请求不会全部打到数据库。
+只合并正在执行的调用，执行结束后立即移除，不缓存结果。
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, TypeVar
+from fastapi import Request
+from db import reads_pinned_to_primary
+import metrics
+
+# 获取 logger
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+singleflight_calls_total = metrics.Counter(
+    "singleflight_calls_total", "Calls executed by the single-flight layer", ("group",),
+)
+singleflight_coalesced_total = metrics.Counter(
+    "singleflight_coalesced_total", "Calls that waited for an identical in-flight call instead of running", ("group",),
+)
+
+_in_flight: Dict[str, asyncio.Future] = {}
+
+
+def _group(key: str) -> str:
+    # key 形如 "orders:42"，按冒号前的部分统计，避免指标标签基数失控
+    return key.split(":", 1)[0]
+
+
+def _clone_exception(error: BaseException) -> BaseException:
+    """复制异常的参数和属性，不调用 __init__（HTTPException 等的参数与 args 不一致），不复制 __traceback__"""
+    clone = type(error).__new__(type(error))
+    clone.args = error.args
+    clone.__dict__.update(error.__dict__)
+    return clone
+
+
+async def do(key: str, func: Callable[[], Awaitable[T]]) -> T:
+    """执行 func()，同一 key 已有调用在执行时等待并返回它的结果"""
+    group = _group(key)
+    while True:
+        future = _in_flight.get(key)
+        if future is None:
+            break
+        singleflight_coalesced_total.inc(group)
+        # asyncio.wait 不会在等待者被取消时取消 future，也不会抛出共享的异常对象
+        await asyncio.wait((future,))
+        if future.cancelled():
+            # 执行的请求被取消（如客户端断开），重新执行
+            logger.info("Single-flight call for %s was cancelled, retrying", key)
+            continue
+        error = future.exception()
+        if error is not None:
+            # 每个等待者抛出自己的副本，避免多次 raise 同一个对象不断追加 __traceback__
+            raise _clone_exception(error) from error
+        return future.result()
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[key] = future
+    singleflight_calls_total.inc(group)
+    try:
+        result = await func()
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # 没有等待者时避免 "exception was never retrieved" 警告
+        future.exception()
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        if _in_flight.get(key) is future:
+            del _in_flight[key]
+
+
+def read_key(request: Request, key: str) -> str:
+    """只读请求的合并 key：被固定到主库的客户端只和同样读主库的请求合并，
+    不会拿到只读副本上尚未同步到最新写入的结果"""
+    return f"{key}@primary" if reads_pinned_to_primary(request) else key
+
+
+def in_flight_count() -> int:
+    return len(_in_flight)
@@ -0,0 +1,114 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.attributes import set_committed_value
+from fastapi import HTTPException
+from models import User, Order
+from services.cache import TTLCache
+import config
+from typing import List, Optional
+import logging
+
+# 获取 logger
+logger = logging.getLogger(__name__)
+
+# 已确认存在的用户 ID，避免创建订单时每次都查询 users 表
+known_user_ids = TTLCache(maxsize=config.USER_CACHE_SIZE, ttl=config.USER_CACHE_TTL)
+
+
+def remember_user(user_id: int) -> None:
+    """记录用户存在，创建用户或查询到用户后调用"""
+    known_user_ids.set(user_id, True)
+
+
+def forget_user(user_id: int) -> None:
+    """删除或禁用用户时调用，使缓存失效"""
+    known_user_ids.delete(user_id)
+
+
+def clear_known_users() -> None:
+    known_user_ids.clear()
+
+
+def is_known_user(user_id: int) -> bool:
+    return user_id in known_user_ids
+
+
+async def user_exists(db: AsyncSession, user_id: int) -> bool:
+    """检查用户是否存在，优先使用缓存，未命中时只查询主键"""
+    if is_known_user(user_id):
+        return True
+    
+    result = await db.execute(select(User.id).where(User.id == user_id))
+    if result.scalar() is None:
+        logger.warning("User with ID: %s not found", user_id)
+        return False
+    
+    remember_user(user_id)
+    return True
+
+
+async def get_users(db: AsyncSession, limit: Optional[int] = None, after: Optional[int] = None,
+                    include_orders: bool = False) -> List[User]:
+    """按 User.id 做 keyset 分页获取用户
+    
+    include_orders=True 时用一条窗口函数查询加载本页所有用户的订单（WHERE user_id IN (...)），
+    每个用户最多 ORDERS_PER_USER 个（按 Order.id 升序），无论本页有多少用户都只需要两条查询。
+    """
+    logger.info("Retrieving users from database, limit: %s, after: %s, include_orders: %s",
+                limit, after, include_orders)
+    
+    query = select(User).order_by(User.id)
+    if after is not None:
+        query = query.where(User.id > after)
+    if limit is not None:
+        query = query.limit(limit)
+    
+    result = await db.execute(query)
+    users = result.scalars().all()
+    for user in users:
+        remember_user(user.id)
+    if include_orders:
+        await _load_orders(db, users, config.ORDERS_PER_USER)
+    
+    logger.info("Retrieved %s users from database", len(users))
+    return users
+
+
+async def _load_orders(db: AsyncSession, users: List[User], per_user: int) -> None:
+    """为每个用户加载前 per_user 个订单，写入 user.orders（不触发懒加载）"""
+    orders_by_user = {user.id: [] for user in users}
+    if orders_by_user:
+        # selectinload 无法限制每个用户的数量，用 row_number() 在数据库中截断
+        row_number = func.row_number().over(partition_by=Order.user_id, order_by=Order.id).label("row_number")
+        ranked = select(Order, row_number).where(Order.user_id.in_(orders_by_user)).subquery()
+        ranked_order = aliased(Order, ranked)
+        result = await db.execute(
+            select(ranked_order).where(ranked.c.row_number <= per_user).order_by(ranked.c.user_id, ranked.c.id)
+        )
+        for order in result.scalars():
+            orders_by_user[order.user_id].append(order)
+    for user in users:
+        set_committed_value(user, "orders", orders_by_user[user.id])
+
+
+async def get_user_orders(db: AsyncSession, user_id: int, limit: Optional[int] = None,
+                          after: Optional[int] = None) -> List[Order]:
+    """获取某个用户的订单，按 Order.id 做 keyset 分页；用户不存在时返回 404"""
+    logger.info("Retrieving orders for user_id: %s, limit: %s, after: %s", user_id, limit, after)
+    
+    if not await user_exists(db, user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    # 使用 ix_orders_user_id 索引
+    query = select(Order).where(Order.user_id == user_id).order_by(Order.id)
+    if after is not None:
+        query = query.where(Order.id > after)
+    if limit is not None:
+        query = query.limit(limit)
+    
+    result = await db.execute(query)
+    orders = result.scalars().all()
+    
+    logger.info("Retrieved %s orders for user_id: %s", len(orders), user_id)
+    return orders
@@ -13,7 +13,9 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from app import app
-from db import Base, get_session
+from db import Base, get_session, get_session_factory, get_read_session, get_read_session_factory
+from services import users as users_service
+from services import response_cache
 
 # Use an in-memory SQLite database for testing
 TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
@@ -30,12 +32,19 @@ def override_get_session():
             yield session
     
     app.dependency_overrides[get_session] = _override_get_session
+    app.dependency_overrides[get_read_session] = _override_get_session
+    app.dependency_overrides[get_session_factory] = lambda: TestingSessionLocal
+    app.dependency_overrides[get_read_session_factory] = lambda: TestingSessionLocal
     yield
     app.dependency_overrides.clear()
 
 
 @pytest_asyncio.fixture(scope="function")
 async def setup_database():
+    # 每个测试都会重建表，ID 会被复用，先清理进程内缓存
+    users_service.clear_known_users()
+    await response_cache.clear()
+    
     # Create tables
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
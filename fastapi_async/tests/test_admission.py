@@ -0,0 +1,89 @@
+import asyncio
+import pytest
+
+import admission
+import config
+
+
+@pytest.fixture
+def limits():
+    """按测试配置上限，结束后恢复"""
+    def _configure(value):
+        admission.configure(admission.parse_limits(value))
+    yield _configure
+    admission.configure(admission.parse_limits(config.ADMISSION_LIMITS))
+
+
+def test_parse_limits():
+    assert admission.parse_limits("POST /orders/=20, GET  /orders/{order_id}=100,*=200,bad") == {
+        "POST /orders/": 20,
+        "GET /orders/{order_id}": 100,
+        "*": 200,
+    }
+
+
+class TestRouteLimiter:
+    @pytest.mark.asyncio
+    async def test_queue_and_reject(self):
+        limiter = admission.RouteLimiter("GET /orders/", 1, queue_size=1)
+        assert await limiter.acquire(1.0) is None
+
+        # 第二个请求排队，第三个请求队列已满直接拒绝
+        waiter = asyncio.create_task(limiter.acquire(1.0))
+        await asyncio.sleep(0)
+        assert limiter.queued == 1
+        assert await limiter.acquire(1.0) == "queue_full"
+
+        # 释放名额后转交给排队的请求
+        limiter.release()
+        assert await waiter is None
+        assert limiter.in_flight == 1
+        assert limiter.queued == 0
+
+        # 排队超时
+        assert await limiter.acquire(0.01) == "timeout"
+        assert limiter.queued == 0
+        limiter.release()
+        assert limiter.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_adaptive_limit(self, monkeypatch):
+        monkeypatch.setattr(config, "ADMISSION_TARGET_LATENCY_MS", 100.0)
+        monkeypatch.setattr(config, "ADMISSION_MIN_LIMIT", 2)
+        limiter = admission.RouteLimiter("POST /orders/", 10, queue_size=0)
+
+        # 慢请求乘性减小，每个间隔最多一次
+        limiter.in_flight = 2
+        limiter.release(0.5)
+        limiter.release(0.5)
+        assert int(limiter.limit) == 9
+
+        # 快请求加性增大，不超过配置值
+        for _ in range(100):
+            limiter.in_flight = 1
+            limiter.release(0.01)
+        assert limiter.limit == 10
+
+
+@pytest.mark.asyncio
+async def test_rejects_with_retry_after(async_client, limits, monkeypatch):
+    monkeypatch.setattr(config, "ADMISSION_QUEUE_SIZE", 0)
+    limits("GET /orders/{order_id}=1")
+    # 先创建限流器并占用唯一的名额
+    await async_client.get("/orders/1")
+    limiter = admission._limiters["GET /orders/{order_id}"]
+    assert await limiter.acquire(1.0) is None
+
+    response = await async_client.get("/orders/1")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(config.ADMISSION_RETRY_AFTER)
+    assert "X-Request-ID" in response.headers
+    assert admission.admission_rejected_total.get("GET /orders/{order_id}", "queue_full") >= 1
+
+    # 其他路由和豁免路径不受影响
+    assert (await async_client.get("/orders/")).status_code == 200
+    assert (await async_client.get("/ping")).status_code == 200
+
+    limiter.release()
+    assert (await async_client.get("/orders/1")).status_code == 404
+    assert (await async_client.get("/debug/admission")).json()["GET /orders/{order_id}"]["in_flight"] == 0
@@ -1,5 +1,6 @@
 import pytest
 import asyncio
+import logging
 from sqlalchemy import select, delete
 import pytest_asyncio
 
@@ -9,7 +10,12 @@ import os
 # Add the parent directory to sys.path to allow importing app modules
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from app import app
 from models import User, Order
+import executors
+import warmup
 
 
 @pytest.mark.asyncio
@@ -69,3 +75,134 @@ async def test_get_users(async_client, setup_database):
     assert data[0]["username"] == "user1"
     assert data[1]["username"] == "user2"
 
+
+@pytest.mark.asyncio
+async def test_debug_pool(async_client):
+    response = await async_client.get("/debug/pool")
+    assert response.status_code == 200
+    
+    data = response.json()
+    assert data["write"]["checked_out"] == 0
+    assert "wait_time_max" in data["write"]
+
+
+@pytest.mark.asyncio
+async def test_request_id_header(async_client, caplog):
+    first = await async_client.get("/ping")
+    second = await async_client.get("/ping")
+    
+    request_id = first.headers["X-Request-ID"]
+    assert request_id != second.headers["X-Request-ID"]
+    
+    # 处理函数中的日志带有同一个请求 ID
+    ping_records = [r for r in caplog.records if r.getMessage() == "Ping request received"]
+    assert ping_records[0].request_id == request_id
+
+
+@pytest.mark.asyncio
+async def test_request_id_header_on_error(async_client):
+    response = await async_client.get("/orders/9999")
+    assert response.status_code == 404
+    assert "X-Request-ID" in response.headers
+
+
+@pytest.mark.asyncio
+async def test_ready_after_warm_up(async_client, test_session, monkeypatch):
+    monkeypatch.setattr(warmup.config, "WARMUP_CONNECTIONS", 2)
+    await executors.stop()
+    executors.start(kind="thread", workers=2)
+    warmup.reset()
+    try:
+        # 预热完成前不接收流量
+        response = await async_client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["ready"] is False
+
+        engine = test_session.bind
+        factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        assert await warmup.warm_up(app, [engine], [factory]) is True
+        # 服务查询已进入引擎的编译语句缓存，OpenAPI 文档已生成
+        assert len(engine.sync_engine._compiled_cache) > 0
+        assert app.openapi_schema is not None
+
+        response = await async_client.get("/ready")
+        assert response.status_code == 200
+        assert response.json()["ready"] is True
+        assert response.json()["attempts"] == 1
+    finally:
+        warmup.reset()
+        await executors.stop()
+
+
+@pytest.mark.asyncio
+async def test_warm_statements_log_no_warnings(test_session, caplog):
+    """测试预热查询不会记录 "not found" 之类看起来像故障的警告和错误"""
+    factory = sessionmaker(test_session.bind, class_=AsyncSession, expire_on_commit=False)
+    with caplog.at_level(logging.INFO):
+        await warmup.warm_statements(factory)
+    assert [record.getMessage() for record in caplog.records if record.levelno >= logging.WARNING] == []
+
+
+@pytest.mark.asyncio
+async def test_warm_up_failure_reported(async_client, monkeypatch):
+    async def failing_connect():
+        raise ConnectionRefusedError("database unavailable")
+
+    class BrokenEngine:
+        connect = staticmethod(failing_connect)
+        sync_engine = type("SyncEngine", (), {"pool": None})()
+
+    warmup.reset()
+    try:
+        assert await warmup.warm_up(app, [BrokenEngine()], []) is False
+        response = await async_client.get("/ready")
+        assert response.status_code == 503
+        assert "database unavailable" in response.json()["last_error"]
+    finally:
+        warmup.reset()
+
+
+@pytest.mark.asyncio
+async def test_sigterm_marks_not_ready_before_exit(async_client):
+    warmup.reset()
+    warmup._state["ready"] = True
+    exits = []
+    handler = warmup._make_sigterm_handler(lambda signum, frame: exits.append(signum), 0.05,
+                                           asyncio.get_running_loop())
+    try:
+        handler(15, None)
+        # 延迟期间仍然处理请求，但就绪检查返回 503
+        response = await async_client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["draining"] is True
+        assert (await async_client.get("/ping")).status_code == 200
+        assert exits == []
+
+        await asyncio.sleep(0.1)
+        assert exits == [15]
+
+        # 第二次信号立即交给原来的处理函数
+        handler(15, None)
+        assert exits == [15, 15]
+    finally:
+        warmup.reset()
+
+
+def test_available_cpus_respects_container_limit(monkeypatch):
+    """测试默认 worker 数取 CPU 亲和性与 cgroup 配额中较小的一个，而不是宿主机核数"""
+    import config
+    import server
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: set(range(64)), raising=False)
+
+    monkeypatch.setattr(config, "_cgroup_cpu_limit", lambda: 1.5)
+    assert server.worker_count() == 2
+
+    monkeypatch.setattr(config, "_cgroup_cpu_limit", lambda: None)
+    assert server.worker_count() == 64
+
+    monkeypatch.setattr(config, "_cgroup_cpu_limit", lambda: 0.2)
+    assert config.available_cpus() == 1
+
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    assert server.worker_count() == 3
@@ -0,0 +1,129 @@
+import time
+
+import pytest
+from fastapi import Depends, FastAPI, Request, Response
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import config
+import db
+from db import InstrumentedAsyncPool, create_engine_from_settings, pool_status
+
+
+class TestEngineFactory:
+    """引擎工厂与连接池指标测试类"""
+    
+    @pytest.mark.asyncio
+    async def test_postgres_engine_uses_pool_settings(self, monkeypatch):
+        """测试 PostgreSQL 引擎使用配置中的连接池参数"""
+        monkeypatch.setattr(config, "DB_POOL_SIZE", 7)
+        monkeypatch.setattr(config, "DB_MAX_OVERFLOW", 3)
+        monkeypatch.setattr(config, "DB_STATEMENT_CACHE_SIZE", 0)
+        
+        engine = create_engine_from_settings("postgresql+asyncpg://localhost:5432/fastapi")
+        try:
+            pool = engine.sync_engine.pool
+            assert isinstance(pool, InstrumentedAsyncPool)
+            assert pool.size() == 7
+            assert engine.url.query["prepared_statement_cache_size"] == "0"
+            
+            status = pool_status(engine)
+            assert status["checked_out"] == 0
+            assert status["wait_count"] == 0
+        finally:
+            await engine.dispose()
+    
+    @pytest.mark.asyncio
+    async def test_sqlite_engine_skips_pool_settings(self):
+        """测试 SQLite 引擎保留默认连接池"""
+        engine = create_engine_from_settings("sqlite+aiosqlite:///:memory:")
+        try:
+            assert isinstance(engine.sync_engine.pool, StaticPool)
+            assert pool_status(engine) == {"pool": "StaticPool"}
+        finally:
+            await engine.dispose()
+
+
+def _make_request(cookies=None):
+    headers = []
+    if cookies:
+        cookie_header = "; ".join(f"{key}={value}" for key, value in cookies.items())
+        headers.append((b"cookie", cookie_header.encode()))
+    return Request({"type": "http", "headers": headers})
+
+
+@pytest.fixture
+def replicas(monkeypatch):
+    """模拟配置了两个只读副本"""
+    read_engines = [
+        create_engine_from_settings("postgresql+asyncpg://replica1:5432/fastapi"),
+        create_engine_from_settings("postgresql+asyncpg://replica2:5432/fastapi"),
+    ]
+    factories = [sessionmaker(e, class_=AsyncSession) for e in read_engines]
+    monkeypatch.setattr(db, "read_engines", read_engines)
+    monkeypatch.setattr(db, "read_session_factories", factories)
+    return factories
+
+
+class TestReadRouting:
+    """只读副本路由测试类"""
+    
+    def test_without_replicas_uses_primary(self):
+        """测试未配置副本时读请求走主库"""
+        assert db.choose_read_session_factory(_make_request()) is db.async_session
+    
+    def test_round_robin(self, replicas, monkeypatch):
+        """测试轮询选择副本"""
+        monkeypatch.setattr(config, "DB_READ_STRATEGY", "round_robin")
+        chosen = [db.choose_read_session_factory(_make_request()) for _ in range(4)]
+        assert set(chosen) == set(replicas)
+        assert chosen[0] is chosen[2] and chosen[1] is chosen[3]
+    
+    def test_least_connections(self, replicas, monkeypatch):
+        """测试选择签出连接最少的副本"""
+        monkeypatch.setattr(config, "DB_READ_STRATEGY", "least_connections")
+        monkeypatch.setattr(db.read_engines[0].sync_engine.pool, "checkedout", lambda: 3)
+        monkeypatch.setattr(db.read_engines[1].sync_engine.pool, "checkedout", lambda: 1)
+        assert db.choose_read_session_factory(_make_request()) is replicas[1]
+    
+    def test_recent_write_pins_to_primary(self, replicas):
+        """测试刚写入过的客户端读请求走主库"""
+        request = _make_request({db.READ_PRIMARY_COOKIE: str(time.time() + 5)})
+        assert db.choose_read_session_factory(request) is db.async_session
+        
+        expired = _make_request({db.READ_PRIMARY_COOKIE: str(time.time() - 1)})
+        assert db.choose_read_session_factory(expired) in replicas
+    
+    @pytest.mark.asyncio
+    async def test_commit_sets_read_primary_cookie(self, replicas, monkeypatch):
+        """测试写会话提交后设置 read-your-writes cookie"""
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        monkeypatch.setattr(db, "async_session", sessionmaker(engine, class_=AsyncSession))
+        
+        response = Response()
+        sessions = db.get_session(response)
+        session = await anext(sessions)
+        await session.commit()
+        await sessions.aclose()
+        await engine.dispose()
+        
+        assert db.READ_PRIMARY_COOKIE in response.headers["set-cookie"]
+    
+    @pytest.mark.asyncio
+    async def test_one_replica_per_request(self, replicas, monkeypatch):
+        """测试同一请求的只读会话和会话工厂使用同一个副本，轮询覆盖所有副本（不使用 dependency_overrides）"""
+        monkeypatch.setattr(config, "DB_READ_STRATEGY", "round_robin")
+        app = FastAPI()
+        
+        @app.get("/replica")
+        async def replica(session: AsyncSession = Depends(db.get_read_session),
+                          session_factory = Depends(db.get_read_session_factory)):
+            return [db.read_engines.index(session.bind), replicas.index(session_factory)]
+        
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            chosen = [(await client.get("/replica")).json() for _ in range(4)]
+        
+        assert all(session_index == factory_index for session_index, factory_index in chosen)
+        assert {session_index for session_index, _ in chosen} == {0, 1}
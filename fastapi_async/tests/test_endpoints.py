@@ -1,6 +1,11 @@
+import asyncio
+import json
 import pytest
 from fastapi.testclient import TestClient
+import config
 from models import User, Order
+from services import orders as orders_service
+from services import singleflight
 
 
 class TestOrderEndpoints:
@@ -42,6 +47,32 @@ class TestOrderEndpoints:
         assert response.status_code == 404
         assert response.json()["detail"] == "User not found"
     
+    @pytest.mark.asyncio
+    async def test_create_orders_bulk(self, async_client, setup_database, test_session):
+        """测试批量创建订单 API，用户不存在的条目单独报错"""
+        user = User(username="testuser", email="test@example.com", hashed_password="testpass")
+        test_session.add(user)
+        await test_session.commit()
+        await test_session.refresh(user)
+        
+        payload = {"orders": [
+            {"user_id": user.id, "amount": 10.0},
+            {"user_id": 9999, "amount": 20.0},
+            {"user_id": user.id, "amount": 30.0, "status": "completed"},
+        ]}
+        
+        response = await async_client.post("/orders/bulk", json=payload)
+        assert response.status_code == 200
+        
+        data = response.json()
+        assert data["created"] == 2
+        assert data["failed"] == 1
+        assert data["results"][0]["order"]["amount"] == 10.0
+        assert data["results"][1]["order"] is None
+        assert data["results"][1]["error"] == "User not found"
+        assert data["results"][2]["order"]["status"] == "completed"
+        assert data["results"][0]["order"]["id"] != data["results"][2]["order"]["id"]
+    
     @pytest.mark.asyncio
     async def test_get_orders(self, async_client, setup_database, test_session):
         """测试获取所有订单 API"""
@@ -68,6 +99,29 @@ class TestOrderEndpoints:
         assert data[0]["amount"] == 10.99
         assert data[1]["amount"] == 20.99
     
+    @pytest.mark.asyncio
+    async def test_get_orders_fast_json(self, async_client, setup_database, test_session, monkeypatch):
+        """测试快速响应模式与默认模式返回相同的内容"""
+        user = User(username="testuser", email="test@example.com", hashed_password="testpass")
+        test_session.add(user)
+        await test_session.commit()
+        await test_session.refresh(user)
+        
+        test_session.add_all([Order(user_id=user.id, amount=float(i), status="pending") for i in range(3)])
+        await test_session.commit()
+        
+        default_page = await async_client.get("/orders/", params={"limit": 2})
+        default_stream = await async_client.get("/orders/", params={"stream": True})
+        
+        monkeypatch.setattr(config, "FAST_JSON", True)
+        fast_page = await async_client.get("/orders/", params={"limit": 2})
+        fast_stream = await async_client.get("/orders/", params={"stream": True})
+        
+        assert fast_page.json() == default_page.json()
+        assert fast_page.headers["X-Next-Cursor"] == default_page.headers["X-Next-Cursor"]
+        assert [json.loads(line) for line in fast_stream.text.splitlines()] == \
+            [json.loads(line) for line in default_stream.text.splitlines()]
+    
     @pytest.mark.asyncio
     async def test_get_order_by_id(self, async_client, setup_database, test_session):
         """测试通过 ID 获取订单 API"""
@@ -92,9 +146,274 @@ class TestOrderEndpoints:
         assert data["amount"] == 99.99
         assert data["status"] == "processing"
     
+    @pytest.mark.asyncio
+    async def test_get_order_by_id_etag(self, async_client, setup_database, test_session):
+        """测试订单响应带 ETag，If-None-Match 命中时返回 304"""
+        user = User(username="testuser", email="test@example.com", hashed_password="testpass")
+        test_session.add(user)
+        await test_session.commit()
+        await test_session.refresh(user)
+        
+        order = Order(user_id=user.id, amount=99.99, status="processing")
+        test_session.add(order)
+        await test_session.commit()
+        await test_session.refresh(order)
+        
+        response = await async_client.get(f"/orders/{order.id}")
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+        assert "Last-Modified" in response.headers
+        
+        # 第二次请求命中缓存，返回相同的内容
+        cached = await async_client.get(f"/orders/{order.id}")
+        assert cached.json() == response.json()
+        assert cached.headers["ETag"] == etag
+        
+        response = await async_client.get(f"/orders/{order.id}", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+    
+    @pytest.mark.asyncio
+    async def test_get_order_pinned_to_primary_skips_cache(self, async_client, setup_database, test_session, monkeypatch):
+        """测试刚写入过的客户端不读也不写响应缓存（其他 worker 的缓存可能是写入前的结果）"""
+        import time
+        import db
+        user = User(username="testuser", email="test@example.com", hashed_password="testpass")
+        test_session.add(user)
+        await test_session.commit()
+        order = Order(user_id=user.id, amount=1.0, status="pending")
+        test_session.add(order)
+        await test_session.commit()
+        
+        await async_client.get(f"/orders/{order.id}")
+        # 模拟另一个 worker 写入：本 worker 的缓存没有被清理
+        order.amount = 2.0
+        await test_session.commit()
+        
+        monkeypatch.setattr(db, "read_engines", [object()])
+        pinned = {"cookie": f"{db.READ_PRIMARY_COOKIE}={time.time() + 60}"}
+        assert (await async_client.get(f"/orders/{order.id}", headers=pinned)).json()["amount"] == 2.0
+        # 固定到主库的读取不会覆盖缓存，其他客户端在缓存过期前仍读到缓存内容
+        assert (await async_client.get(f"/orders/{order.id}")).json()["amount"] == 1.0
+    
     @pytest.mark.asyncio
     async def test_get_order_by_id_nonexistent(self, async_client, setup_database):
         """测试通过不存在的 ID 获取订单 API"""
         response = await async_client.get("/orders/9999")
         assert response.status_code == 404
-        assert response.json()["detail"] == "Order not found" 
\ No newline at end of file
+        assert response.json()["detail"] == "Order not found"     
+    @pytest.mark.asyncio
+    async def test_get_orders_paginated(self, async_client, setup_database, test_session):
+        """测试 keyset 分页获取订单 API"""
+        user = User(username="testuser", email="test@example.com", hashed_password="testpass")
+        test_session.add(user)
+        await test_session.commit()
+        await test_session.refresh(user)
+        
+        test_session.add_all([Order(user_id=user.id, amount=float(i), status="pending") for i in range(5)])
+        await test_session.commit()
+        
+        # 第一页
+        response = await async_client.get("/orders/", params={"limit": 2})
+        assert response.status_code == 200
+        assert [o["amount"] for o in response.json()] == [0.0, 1.0]
+        cursor = response.headers["X-Next-Cursor"]
+        
+        # 第二页
+        response = await async_client.get("/orders/", params={"limit": 2, "after": cursor})
+        assert [o["amount"] for o in response.json()] == [2.0, 3.0]
+        cursor = response.headers["X-Next-Cursor"]
+        
+        # 最后一页没有下一页游标
+        response = await async_client.get("/orders/", params={"limit": 2, "after": cursor})
+        assert [o["amount"] for o in response.json()] == [4.0]
+        assert "X-Next-Cursor" not in response.headers
+    
+    @pytest.mark.asyncio
+    async def test_get_orders_stream(self, async_client, setup_database, test_session):
+        """测试以 NDJSON 流式获取订单 API"""
+        user = User(username="testuser", email="test@example.com", hashed_password="testpass")
+        test_session.add(user)
+        await test_session.commit()
+        await test_session.refresh(user)
+        
+        test_session.add_all([Order(user_id=user.id, amount=float(i), status="pending") for i in range(3)])
+        await test_session.commit()
+        
+        response = await async_client.get("/orders/", params={"stream": True})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [o["amount"] for o in lines] == [0.0, 1.0, 2.0]
+    
+    @pytest.mark.asyncio
+    async def test_get_orders_filtered(self, async_client, setup_database, test_session):
+        """测试按用户和状态过滤订单 API"""
+        users = [User(username=f"user{i}", email=f"user{i}@example.com", hashed_password="pass") for i in range(2)]
+        test_session.add_all(users)
+        await test_session.flush()
+        test_session.add_all([
+            Order(user_id=users[0].id, amount=1.0, status="pending"),
+            Order(user_id=users[1].id, amount=2.0, status="pending"),
+            Order(user_id=users[0].id, amount=3.0, status="completed"),
+        ])
+        await test_session.commit()
+        
+        response = await async_client.get("/orders/", params={"user_id": users[0].id})
+        assert [o["amount"] for o in response.json()] == [1.0, 3.0]
+        
+        response = await async_client.get("/orders/", params={"status": "pending"})
+        assert [o["amount"] for o in response.json()] == [1.0, 2.0]
+        
+        response = await async_client.get("/orders/", params={"user_id": users[0].id, "status": "pending", "stream": True})
+        assert [json.loads(line)["amount"] for line in response.text.splitlines()] == [1.0]
+    
+    @pytest.mark.asyncio
+    async def test_get_order_stats(self, async_client, setup_database, test_session):
+        """测试订单统计 API"""
+        user = User(username="testuser", email="test@example.com", hashed_password="testpass")
+        test_session.add(user)
+        await test_session.flush()
+        test_session.add_all([
+            Order(user_id=user.id, amount=10.0, status="pending"),
+            Order(user_id=user.id, amount=30.0, status="pending"),
+            Order(user_id=user.id, amount=5.0, status="completed"),
+        ])
+        await test_session.commit()
+        
+        response = await async_client.get("/orders/stats", params={"group_by": "status"})
+        assert response.status_code == 200
+        assert response.json() == [
+            {"key": "completed", "count": 1, "total": 5.0, "average": 5.0},
+            {"key": "pending", "count": 2, "total": 40.0, "average": 20.0},
+        ]
+        
+        response = await async_client.get("/orders/stats", params={"group_by": "user_id"})
+        assert response.json() == [{"key": user.id, "count": 3, "total": 45.0, "average": 15.0}]
+        
+        response = await async_client.get("/orders/stats", params={"group_by": "amount"})
+        assert response.status_code == 422
+
+
+    @pytest.mark.asyncio
+    async def test_get_order_coalesces_concurrent_requests(self, async_client, setup_database, test_session, monkeypatch):
+        """缓存未命中时并发请求同一订单只查询一次"""
+        user = User(username="testuser", email="test@example.com", hashed_password="testpass")
+        test_session.add(user)
+        await test_session.commit()
+        order = Order(user_id=user.id, amount=10.0, status="pending")
+        test_session.add(order)
+        await test_session.commit()
+        
+        calls = []
+        get_order_by_id = orders_service.get_order_by_id
+        
+        async def slow_get_order_by_id(db, order_id):
+            calls.append(order_id)
+            await asyncio.sleep(0.05)
+            return await get_order_by_id(db, order_id)
+        
+        monkeypatch.setattr(orders_service, "get_order_by_id", slow_get_order_by_id)
+        coalesced = singleflight.singleflight_coalesced_total.get("orders")
+        
+        responses = await asyncio.gather(*(async_client.get(f"/orders/{order.id}") for _ in range(5)))
+        assert [r.status_code for r in responses] == [200] * 5
+        assert len({r.headers["ETag"] for r in responses}) == 1
+        assert calls == [order.id]
+        assert singleflight.singleflight_coalesced_total.get("orders") - coalesced == 4
+    
+
+class TestUserEndpoints:
+    """用户 API 端点测试类"""
+    
+    @pytest.mark.asyncio
+    async def test_get_users_etag_invalidated_on_create(self, async_client, setup_database):
+        """测试用户列表缓存在创建用户后失效"""
+        await async_client.post("/users/", json={"username": "user1", "email": "user1@example.com", "password": "pass1"})
+        
+        response = await async_client.get("/users/")
+        etag = response.headers["ETag"]
+        
+        response = await async_client.get("/users/", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        
+        await async_client.post("/users/", json={"username": "user2", "email": "user2@example.com", "password": "pass2"})
+        
+        response = await async_client.get("/users/", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert len(response.json()) == 2
+        assert response.headers["ETag"] != etag
+    
+    @pytest.mark.asyncio
+    async def test_get_users_pagination(self, async_client, setup_database):
+        """测试用户列表分页"""
+        for i in range(3):
+            await async_client.post("/users/", json={"username": f"user{i}", "email": f"user{i}@example.com", "password": "pass"})
+        
+        response = await async_client.get("/users/", params={"limit": 2})
+        assert [user["username"] for user in response.json()] == ["user0", "user1"]
+        cursor = response.headers["X-Next-Cursor"]
+        
+        # 缓存命中时分页游标同样返回
+        response = await async_client.get("/users/", params={"limit": 2})
+        assert response.headers["X-Next-Cursor"] == cursor
+        
+        response = await async_client.get("/users/", params={"limit": 2, "after": cursor})
+        assert [user["username"] for user in response.json()] == ["user2"]
+        assert "X-Next-Cursor" not in response.headers
+    
+    @pytest.mark.asyncio
+    async def test_create_user_duplicate(self, async_client, setup_database):
+        """测试用户名或邮箱重复时返回 409（与 flask_sync 一致），而不是未处理的 IntegrityError"""
+        payload = {"username": "user1", "email": "user1@example.com", "password": "pass1"}
+        assert (await async_client.post("/users/", json=payload)).status_code == 200
+        
+        response = await async_client.post("/users/", json={**payload, "email": "other@example.com"})
+        assert response.status_code == 409
+        assert response.json() == {"detail": "Username or email already registered"}
+    
+    @pytest.mark.asyncio
+    async def test_get_users_include_orders(self, async_client, setup_database):
+        """测试 include=orders 同时返回用户的订单，并随新订单更新"""
+        response = await async_client.post("/users/", json={"username": "user1", "email": "user1@example.com", "password": "pass1"})
+        user_id = response.json()["id"]
+        await async_client.post("/users/", json={"username": "user2", "email": "user2@example.com", "password": "pass2"})
+        await async_client.post("/orders/", json={"user_id": user_id, "amount": 10.0})
+        
+        response = await async_client.get("/users/", params={"include": "orders"})
+        assert response.status_code == 200
+        data = response.json()
+        assert [len(user["orders"]) for user in data] == [1, 0]
+        assert data[0]["orders"][0]["amount"] == 10.0
+        etag = response.headers["ETag"]
+        
+        await async_client.post("/orders/", json={"user_id": user_id, "amount": 20.0})
+        response = await async_client.get("/users/", params={"include": "orders"}, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert len(response.json()[0]["orders"]) == 2
+        
+        # 不带 include 时不返回订单
+        response = await async_client.get("/users/")
+        assert "orders" not in response.json()[0]
+        
+        response = await async_client.get("/users/", params={"include": "invalid"})
+        assert response.status_code == 422
+    
+    @pytest.mark.asyncio
+    async def test_get_user_orders(self, async_client, setup_database):
+        """测试分页获取某个用户的订单"""
+        response = await async_client.post("/users/", json={"username": "user1", "email": "user1@example.com", "password": "pass1"})
+        user_id = response.json()["id"]
+        for amount in (1.0, 2.0, 3.0):
+            await async_client.post("/orders/", json={"user_id": user_id, "amount": amount})
+        
+        response = await async_client.get(f"/users/{user_id}/orders", params={"limit": 2})
+        assert response.status_code == 200
+        assert [order["amount"] for order in response.json()] == [1.0, 2.0]
+        
+        response = await async_client.get(f"/users/{user_id}/orders", params={"after": response.headers["X-Next-Cursor"]})
+        assert [order["amount"] for order in response.json()] == [3.0]
+        
+        response = await async_client.get("/users/9999/orders")
+        assert response.status_code == 404
@@ -0,0 +1,62 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+
+import config
+import executors
+import security
+from models import User
+
+
+@pytest_asyncio.fixture
+async def thread_executor():
+    """使用小线程池，避免在测试中启动进程"""
+    await executors.stop()
+    executors.start(kind="thread", workers=2)
+    yield
+    await executors.stop()
+
+
+class TestSecurity:
+    """密码哈希测试类"""
+    
+    def test_hash_and_verify(self, monkeypatch):
+        monkeypatch.setattr(config, "SCRYPT_N", 2 ** 10)
+        hashed = security.hash_password("secret")
+        assert hashed.startswith("scrypt$1024$")
+        assert "secret" not in hashed
+        assert security.verify_password("secret", hashed)
+        assert not security.verify_password("wrong", hashed)
+        # 每次使用不同的盐
+        assert security.hash_password("secret") != hashed
+    
+    def test_verify_rejects_malformed_hash(self):
+        assert not security.verify_password("secret", "secret")
+
+
+class TestExecutors:
+    """CPU 执行器测试类"""
+    
+    @pytest.mark.asyncio
+    async def test_run_cpu_bound(self, thread_executor):
+        """测试任务在执行器中运行并更新统计"""
+        before = executors.executor_tasks_total.get()
+        assert await executors.run_cpu_bound(sum, [1, 2, 3]) == 6
+        assert executors.executor_tasks_total.get() == before + 1
+        
+        stats = executors.get_executor_stats()
+        assert stats["kind"] == "ThreadPoolExecutor"
+        assert stats["in_flight"] == 0
+        assert stats["queue_depth"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_create_user_hashes_password(self, async_client, test_session, thread_executor, monkeypatch):
+        """测试创建用户时保存的是密码哈希"""
+        monkeypatch.setattr(config, "SCRYPT_N", 2 ** 10)
+        response = await async_client.post("/users/", json={"username": "user1", "email": "user1@example.com", "password": "pass1"})
+        assert response.status_code == 200
+        
+        result = await test_session.execute(select(User.hashed_password).where(User.id == response.json()["id"]))
+        hashed = result.scalar()
+        assert hashed != "pass1"
+        assert security.verify_password("pass1", hashed)
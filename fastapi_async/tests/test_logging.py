@@ -0,0 +1,151 @@
+import io
+import json
+import logging
+import queue
+
+import pytest
+
+from context import (
+    AsyncQueueHandler,
+    BatchStreamHandler,
+    BatchingQueueListener,
+    JsonFormatter,
+    RequestIdFilter,
+    RequestIdFormatter,
+    SamplingFilter,
+    configure_sampling,
+    log_sampled_var,
+    parse_sample_rates,
+    request_id_var,
+    request_method_var,
+    request_path_var,
+    sample_request,
+)
+
+
+def _make_logger(log_queue):
+    handler = AsyncQueueHandler(log_queue)
+    handler.addFilter(RequestIdFilter())
+    logger = logging.getLogger("tests.async_logging")
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger, handler
+
+
+class TestAsyncLogging:
+    """异步日志管道测试类"""
+    
+    def test_records_written_with_request_id(self):
+        """测试后台线程写出的日志带有入队时的 request_id"""
+        stream = io.StringIO()
+        stream_handler = BatchStreamHandler(stream)
+        stream_handler.setFormatter(RequestIdFormatter("[%(request_id)s] %(message)s"))
+        
+        log_queue = queue.Queue(maxsize=100)
+        logger, _ = _make_logger(log_queue)
+        listener = BatchingQueueListener(log_queue, stream_handler, batch_size=10)
+        listener.start()
+        
+        token = request_id_var.set("req-1")
+        try:
+            logger.info("order %s created", 42)
+        finally:
+            request_id_var.reset(token)
+        logger.info("outside request")
+        listener.stop()
+        
+        assert stream.getvalue().splitlines() == [
+            "[req-1] order 42 created",
+            "[undefined] outside request",
+        ]
+    
+    def test_full_queue_drops_records(self):
+        """测试队列已满时丢弃日志并计数，而不是阻塞"""
+        log_queue = queue.Queue(maxsize=2)
+        logger, handler = _make_logger(log_queue)
+        
+        for i in range(5):
+            logger.info("message %s", i)
+        
+        assert log_queue.qsize() == 2
+        assert handler.dropped == 3
+    
+    def test_message_args_are_snapshotted(self):
+        """测试入队时固定消息内容，之后修改参数不影响日志"""
+        log_queue = queue.Queue(maxsize=10)
+        logger, _ = _make_logger(log_queue)
+        
+        items = [1]
+        logger.info("items: %s", items)
+        items.append(2)
+        
+        assert log_queue.get_nowait().getMessage() == "items: [1]"
+
+
+def _make_record(name="tests", level=logging.INFO, **extra):
+    record = logging.LogRecord(name, level, __file__, 1, "hello %s", ("world",), None)
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+
+@pytest.fixture
+def sampling():
+    """测试结束后清除采样配置"""
+    yield configure_sampling
+    configure_sampling({})
+
+
+class TestStructuredLogging:
+    """结构化日志与采样测试类"""
+    
+    def test_json_formatter(self):
+        """测试 JSON 格式包含请求字段"""
+        method_token = request_method_var.set("GET")
+        path_token = request_path_var.set("/orders/1")
+        try:
+            record = _make_record(duration=0.0123, status=200)
+            RequestIdFilter().filter(record)
+        finally:
+            request_method_var.reset(method_token)
+            request_path_var.reset(path_token)
+        
+        entry = json.loads(JsonFormatter().format(record))
+        assert entry["message"] == "hello world"
+        assert entry["level"] == "INFO"
+        assert entry["request_id"] == "undefined"
+        assert entry["method"] == "GET"
+        assert entry["path"] == "/orders/1"
+        assert entry["duration"] == 0.0123
+        assert entry["status"] == 200
+    
+    def test_parse_sample_rates(self):
+        assert parse_sample_rates("/ping=0.01, sqlalchemy.engine=0.5") == {
+            "/ping": 0.01,
+            "sqlalchemy.engine": 0.5,
+        }
+    
+    def test_route_sampling(self, sampling):
+        """测试按路由采样，未配置的路由全部保留"""
+        sampling({"/ping": 0.0, "/debug/*": 0.0})
+        assert not sample_request("/ping")
+        assert not sample_request("/debug/pool")
+        assert sample_request("/orders/")
+    
+    def test_unsampled_request_keeps_warnings(self, sampling):
+        """测试未被采样的请求仍然保留 WARNING 及以上级别的日志"""
+        sampling_filter = SamplingFilter()
+        token = log_sampled_var.set(False)
+        try:
+            assert not sampling_filter.filter(_make_record())
+            assert sampling_filter.filter(_make_record(level=logging.ERROR))
+        finally:
+            log_sampled_var.reset(token)
+    
+    def test_logger_sampling(self, sampling):
+        """测试按 logger 名称采样，子 logger 继承父 logger 的采样率"""
+        sampling({"sqlalchemy.engine": 0.0})
+        sampling_filter = SamplingFilter()
+        assert not sampling_filter.filter(_make_record(name="sqlalchemy.engine.Engine"))
+        assert sampling_filter.filter(_make_record(name="services.orders"))
@@ -0,0 +1,88 @@
+import asyncio
+import time
+import pytest
+import pytest_asyncio
+
+import config
+import loop_monitor
+from context import request_id_var, request_path_var
+from middleware import RequestContextMiddleware
+
+
+@pytest_asyncio.fixture
+async def monitor(monkeypatch):
+    monkeypatch.setattr(config, "LOOP_MONITOR_INTERVAL", 0.01)
+    monkeypatch.setattr(config, "LOOP_SLOW_CALLBACK_MS", 50.0)
+    loop_monitor.clear()
+    loop_monitor.start()
+    yield
+    await loop_monitor.stop()
+    loop_monitor.clear()
+
+
+class TestLoopMonitor:
+    """事件循环监控测试类"""
+    
+    @pytest.mark.asyncio
+    async def test_detects_blocking_call(self, monitor):
+        """测试阻塞调用被记录为慢回调并带有请求上下文，同时体现在延迟样本中"""
+        async def blocking_handler():
+            request_id_var.set("req-123")
+            request_path_var.set("/blocking")
+            time.sleep(0.1)
+        
+        await asyncio.sleep(0.05)
+        await asyncio.create_task(blocking_handler())
+        await asyncio.sleep(0.05)
+        
+        stats = loop_monitor.get_loop_stats()
+        assert stats["running"]
+        assert stats["slow_callback_detection"]
+        assert stats["lag_ms"]["max"] >= 50
+        
+        slow = [entry for entry in stats["slow_callbacks"] if entry["request_id"] == "req-123"]
+        assert slow
+        assert slow[0]["path"] == "/blocking"
+        assert slow[0]["duration_ms"] >= 100
+        assert "blocking_handler" in slow[0]["callback"]
+    
+    @pytest.mark.asyncio
+    async def test_request_finished_within_callback(self, monitor):
+        """测试请求在一次回调内开始并结束（上下文变量已重置）时仍能找到所属请求"""
+        async def blocking_app(scope, receive, send):
+            time.sleep(0.1)
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+        
+        headers = {}
+        async def send(message):
+            if message["type"] == "http.response.start":
+                headers.update(message["headers"])
+        
+        app = RequestContextMiddleware(blocking_app)
+        scope = {"type": "http", "method": "GET", "path": "/blocking", "headers": []}
+        await asyncio.create_task(app(scope, None, send))
+        
+        request_id = headers[b"x-request-id"].decode()
+        slow = [entry for entry in loop_monitor.get_loop_stats()["slow_callbacks"] if entry["request_id"] == request_id]
+        assert slow and slow[0]["path"] == "/blocking"
+    
+    @pytest.mark.asyncio
+    async def test_stop_restores_handle(self, monitor):
+        """测试停止后恢复原始的 Handle._run"""
+        await loop_monitor.stop()
+        assert not loop_monitor.get_loop_stats()["slow_callback_detection"]
+        assert asyncio.events.Handle._run.__name__ == "_run"
+    
+    @pytest.mark.asyncio
+    async def test_slow_callback_detection_off_by_default(self, monkeypatch):
+        """测试未设置 LOOP_SLOW_CALLBACK_MS 时只运行延迟监控，不包装 Handle._run"""
+        monkeypatch.setattr(config, "LOOP_MONITOR_INTERVAL", 0.01)
+        monkeypatch.setattr(config, "LOOP_SLOW_CALLBACK_MS", 0.0)
+        loop_monitor.start()
+        try:
+            assert loop_monitor.get_loop_stats()["running"]
+            assert not loop_monitor.get_loop_stats()["slow_callback_detection"]
+            assert asyncio.events.Handle._run.__name__ == "_run"
+        finally:
+            await loop_monitor.stop()
@@ -0,0 +1,165 @@
+import os
+
+import pytest
+
+import metrics
+import profiler
+from models import User, Order
+
+
+@pytest.fixture
+def temp_metrics():
+    """创建测试用指标，测试结束后从注册表中移除"""
+    created = []
+    
+    def _create(cls, name, *args, **kwargs):
+        metric = cls(name, "test metric", *args, **kwargs)
+        created.append(name)
+        return metric
+    
+    yield _create
+    for name in created:
+        metrics._registry.pop(name, None)
+
+
+class TestMetrics:
+    """指标测试类"""
+    
+    def test_render_histogram(self, temp_metrics):
+        """测试直方图按 Prometheus 格式输出累积桶"""
+        histogram = temp_metrics(metrics.Histogram, "test_latency_seconds", ("route",), buckets=(0.1, 1.0))
+        histogram.observe(0.05, "/a")
+        histogram.observe(0.5, "/a")
+        histogram.observe(5, "/a")
+        
+        lines = metrics.render().splitlines()
+        assert "# TYPE test_latency_seconds histogram" in lines
+        assert 'test_latency_seconds_bucket{route="/a",le="0.1"} 1' in lines
+        assert 'test_latency_seconds_bucket{route="/a",le="1.0"} 2' in lines
+        assert 'test_latency_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+        assert 'test_latency_seconds_count{route="/a"} 3' in lines
+    
+    def test_aggregate_across_workers(self):
+        """测试多个 worker 的快照求和，已退出进程的 Gauge 不计入"""
+        def _snapshot(pid, count, in_flight):
+            return {"pid": pid, "metrics": {
+                "requests": {"type": "counter", "help": "", "labelnames": [], "buckets": [], "samples": [[[], count]]},
+                "in_flight": {"type": "gauge", "help": "", "labelnames": [], "buckets": [], "samples": [[[], in_flight]]},
+            }}
+        
+        dead_pid = 2 ** 22 + 12345
+        merged = metrics.aggregate([_snapshot(os.getpid(), 3, 1), _snapshot(dead_pid, 4, 7)])
+        assert merged["requests"]["values"][()] == 7
+        assert merged["in_flight"]["values"][()] == 1
+    
+    def test_snapshot_files(self, temp_metrics, tmp_path, monkeypatch):
+        """测试通过 METRICS_DIR 写入和读取快照"""
+        monkeypatch.setattr(metrics.config, "METRICS_DIR", str(tmp_path))
+        counter = temp_metrics(metrics.Counter, "test_events_total")
+        counter.inc(amount=2)
+        metrics.write_snapshot()
+        
+        assert os.path.exists(metrics._snapshot_path(os.getpid()))
+        assert "test_events_total 2" in metrics.render().splitlines()
+    
+    def test_dead_worker_snapshots_are_archived(self, temp_metrics, tmp_path, monkeypatch):
+        """测试已退出 worker 的计数器合并进归档后删除快照，合计值不回退"""
+        monkeypatch.setattr(metrics.config, "METRICS_DIR", str(tmp_path))
+        temp_metrics(metrics.Counter, "test_jobs_total")
+        dead_pid = 2 ** 22 + 12345
+        
+        def _write(pid, started, count):
+            metrics._write_json(str(tmp_path / f"metrics_{pid}_{started}.json"), {"pid": pid, "metrics": {
+                "test_jobs_total": {"type": "counter", "help": "", "labelnames": [], "buckets": [], "samples": [[[], count]]},
+                "test_jobs_in_flight": {"type": "gauge", "help": "", "labelnames": [], "buckets": [], "samples": [[[], 9]]},
+            }})
+        
+        _write(dead_pid, 1, 3)
+        _write(dead_pid + 1, 1, 4)
+        assert "test_jobs_total 7" in metrics.render().splitlines()
+        assert sorted(os.listdir(tmp_path)) == [".metrics.lock", metrics.ARCHIVE_FILENAME]
+        
+        # 之后退出的 worker 累加到归档中
+        _write(dead_pid, 2, 5)
+        lines = metrics.render().splitlines()
+        assert "test_jobs_total 12" in lines
+        assert not any(line.startswith("test_jobs_in_flight") for line in lines)
+        
+        metrics.clear_snapshots()
+        assert os.listdir(tmp_path) == [".metrics.lock"]
+    
+    @pytest.mark.asyncio
+    async def test_metrics_endpoint(self, async_client, setup_database, test_session):
+        """测试 /metrics 按路由模板统计请求并记录每个请求的 SQL 次数"""
+        metrics.instrument_engine(test_session.bind.sync_engine)
+        
+        user = User(username="testuser", email="test@example.com", hashed_password="testpass")
+        test_session.add(user)
+        await test_session.commit()
+        await test_session.refresh(user)
+        order = Order(user_id=user.id, amount=1.0, status="pending")
+        test_session.add(order)
+        await test_session.commit()
+        await test_session.refresh(order)
+        
+        before = metrics.http_request_db_queries.get("GET", "/orders/{order_id}")
+        await async_client.get(f"/orders/{order.id}")
+        count, queries = metrics.http_request_db_queries.get("GET", "/orders/{order_id}")
+        assert count == before[0] + 1
+        assert queries > before[1]
+        
+        response = await async_client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert 'http_requests_total{method="GET",route="/orders/{order_id}",status="200"}' in response.text
+        assert "http_requests_in_flight" in response.text
+
+
+@pytest.fixture
+def profiling(test_session, monkeypatch):
+    """开启 SQL 分析并在测试引擎上注册事件"""
+    monkeypatch.setattr(profiler.config, "QUERY_PROFILING", True)
+    metrics.instrument_engine(test_session.bind.sync_engine)
+    profiler.clear_profiles()
+    yield
+    profiler.clear_profiles()
+
+
+class TestQueryProfiler:
+    """SQL 分析器测试类"""
+    
+    def test_normalize_statement(self):
+        """测试参数列表长度和数字字面量不同的语句归一化为同一形态"""
+        first = profiler.normalize_statement("SELECT users.id FROM users\n WHERE users.id IN (?, ?, ?) LIMIT 10")
+        second = profiler.normalize_statement("SELECT users.id FROM users WHERE users.id IN (?) LIMIT 20")
+        assert first == second == "SELECT users.id FROM users WHERE users.id IN (?) LIMIT ?"
+    
+    def test_repeated_shapes(self):
+        """测试同一形态的语句重复执行被识别为 N+1"""
+        profile = profiler.RequestProfile("req-1", "GET", "/users/")
+        for _ in range(3):
+            profile.record("SELECT orders.id FROM orders WHERE orders.user_id = ?", 0.001)
+        profile.record("SELECT users.id FROM users", 0.001)
+        
+        assert profile.repeated_shapes(threshold=3) == {
+            "SELECT orders.id FROM orders WHERE orders.user_id = ?": 3,
+        }
+    
+    @pytest.mark.asyncio
+    async def test_profile_headers_and_debug_endpoint(self, async_client, setup_database, test_session, profiling):
+        """测试响应头返回查询次数，并可通过调试接口查看语句"""
+        user = User(username="testuser", email="test@example.com", hashed_password="testpass")
+        test_session.add(user)
+        await test_session.commit()
+        
+        response = await async_client.get("/users/")
+        assert response.status_code == 200
+        assert int(response.headers["X-DB-Query-Count"]) >= 1
+        assert float(response.headers["X-DB-Time-Ms"]) >= 0
+        assert "X-DB-N-Plus-One" not in response.headers
+        
+        data = (await async_client.get("/debug/queries")).json()
+        assert data["enabled"] is True
+        profile = next(p for p in data["requests"] if p["path"] == "/users/")
+        assert profile["request_id"] == response.headers["X-Request-ID"]
+        assert any("FROM users" in q["statement"] for q in profile["queries"])
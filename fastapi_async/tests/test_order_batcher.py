@@ -0,0 +1,157 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from fastapi import HTTPException
+
+import config
+from models import User, Order
+from services import orders as orders_service
+from services import order_batcher
+
+
+@pytest_asyncio.fixture
+async def batcher(test_session, monkeypatch):
+    """使用测试数据库启动合并提交队列"""
+    monkeypatch.setattr(config, "ORDER_BATCHING", True)
+    monkeypatch.setattr(config, "ORDER_BATCH_MAX_ITEMS", 10)
+    monkeypatch.setattr(config, "ORDER_BATCH_MAX_WAIT_MS", 50.0)
+    order_batcher.start(sessionmaker(test_session.bind, class_=AsyncSession, expire_on_commit=False))
+    yield
+    await order_batcher.stop()
+
+
+@pytest_asyncio.fixture
+async def test_user(test_session):
+    user = User(username="testuser", email="test@example.com", hashed_password="testpass")
+    test_session.add(user)
+    await test_session.commit()
+    return user
+
+
+@pytest.mark.asyncio
+async def test_concurrent_orders_share_one_commit(batcher, test_user, monkeypatch):
+    calls = []
+    create_orders_bulk = orders_service.create_orders_bulk
+
+    async def counting_create_orders_bulk(db, items, **kwargs):
+        calls.append(len(items))
+        return await create_orders_bulk(db, items, **kwargs)
+
+    monkeypatch.setattr(orders_service, "create_orders_bulk", counting_create_orders_bulk)
+
+    results = await asyncio.gather(
+        *(order_batcher.submit(test_user.id, 10.0 + i) for i in range(5)),
+        order_batcher.submit(9999, 1.0),
+        return_exceptions=True,
+    )
+    assert calls == [6]
+
+    orders, missing = results[:5], results[5]
+    assert len({order.id for order in orders}) == 5
+    assert [order.amount for order in orders] == [10.0, 11.0, 12.0, 13.0, 14.0]
+    # 用户不存在只影响自己的请求
+    assert isinstance(missing, HTTPException) and missing.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_batches_are_capped_at_max_items(batcher, test_user, test_session, monkeypatch):
+    calls = []
+    create_orders_bulk = orders_service.create_orders_bulk
+
+    async def counting_create_orders_bulk(db, items, **kwargs):
+        calls.append(len(items))
+        return await create_orders_bulk(db, items, **kwargs)
+
+    monkeypatch.setattr(orders_service, "create_orders_bulk", counting_create_orders_bulk)
+
+    await asyncio.gather(*(order_batcher.submit(test_user.id, 1.0) for _ in range(25)))
+    assert calls == [10, 10, 5]
+    assert (await test_session.execute(select(func.count(Order.id)))).scalar() == 25
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_falls_back_to_single_inserts(batcher, test_user, test_session, monkeypatch):
+    async def failing_create_orders_bulk(db, items, **kwargs):
+        raise RuntimeError("batch insert failed")
+
+    monkeypatch.setattr(orders_service, "create_orders_bulk", failing_create_orders_bulk)
+    fallbacks = order_batcher.order_batch_fallbacks_total.get()
+
+    results = await asyncio.gather(
+        *(order_batcher.submit(test_user.id, 1.0) for _ in range(3)),
+        order_batcher.submit(9999, 1.0),
+        return_exceptions=True,
+    )
+
+    # 逐条重试后只有出错的订单失败
+    assert len({order.id for order in results[:3]}) == 3
+    assert isinstance(results[3], HTTPException) and results[3].status_code == 404
+    assert order_batcher.order_batch_fallbacks_total.get() == fallbacks + 1
+    assert (await test_session.execute(select(func.count(Order.id)))).scalar() == 3
+
+
+@pytest.mark.asyncio
+async def test_foreign_key_mode_skips_user_lookup(batcher, test_user, monkeypatch):
+    monkeypatch.setattr(config, "ORDER_USER_CHECK", "foreign_key")
+    calls = []
+    create_orders_bulk = orders_service.create_orders_bulk
+
+    async def recording_create_orders_bulk(db, items, **kwargs):
+        calls.append(kwargs)
+        return await create_orders_bulk(db, items, **kwargs)
+
+    monkeypatch.setattr(orders_service, "create_orders_bulk", recording_create_orders_bulk)
+
+    await order_batcher.submit(test_user.id, 1.0)
+    assert calls == [{"check_users": False}]
+
+
+@pytest.mark.asyncio
+async def test_dead_batcher_fails_waiting_orders(batcher, test_user, monkeypatch):
+    async def crashing_flush(batch):
+        raise RuntimeError("batcher crashed")
+
+    monkeypatch.setattr(order_batcher, "_flush", crashing_flush)
+
+    results = await asyncio.wait_for(
+        asyncio.gather(*(order_batcher.submit(test_user.id, 1.0) for _ in range(3)), return_exceptions=True),
+        timeout=5,
+    )
+    assert all(isinstance(r, HTTPException) and r.status_code == 503 for r in results)
+    assert not order_batcher.is_running()
+
+    # 后台任务退出后不再接收新订单
+    with pytest.raises(HTTPException) as exc_info:
+        await order_batcher.submit(test_user.id, 1.0)
+    assert exc_info.value.status_code == 503
+
+
+@pytest.mark.asyncio
+async def test_stop_flushes_queued_orders(test_session, test_user, monkeypatch):
+    monkeypatch.setattr(config, "ORDER_BATCHING", True)
+    # 等待时间足够长，只有 stop 才会触发提交
+    monkeypatch.setattr(config, "ORDER_BATCH_MAX_WAIT_MS", 10000.0)
+    order_batcher.start(sessionmaker(test_session.bind, class_=AsyncSession, expire_on_commit=False))
+
+    pending = asyncio.gather(*(order_batcher.submit(test_user.id, 1.0) for _ in range(3)))
+    await asyncio.sleep(0.01)
+    await order_batcher.stop()
+
+    assert len(await pending) == 3
+    assert not order_batcher.is_running()
+
+
+@pytest.mark.asyncio
+async def test_create_order_endpoint_uses_batcher(async_client, batcher, test_user):
+    responses = await asyncio.gather(*(
+        async_client.post("/orders/", json={"user_id": test_user.id, "amount": 5.0}) for _ in range(3)
+    ))
+    assert [r.status_code for r in responses] == [200] * 3
+    assert len({r.json()["id"] for r in responses}) == 3
+    assert order_batcher.order_batch_size.get()[0] >= 1
+
+    response = await async_client.post("/orders/", json={"user_id": 9999, "amount": 5.0})
+    assert response.status_code == 404
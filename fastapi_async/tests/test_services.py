@@ -1,11 +1,19 @@
+import asyncio
 import pytest
 import pytest_asyncio
-from sqlalchemy import insert
+from sqlalchemy import event, insert, text
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException
 
+import config
+from datetime import date, datetime
+from types import SimpleNamespace
 from models import User, Order
 from services import orders as orders_service
+from services import users as users_service
+from services import order_stats
+from services import singleflight
+from services.cache import CacheBackend, LocalCacheBackend, TTLCache
 
 
 @pytest_asyncio.fixture
@@ -65,6 +73,73 @@ class TestOrdersService:
         assert excinfo.value.status_code == 404
         assert excinfo.value.detail == "User not found"
     
+    @pytest.mark.asyncio
+    async def test_create_order_uses_known_user_cache(self, test_session, test_user, monkeypatch):
+        """测试已知用户命中缓存时不再查询 users 表"""
+        users_service.remember_user(test_user.id)
+        
+        async def _fail(*args, **kwargs):
+            raise AssertionError("user lookup should be skipped")
+        monkeypatch.setattr(test_session, "execute", _fail)
+        
+        order = await orders_service.create_order(db=test_session, user_id=test_user.id, amount=1.0)
+        assert order.id is not None
+    
+    @pytest.mark.asyncio
+    async def test_create_order_foreign_key_mode(self, test_session, test_user, monkeypatch):
+        """测试 foreign_key 模式下外键冲突转换为 404"""
+        monkeypatch.setattr(config, "ORDER_USER_CHECK", "foreign_key")
+        await test_session.execute(text("PRAGMA foreign_keys=ON"))
+        try:
+            order = await orders_service.create_order(db=test_session, user_id=test_user.id, amount=1.0)
+            assert order.id is not None
+            
+            with pytest.raises(HTTPException) as excinfo:
+                await orders_service.create_order(db=test_session, user_id=9999, amount=1.0)
+            assert excinfo.value.status_code == 404
+            assert excinfo.value.detail == "User not found"
+        finally:
+            await test_session.execute(text("PRAGMA foreign_keys=OFF"))
+    
+    @pytest.mark.asyncio
+    async def test_create_orders_bulk(self, test_session, test_user):
+        """测试批量创建订单，结果与输入顺序一致"""
+        results = await orders_service.create_orders_bulk(
+            db=test_session,
+            items=[
+                {"user_id": 9999, "amount": 1.0},
+                {"user_id": test_user.id, "amount": 2.0},
+                {"user_id": test_user.id, "amount": 3.0, "status": "completed"},
+            ],
+        )
+        
+        assert results[0] == (None, "User not found")
+        assert results[1][0].amount == 2.0
+        assert results[1][0].status == "pending"
+        assert results[2][0].amount == 3.0
+        assert results[2][0].status == "completed"
+        
+        orders = await orders_service.get_all_orders(db=test_session)
+        assert len(orders) == 2
+    
+    @pytest.mark.asyncio
+    async def test_create_orders_bulk_stale_user_cache(self, test_session, test_user):
+        """测试缓存中的用户已被删除时，外键冲突只影响该用户的订单"""
+        users_service.remember_user(9999)
+        await test_session.execute(text("PRAGMA foreign_keys=ON"))
+        try:
+            results = await orders_service.create_orders_bulk(db=test_session, items=[
+                {"user_id": 9999, "amount": 1.0},
+                {"user_id": test_user.id, "amount": 2.0},
+            ])
+        finally:
+            await test_session.execute(text("PRAGMA foreign_keys=OFF"))
+        
+        assert results[0] == (None, "User not found")
+        assert results[1][0].amount == 2.0
+        assert not users_service.is_known_user(9999)
+        assert len(await orders_service.get_all_orders(db=test_session)) == 1
+    
     @pytest.mark.asyncio
     async def test_get_all_orders_empty(self, test_session):
         """测试获取所有订单（空）"""
@@ -85,6 +160,38 @@ class TestOrdersService:
         assert orders[0].amount == 50.0
         assert orders[1].amount == 75.0
     
+    @pytest.mark.asyncio
+    async def test_get_all_orders_keyset(self, test_session, test_user):
+        """测试按 id 做 keyset 分页"""
+        test_session.add_all([Order(user_id=test_user.id, amount=float(i), status="pending") for i in range(4)])
+        await test_session.commit()
+        
+        first_page = await orders_service.get_all_orders(db=test_session, limit=2)
+        assert [o.amount for o in first_page] == [0.0, 1.0]
+        
+        second_page = await orders_service.get_all_orders(db=test_session, limit=2, after=first_page[-1].id)
+        assert [o.amount for o in second_page] == [2.0, 3.0]
+    
+    @pytest.mark.asyncio
+    async def test_order_filters_use_indexes(self, test_session, test_user):
+        """测试按用户和待处理状态过滤时 SQLite 使用对应索引"""
+        plans = {}
+        for name, condition in (("user_id", "user_id = 1"), ("status", "status = 'pending'")):
+            result = await test_session.execute(text(f"EXPLAIN QUERY PLAN SELECT id FROM orders WHERE {condition} ORDER BY id"))
+            plans[name] = " ".join(row[-1] for row in result)
+        
+        assert "ix_orders_user_id" in plans["user_id"]
+        assert "ix_orders_pending_id" in plans["status"]
+    
+    @pytest.mark.asyncio
+    async def test_stream_order_batches(self, test_session, test_user):
+        """测试分批流式读取订单"""
+        test_session.add_all([Order(user_id=test_user.id, amount=float(i), status="pending") for i in range(5)])
+        await test_session.commit()
+        
+        batches = [batch async for batch in orders_service.stream_order_batches(db=test_session, batch_size=2)]
+        assert [len(batch) for batch in batches] == [2, 2, 1]
+    
     @pytest.mark.asyncio
     async def test_get_order_by_id(self, test_session, test_user):
         """测试通过ID获取订单"""
@@ -107,4 +214,244 @@ class TestOrdersService:
             await orders_service.get_order_by_id(db=test_session, order_id=9999)
         
         assert excinfo.value.status_code == 404
-        assert excinfo.value.detail == "Order not found" 
\ No newline at end of file
+        assert excinfo.value.detail == "Order not found" 
+
+class TestOrderStatsService:
+    """订单统计服务测试类"""
+    
+    @pytest_asyncio.fixture
+    async def orders(self, test_session, test_user):
+        test_session.add_all([
+            Order(user_id=test_user.id, amount=10.0, status="pending", created_at=datetime(2026, 1, 1, 9)),
+            Order(user_id=test_user.id, amount=20.0, status="completed", created_at=datetime(2026, 1, 1, 18)),
+            Order(user_id=test_user.id, amount=30.0, status="pending", created_at=datetime(2026, 1, 2, 12)),
+        ])
+        await test_session.commit()
+    
+    @pytest.mark.asyncio
+    async def test_group_by_day(self, test_session, orders):
+        """测试按日期汇总"""
+        stats = await order_stats.get_order_stats(db=test_session, group_by="day")
+        assert stats == [
+            {"key": "2026-01-01", "count": 2, "total": 30.0, "average": 15.0},
+            {"key": "2026-01-02", "count": 1, "total": 30.0, "average": 30.0},
+        ]
+        
+        stats = await order_stats.get_order_stats(db=test_session, group_by="day", start=date(2026, 1, 2))
+        assert [row["key"] for row in stats] == ["2026-01-02"]
+    
+    @pytest.mark.asyncio
+    async def test_rollup_matches_orders_table(self, test_session, test_user, orders, monkeypatch):
+        """测试预汇总表重建及增量更新后与直接查询订单表结果一致"""
+        await order_stats.rebuild_rollups(test_session)
+        monkeypatch.setattr(config, "ORDER_STATS_ROLLUP", True)
+        
+        await orders_service.create_order(db=test_session, user_id=test_user.id, amount=5.0)
+        await orders_service.create_orders_bulk(db=test_session, items=[
+            {"user_id": test_user.id, "amount": 7.0, "status": "completed"},
+            {"user_id": test_user.id, "amount": 8.0, "status": "completed"},
+        ])
+        
+        for group_by in order_stats.GROUP_BY_FIELDS:
+            from_rollup = await order_stats.get_order_stats(db=test_session, group_by=group_by)
+            monkeypatch.setattr(config, "ORDER_STATS_ROLLUP", False)
+            from_orders = await order_stats.get_order_stats(db=test_session, group_by=group_by)
+            monkeypatch.setattr(config, "ORDER_STATS_ROLLUP", True)
+            assert from_rollup == from_orders
+        
+        rows = (await test_session.execute(text("SELECT count(*) FROM order_daily_rollups"))).scalar()
+        assert rows == 5
+    
+    def test_rollup_requires_supported_dialect(self, monkeypatch):
+        """测试开启预汇总时在启动阶段校验数据库方言"""
+        monkeypatch.setattr(config, "ORDER_STATS_ROLLUP", True)
+        order_stats.check_rollup_support(SimpleNamespace(dialect=SimpleNamespace(name="sqlite")))
+        with pytest.raises(RuntimeError):
+            order_stats.check_rollup_support(SimpleNamespace(dialect=SimpleNamespace(name="mysql")))
+        
+        monkeypatch.setattr(config, "ORDER_STATS_ROLLUP", False)
+        order_stats.check_rollup_support(SimpleNamespace(dialect=SimpleNamespace(name="mysql")))
+
+
+class TestUsersService:
+    """用户服务测试类"""
+    
+    @pytest.mark.asyncio
+    async def test_user_exists_fills_cache(self, test_session, test_user):
+        """测试查询到的用户会被缓存"""
+        assert not users_service.is_known_user(test_user.id)
+        assert await users_service.user_exists(db=test_session, user_id=test_user.id)
+        assert users_service.is_known_user(test_user.id)
+        
+        users_service.forget_user(test_user.id)
+        assert not users_service.is_known_user(test_user.id)
+    
+    @pytest.mark.asyncio
+    async def test_user_exists_nonexistent(self, test_session):
+        """测试不存在的用户不会被缓存"""
+        assert not await users_service.user_exists(db=test_session, user_id=9999)
+        assert not users_service.is_known_user(9999)
+    
+    @pytest.mark.asyncio
+    async def test_get_users_include_orders_query_count(self, test_session):
+        """测试加载用户及其订单的查询次数与用户数量无关"""
+        users = [User(username=f"user{i}", email=f"user{i}@example.com", hashed_password="pass") for i in range(5)]
+        test_session.add_all(users)
+        await test_session.flush()
+        test_session.add_all(Order(user_id=user.id, amount=float(i)) for i, user in enumerate(users) for _ in range(3))
+        await test_session.commit()
+        test_session.expunge_all()
+        
+        statements = []
+        def _count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        sync_engine = test_session.bind.sync_engine
+        event.listen(sync_engine, "after_cursor_execute", _count)
+        try:
+            result = await users_service.get_users(db=test_session, limit=4, include_orders=True)
+        finally:
+            event.remove(sync_engine, "after_cursor_execute", _count)
+        
+        assert [user.username for user in result] == ["user0", "user1", "user2", "user3"]
+        assert all(len(user.orders) == 3 for user in result)
+        assert len(statements) == 2
+    
+    @pytest.mark.asyncio
+    async def test_get_users_include_orders_is_capped(self, test_session, monkeypatch):
+        """测试每个用户加载的订单数不超过 ORDERS_PER_USER，按 ID 升序"""
+        monkeypatch.setattr(config, "ORDERS_PER_USER", 2)
+        users = [User(username=f"user{i}", email=f"user{i}@example.com", hashed_password="pass") for i in range(3)]
+        test_session.add_all(users)
+        await test_session.flush()
+        test_session.add_all(Order(user_id=users[0].id, amount=float(i)) for i in range(5))
+        test_session.add(Order(user_id=users[1].id, amount=10.0))
+        await test_session.commit()
+        test_session.expunge_all()
+        
+        result = await users_service.get_users(db=test_session, include_orders=True)
+        assert [[order.amount for order in user.orders] for user in result] == [[0.0, 1.0], [10.0], []]
+    
+    @pytest.mark.asyncio
+    async def test_get_user_orders_keyset(self, test_session, test_user):
+        """测试按用户分页获取订单"""
+        other = User(username="other", email="other@example.com", hashed_password="pass")
+        test_session.add(other)
+        await test_session.flush()
+        test_session.add_all([
+            Order(user_id=test_user.id, amount=1.0),
+            Order(user_id=other.id, amount=2.0),
+            Order(user_id=test_user.id, amount=3.0),
+            Order(user_id=test_user.id, amount=4.0),
+        ])
+        await test_session.commit()
+        
+        first = await users_service.get_user_orders(db=test_session, user_id=test_user.id, limit=2)
+        assert [order.amount for order in first] == [1.0, 3.0]
+        rest = await users_service.get_user_orders(db=test_session, user_id=test_user.id, after=first[-1].id)
+        assert [order.amount for order in rest] == [4.0]
+        
+        with pytest.raises(HTTPException) as excinfo:
+            await users_service.get_user_orders(db=test_session, user_id=9999)
+        assert excinfo.value.status_code == 404
+
+
+class TestTTLCache:
+    """进程内缓存测试类"""
+    
+    def test_evicts_least_recently_used(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+    
+    def test_expires_entries(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1, ttl=-1)
+        assert cache.get("a") is None
+        assert len(cache) == 0
+    
+    def test_backend_must_implement_interface(self):
+        """测试缓存后端缺少方法时无法实例化"""
+        class IncompleteBackend(CacheBackend):
+            async def get(self, key):
+                return None
+        
+        with pytest.raises(TypeError):
+            IncompleteBackend()
+        assert isinstance(LocalCacheBackend(), CacheBackend)
+
+
+class TestSingleFlight:
+    """请求合并测试类"""
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_share_result(self):
+        calls = []
+        
+        async def load():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return object()
+        
+        results = await asyncio.gather(*(singleflight.do("test:1", load) for _ in range(5)))
+        assert len(calls) == 1
+        assert all(result is results[0] for result in results)
+        assert singleflight.in_flight_count() == 0
+        
+        # 执行结束后不再合并
+        await singleflight.do("test:1", load)
+        assert len(calls) == 2
+    
+    @pytest.mark.asyncio
+    async def test_exception_is_shared(self):
+        async def load():
+            await asyncio.sleep(0.01)
+            raise HTTPException(status_code=404, detail="Order not found")
+        
+        results = await asyncio.gather(*(singleflight.do("test:2", load) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, HTTPException) and result.status_code == 404 for result in results)
+        # 每个等待者拿到自己的异常对象
+        assert len({id(result) for result in results}) == 3
+        assert singleflight.in_flight_count() == 0
+    
+    @pytest.mark.asyncio
+    async def test_waiter_retries_when_leader_cancelled(self):
+        started = asyncio.Event()
+        
+        async def slow():
+            started.set()
+            await asyncio.sleep(10)
+        
+        async def fast():
+            return "ok"
+        
+        leader = asyncio.create_task(singleflight.do("test:3", slow))
+        await started.wait()
+        waiter = asyncio.create_task(singleflight.do("test:3", fast))
+        await asyncio.sleep(0)
+        leader.cancel()
+        
+        assert await waiter == "ok"
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+    
+    def test_pinned_reads_use_separate_key(self, monkeypatch):
+        import time
+        from starlette.requests import Request
+        import db
+        
+        def _request(cookie=None):
+            headers = [(b"cookie", cookie.encode())] if cookie else []
+            return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+        
+        # 未配置只读副本时都读主库，不需要区分
+        pinned = _request(f"{db.READ_PRIMARY_COOKIE}={time.time() + 60}")
+        assert singleflight.read_key(pinned, "orders:1") == "orders:1"
+        
+        monkeypatch.setattr(db, "read_engines", [object()])
+        assert singleflight.read_key(pinned, "orders:1") == "orders:1@primary"
+        assert singleflight.read_key(_request(), "orders:1") == "orders:1"
@@ -0,0 +1,190 @@
+"""
+启动预热与关闭排空。
+
+部署后的第一批请求原本要承担建立数据库连接、SQLAlchemy 编译语句和生成 OpenAPI 文档的开销。
+lifespan 启动时先完成这些工作：
+- 每个引擎预先打开 WARMUP_CONNECTIONS 个连接放回连接池；
+- 用真实的参数执行一遍各个 service 的查询，填充每个引擎的编译语句缓存；
+- 生成 OpenAPI 文档（FastAPI 在第一次访问 /docs 时才生成），并让 CPU 执行器提前启动所有子进程。
+预热完成前 GET /ready 返回 503；第一次预热在 WARMUP_TIMEOUT 内没有完成（如数据库尚未就绪）时，
+应用照常启动，由后台任务每隔 WARMUP_RETRY_INTERVAL 秒重试。
+
+关闭：uvicorn 收到 SIGTERM 后立即关闭监听 socket，等待进行中的请求（最多 SERVER_GRACEFUL_TIMEOUT 秒），
+之后才执行 lifespan 的关闭逻辑，此时已没有请求可以排空。设置 SHUTDOWN_DRAIN_DELAY 后，
+SIGTERM 先把就绪状态置为 draining（/ready 返回 503，负载均衡器摘除该实例），
+延迟 SHUTDOWN_DRAIN_DELAY 秒后再交给 uvicorn 原来的信号处理，期间仍正常处理请求（类似 k8s 的 preStop）。
+"""
+import asyncio
+import logging
+import signal
+import threading
+import time
+from datetime import date
+from sqlalchemy import select, text
+from sqlalchemy.pool import QueuePool
+import config
+import db
+import executors
+from models import Order, User
+from services import orders as orders_service
+from services import users as users_service
+from services import order_stats
+
+# 获取 logger
+logger = logging.getLogger(__name__)
+
+_state = {
+    "ready": False,
+    "draining": False,
+    "attempts": 0,
+    "last_error": None,
+    "duration_ms": None,
+}
+# 已完成的预热步骤，重试时跳过
+_done = set()
+_retry_task = None
+
+
+async def open_connections(engine, count: int) -> int:
+    """同时签出 count 个连接并执行 SELECT 1，归还后连接留在池中；返回打开的连接数"""
+    if not isinstance(engine.sync_engine.pool, QueuePool):
+        # SQLite 等不使用 QueuePool 的引擎只验证可以连接
+        count = 1
+    results = await asyncio.gather(*(engine.connect() for _ in range(count)), return_exceptions=True)
+    connections = [conn for conn in results if not isinstance(conn, BaseException)]
+    try:
+        for conn in results:
+            if isinstance(conn, BaseException):
+                raise conn
+        for conn in connections:
+            await conn.execute(text("SELECT 1"))
+    finally:
+        for conn in connections:
+            await conn.close()
+    return len(connections)
+
+
+async def warm_statements(session_factory) -> None:
+    """执行一遍各接口使用的查询，填充引擎的编译语句缓存（缓存键不包含参数值）"""
+    async with session_factory() as session:
+        # 按 ID 查询的两条语句直接执行与 service 相同的 select：通过 service 查询不存在的 ID 0
+        # 会记录 "not found" 警告和错误日志，每次启动、每个 worker 都出现，看起来像真的故障
+        await session.execute(select(User.id).where(User.id == 0))
+        await session.execute(select(Order).where(Order.id == 0))
+        await users_service.get_users(session, limit=1)
+        await users_service.get_users(session, limit=1, after=0, include_orders=True)
+        await orders_service.get_all_orders(session, limit=1)
+        await orders_service.get_all_orders(session, limit=1, after=0, user_id=0, status="pending")
+        await orders_service.get_order_rows(session, limit=1)
+        # 统计查询不带过滤条件时是全表 GROUP BY，这里限定到一个不存在的用户和当天，只走索引
+        today = date.today()
+        for group_by in order_stats.GROUP_BY_FIELDS:
+            await order_stats.get_order_stats(session, group_by, start=today, end=today, user_id=0)
+
+
+def warm_models(app) -> None:
+    """生成 OpenAPI 文档，其中包含所有请求/响应模型的 JSON schema"""
+    app.openapi()
+
+
+async def warm_up(app, engines=None, session_factories=None) -> bool:
+    """执行一轮预热，全部完成返回 True；失败的步骤在下一轮重试"""
+    if engines is None or session_factories is None:
+        engines = list({id(e): e for e in [db.engine, *db.read_engines]}.values())
+        session_factories = list({id(f): f for f in db.read_session_factories + [db.async_session]}.values())
+
+    _state["attempts"] += 1
+    start = time.perf_counter()
+    try:
+        if "connections" not in _done and config.WARMUP_CONNECTIONS > 0:
+            for engine in engines:
+                opened = await open_connections(engine, config.WARMUP_CONNECTIONS)
+                logger.info("Opened %s connections to %s", opened, engine.url.render_as_string(hide_password=True))
+        _done.add("connections")
+        if "statements" not in _done:
+            for session_factory in session_factories:
+                await warm_statements(session_factory)
+        _done.add("statements")
+        if "models" not in _done:
+            warm_models(app)
+        _done.add("models")
+        if "executor" not in _done:
+            await executors.warm_up()
+        _done.add("executor")
+    except Exception as e:
+        _state["last_error"] = f"{type(e).__name__}: {e}"
+        logger.warning("Warm-up attempt %s failed: %s", _state["attempts"], _state["last_error"])
+        return False
+
+    _state.update(ready=True, last_error=None, duration_ms=round((time.perf_counter() - start) * 1000, 3))
+    logger.info("Warm-up finished in %.1f ms", _state["duration_ms"])
+    return True
+
+
+async def _retry_loop(app, interval):
+    while not await warm_up(app):
+        await asyncio.sleep(interval)
+
+
+async def start(app) -> None:
+    """在 lifespan 启动时调用：等待第一轮预热最多 WARMUP_TIMEOUT 秒，未完成时转为后台重试"""
+    global _retry_task
+    reset()
+    install_signal_handler()
+    _retry_task = asyncio.create_task(_retry_loop(app, config.WARMUP_RETRY_INTERVAL))
+    try:
+        # shield：超时只是不再等待，预热任务继续在后台执行
+        await asyncio.wait_for(asyncio.shield(_retry_task), config.WARMUP_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning("Warm-up not finished after %ss, continuing in the background", config.WARMUP_TIMEOUT)
+
+
+def _make_sigterm_handler(previous, delay, loop):
+    def handle_sigterm(signum, frame):
+        # 第二次收到信号时不再延迟
+        if _state["draining"]:
+            previous(signum, frame)
+            return
+        _state.update(ready=False, draining=True)
+        # 信号处理函数中只做最少的事，日志和延迟调度交给事件循环
+        loop.call_soon_threadsafe(_schedule_exit, previous, signum, frame, delay, loop)
+    return handle_sigterm
+
+
+def _schedule_exit(previous, signum, frame, delay, loop):
+    logger.warning("Received signal %s, marked not ready, shutting down in %ss", signum, delay)
+    loop.call_later(delay, previous, signum, frame)
+
+
+def install_signal_handler() -> bool:
+    """在 lifespan 启动时调用，包装服务器（uvicorn）已经安装的 SIGTERM 处理函数"""
+    if config.SHUTDOWN_DRAIN_DELAY <= 0 or threading.current_thread() is not threading.main_thread():
+        return False
+    previous = signal.getsignal(signal.SIGTERM)
+    if not callable(previous):
+        return False
+    handler = _make_sigterm_handler(previous, config.SHUTDOWN_DRAIN_DELAY, asyncio.get_running_loop())
+    signal.signal(signal.SIGTERM, handler)
+    return True
+
+
+async def stop() -> None:
+    """在 lifespan 关闭时调用：停止预热重试，标记为未就绪"""
+    global _retry_task
+    if _retry_task is not None:
+        _retry_task.cancel()
+        try:
+            await _retry_task
+        except asyncio.CancelledError:
+            pass
+        _retry_task = None
+    _state.update(ready=False, draining=True)
+
+
+def get_status() -> dict:
+    return dict(_state)
+
+
+def reset() -> None:
+    _state.update(ready=False, draining=False, attempts=0, last_error=None, duration_ms=None)
+    _done.clear()
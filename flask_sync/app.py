@@ -1,17 +1,40 @@
 from flask import Flask
+from werkzeug.exceptions import HTTPException
 import time
 import threading
+import logging
+import config
+from db import Session, pool_status
+from routers import users, orders
+
+logging.basicConfig(level=config.LOG_LEVEL, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
 
 app = Flask(__name__)
+app.register_blueprint(users.bp)
+app.register_blueprint(orders.bp)
+
+@app.teardown_appcontext
+def remove_session(exc=None):
+    # 归还当前线程的会话和连接，未提交的事务会被回滚
+    Session.remove()
+
+@app.errorhandler(HTTPException)
+def handle_http_exception(exc):
+    # 与 fastapi_async 相同的错误响应格式
+    return {"detail": exc.description}, exc.code
 
 @app.route("/ping")
 def ping():
     return {"message": "pong"}
 
+@app.route("/debug/pool")
+def debug_pool():
+    return pool_status()
+
 @app.route("/sleep")
 def sleep_endpoint():
     time.sleep(5)  # Simulate IO blocking operation
     return {"id": threading.current_thread().native_id, "message": "Woke up after 5 seconds"}
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8000) 
\ No newline at end of file
+    app.run(host="0.0.0.0", port=8000)
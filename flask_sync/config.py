@@ -0,0 +1,65 @@
+"""
+应用配置，全部从环境变量读取，未设置时使用本地开发的默认值。
+"""
+import os
+
+
+def _env_str(name, default=None):
+    value = os.getenv(name)
+    return default if value is None or value == "" else value
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return default if value is None or value == "" else int(value)
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return default if value is None or value == "" else float(value)
+
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _uwsgi_threads():
+    """在 uwsgi 中运行时返回每个进程的线程数，否则返回 None"""
+    try:
+        import uwsgi
+    except ImportError:
+        return None
+    threads = uwsgi.opt.get("threads")
+    if isinstance(threads, bytes):
+        threads = threads.decode()
+    return int(threads) if threads else 1
+
+
+# 同步驱动的数据库 URL，与 fastapi_async 使用同一个库和表结构（由 fastapi_async 的 Alembic 迁移创建）
+DATABASE_URL = _env_str("DATABASE_URL", "postgresql://localhost:5432/fastapi")
+
+# 每个 uwsgi 进程的连接池大小：每个工作线程同一时间最多占用一个连接，
+# 所以默认等于进程的线程数，且不允许溢出；总连接数 = 进程数 × 线程数
+DB_POOL_SIZE = _env_int("DB_POOL_SIZE", _uwsgi_threads() or 5)
+DB_MAX_OVERFLOW = _env_int("DB_MAX_OVERFLOW", 0)
+DB_POOL_TIMEOUT = _env_float("DB_POOL_TIMEOUT", 30.0)
+DB_POOL_RECYCLE = _env_int("DB_POOL_RECYCLE", 1800)
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", False)
+
+# gevent 模式（gevent_server.py）：进程数、每个进程最多同时处理的连接数
+# 此时每个进程有上千个并发请求，DB_POOL_SIZE 需要显式设置，等待连接的请求只挂起自己的 greenlet
+GEVENT_HOST = _env_str("GEVENT_HOST", "0.0.0.0")
+GEVENT_PORT = _env_int("GEVENT_PORT", 5000)
+GEVENT_PROCESSES = _env_int("GEVENT_PROCESSES", os.cpu_count() or 1)
+GEVENT_CONNECTIONS = _env_int("GEVENT_CONNECTIONS", 1000)
+GEVENT_BACKLOG = _env_int("GEVENT_BACKLOG", 2048)
+GEVENT_STOP_TIMEOUT = _env_float("GEVENT_STOP_TIMEOUT", 10.0)
+
+# GET /users/?include=orders 时每个用户最多返回的订单数，与 fastapi_async 一致
+ORDERS_PER_USER = _env_int("ORDERS_PER_USER", 100)
+
+# 日志级别，压测时可设置为 WARNING 减少 stdout 写入
+LOG_LEVEL = _env_str("LOG_LEVEL", "INFO")
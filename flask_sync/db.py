@@ -0,0 +1,56 @@
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import declarative_base, scoped_session, sessionmaker
+import config
+
+
+def create_engine_from_settings(url: str, **overrides):
+    """根据 config 中的连接池配置创建同步引擎"""
+    url = make_url(url)
+    kwargs = {"echo": False}
+
+    # SQLite 使用自己的连接池实现，不支持 QueuePool 的参数
+    if url.get_backend_name() != "sqlite":
+        kwargs.update(
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pool_recycle=config.DB_POOL_RECYCLE,
+            pool_pre_ping=config.DB_POOL_PRE_PING,
+        )
+
+    kwargs.update(overrides)
+    return create_engine(url, **kwargs)
+
+
+engine = create_engine_from_settings(config.DATABASE_URL)
+
+# 每个线程一个会话，请求结束时在 teardown_appcontext 中移除
+Session = scoped_session(sessionmaker(engine, expire_on_commit=False))
+Base = declarative_base()
+
+
+def pool_status() -> dict:
+    """返回连接池的实时状态"""
+    pool = engine.pool
+    if not hasattr(pool, "checkedout"):
+        return {"pool": type(pool).__name__}
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        # overflow() 在连接池未满时为负数
+        "overflow": max(0, pool.overflow()),
+    }
+
+
+try:
+    from uwsgidecorators import postfork
+except ImportError:
+    pass
+else:
+    # uwsgi 默认在 master 中加载应用后再 fork，子进程不能复用 master 的连接
+    @postfork
+    def _reset_pool_after_fork():
+        engine.dispose(close=False)
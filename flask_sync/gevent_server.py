@@ -0,0 +1,85 @@
+"""
+gevent 协作式并发模式的启动入口。
+
+    python gevent_server.py
+
+必须在导入任何其他模块之前调用 monkey.patch_all()：time.sleep、socket、threading 等都会被替换为
+协作式实现，阻塞调用只会挂起当前 greenlet，一个进程即可同时处理数千个阻塞请求。
+threading.local 也会变为 greenlet 本地变量，所以 scoped_session 仍然是每个请求一个会话。
+psycopg2 是 C 扩展，不受 monkey patch 影响，需要 psycogreen 让它在等待数据库时让出。
+
+多进程时在 fork 前创建监听 socket，所有子进程共享同一个 socket 接受连接。
+"""
+from gevent import monkey
+
+monkey.patch_all()
+
+try:
+    from psycogreen.gevent import patch_psycopg
+except ImportError:
+    patch_psycopg = None
+else:
+    patch_psycopg()
+
+import logging
+import os
+import signal
+import socket
+import sys
+
+from gevent.pool import Pool
+from gevent.pywsgi import WSGIServer
+
+import config
+from app import app
+from db import engine
+
+# 获取 logger
+logger = logging.getLogger(__name__)
+
+
+def serve(listener):
+    # Pool 限制单个进程同时处理的连接数，超过后新连接留在监听队列中
+    server = WSGIServer(listener, app, spawn=Pool(config.GEVENT_CONNECTIONS), log=None)
+    # 与 uwsgi 的 die-on-term 一致：收到 SIGTERM 时停止接受新连接并等待处理中的请求
+    signal.signal(signal.SIGTERM, lambda *_: server.stop(timeout=config.GEVENT_STOP_TIMEOUT))
+    server.serve_forever()
+
+
+def main():
+    if patch_psycopg is None and engine.dialect.name == "postgresql":
+        logger.warning("psycogreen is not installed, database calls will block the whole process")
+
+    listener = WSGIServer.get_listener(
+        (config.GEVENT_HOST, config.GEVENT_PORT), backlog=config.GEVENT_BACKLOG, family=socket.AF_INET,
+    )
+    logger.info("Serving on %s:%s with %s processes, %s connections each",
+                config.GEVENT_HOST, config.GEVENT_PORT, config.GEVENT_PROCESSES, config.GEVENT_CONNECTIONS)
+
+    children = []
+    for _ in range(config.GEVENT_PROCESSES - 1):
+        pid = os.fork()
+        if pid == 0:
+            # 子进程不能复用父进程的数据库连接
+            engine.dispose(close=False)
+            serve(listener)
+            sys.exit(0)
+        children.append(pid)
+
+    def stop_children(*_):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    try:
+        serve(listener)
+    finally:
+        stop_children()
+        for pid in children:
+            os.waitpid(pid, 0)
+
+
+if __name__ == "__main__":
+    main()
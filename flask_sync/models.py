@@ -0,0 +1,45 @@
+"""
+与 fastapi_async/models 相同的表结构。
+
+fastapi_async 的模型依赖其异步引擎（db.Base），无法在同步应用中直接导入，所以这里声明同样的表；
+表结构以 fastapi_async 的 Alembic 迁移为准，修改时两边需要同步。
+"""
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Index, text
+from sqlalchemy.orm import relationship
+from datetime import datetime
+from db import Base
+
+class User(Base):
+    __tablename__ = "users"
+
+    id = Column(Integer, primary_key=True)
+    username = Column(String, unique=True, index=True)
+    email = Column(String, unique=True, index=True)
+    hashed_password = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationship with Order
+    orders = relationship("Order", back_populates="user")
+
+class Order(Base):
+    __tablename__ = "orders"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    amount = Column(Float)
+    status = Column(String, default="pending")
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationship with User
+    user = relationship("User", back_populates="orders")
+    
+    __table_args__ = (
+        Index("ix_orders_user_id_created_at", "user_id", "created_at"),
+        Index(
+            "ix_orders_pending_id", "id",
+            postgresql_where=text("status = 'pending'"),
+            sqlite_where=text("status = 'pending'"),
+        ),
+    )
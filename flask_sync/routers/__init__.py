@@ -0,0 +1 @@
+# routers package
@@ -0,0 +1,151 @@
+from flask import Blueprint, abort, request
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from db import Session
+from models import User, Order
+import logging
+
+# 获取 logger
+logger = logging.getLogger(__name__)
+
+# 分页参数，与 fastapi_async 一致
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+MAX_BULK_SIZE = 1000
+
+bp = Blueprint("orders", __name__, url_prefix="/orders")
+
+
+def order_to_dict(order: Order) -> dict:
+    return {"id": order.id, "user_id": order.user_id, "amount": order.amount, "status": order.status}
+
+
+def query_int(name, default=None, minimum=None, maximum=None):
+    """读取整数查询参数，格式或范围不对时返回 422"""
+    value = request.args.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        abort(422, description=f"{name} must be an integer")
+    if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+        abort(422, description=f"{name} must be between {minimum} and {maximum}")
+    return value
+
+
+def paginate(query, column, limit, after):
+    """按 column 做 keyset 分页，多取一条用于判断是否还有下一页，返回 (rows, next_cursor)"""
+    if after is not None:
+        query = query.where(column > after)
+    rows = Session.execute(query.order_by(column).limit(limit + 1)).scalars().all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1].id
+    return rows, None
+
+
+def paged_response(items, next_cursor):
+    headers = {"X-Next-Cursor": str(next_cursor)} if next_cursor is not None else {}
+    return items, 200, headers
+
+
+def parse_order(data) -> dict:
+    if not isinstance(data, dict):
+        abort(422, description="Order must be an object")
+    try:
+        return {
+            "user_id": int(data["user_id"]),
+            "amount": float(data["amount"]),
+            "status": str(data.get("status") or "pending"),
+        }
+    except (KeyError, TypeError, ValueError):
+        abort(422, description="user_id and amount are required")
+
+
+@bp.post("/")
+def create_order():
+    """创建新订单"""
+    item = parse_order(request.get_json(silent=True))
+    logger.info("Creating new order for user_id: %s, amount: %s", item["user_id"], item["amount"])
+    
+    if Session.get(User, item["user_id"]) is None:
+        logger.error("Failed to create order: User with ID %s not found", item["user_id"])
+        abort(404, description="User not found")
+    
+    order = Order(**item)
+    Session.add(order)
+    try:
+        Session.commit()
+    except IntegrityError:
+        # 检查之后用户被删除，外键约束拒绝写入
+        Session.rollback()
+        logger.error("Failed to create order: User with ID %s violates foreign key", item["user_id"])
+        abort(404, description="User not found")
+    
+    logger.info("Order created successfully with ID: %s", order.id)
+    return order_to_dict(order)
+
+
+@bp.post("/bulk")
+def create_orders_bulk():
+    """批量创建订单：一次 IN 查询校验用户，一条多行 INSERT ... RETURNING 写入"""
+    payload = request.get_json(silent=True) or {}
+    orders = payload.get("orders") if isinstance(payload, dict) else None
+    if not isinstance(orders, list) or not 1 <= len(orders) <= MAX_BULK_SIZE:
+        abort(422, description=f"orders must contain 1 to {MAX_BULK_SIZE} items")
+    items = [parse_order(data) for data in orders]
+    logger.info("Creating %s orders in bulk", len(items))
+    
+    user_ids = {item["user_id"] for item in items}
+    existing_user_ids = set(Session.execute(select(User.id).where(User.id.in_(user_ids))).scalars())
+    
+    rows = [item for item in items if item["user_id"] in existing_user_ids]
+    created = []
+    if rows:
+        created = Session.execute(insert(Order).returning(Order, sort_by_parameter_order=True), rows).scalars().all()
+        Session.commit()
+    
+    results = []
+    created_iter = iter(created)
+    for index, item in enumerate(items):
+        if item["user_id"] in existing_user_ids:
+            results.append({"index": index, "order": order_to_dict(next(created_iter)), "error": None})
+        else:
+            results.append({"index": index, "order": None, "error": "User not found"})
+    
+    logger.info("Bulk order creation finished, created: %s, failed: %s", len(rows), len(items) - len(rows))
+    return {"created": len(rows), "failed": len(items) - len(rows), "results": results}
+
+
+@bp.get("/")
+def get_orders():
+    """分页获取订单，可按用户和状态过滤，下一页游标通过 X-Next-Cursor 响应头返回"""
+    limit = query_int("limit", DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE)
+    after = query_int("after")
+    user_id = query_int("user_id")
+    status = request.args.get("status")
+    logger.info("Retrieving orders, limit: %s, after: %s, user_id: %s, status: %s", limit, after, user_id, status)
+    
+    query = select(Order)
+    if user_id is not None:
+        query = query.where(Order.user_id == user_id)
+    if status is not None:
+        query = query.where(Order.status == status)
+    orders, next_cursor = paginate(query, Order.id, limit, after)
+    
+    logger.info("Retrieved %s orders", len(orders))
+    return paged_response([order_to_dict(order) for order in orders], next_cursor)
+
+
+@bp.get("/<int:order_id>")
+def get_order(order_id):
+    """根据ID获取订单"""
+    logger.info("Retrieving order with ID: %s", order_id)
+    
+    order = Session.get(Order, order_id)
+    if order is None:
+        logger.error("Order with ID: %s not found", order_id)
+        abort(404, description="Order not found")
+    
+    return order_to_dict(order)
@@ -0,0 +1,89 @@
+from flask import Blueprint, abort, request
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from db import Session
+from models import User, Order
+from routers.orders import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, order_to_dict, paginate, paged_response, query_int
+import config
+import logging
+
+# 获取 logger
+logger = logging.getLogger(__name__)
+
+bp = Blueprint("users", __name__, url_prefix="/users")
+
+
+def user_to_dict(user: User, orders=None) -> dict:
+    data = {"id": user.id, "username": user.username, "email": user.email}
+    if orders is not None:
+        data["orders"] = [order_to_dict(order) for order in orders]
+    return data
+
+
+def load_orders(users, per_user: int) -> dict:
+    """一条窗口函数查询加载每个用户前 per_user 个订单（按 Order.id 升序），返回 {user_id: [order, ...]}"""
+    orders_by_user = {user.id: [] for user in users}
+    if orders_by_user:
+        row_number = func.row_number().over(partition_by=Order.user_id, order_by=Order.id).label("row_number")
+        ranked = select(Order, row_number).where(Order.user_id.in_(orders_by_user)).subquery()
+        ranked_order = aliased(Order, ranked)
+        query = select(ranked_order).where(ranked.c.row_number <= per_user).order_by(ranked.c.user_id, ranked.c.id)
+        for order in Session.execute(query).scalars():
+            orders_by_user[order.user_id].append(order)
+    return orders_by_user
+
+
+@bp.post("/")
+def create_user():
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict) or not all(isinstance(data.get(field), str) for field in ("username", "email", "password")):
+        abort(422, description="username, email and password are required")
+    logger.info("Creating new user with username: %s, email: %s", data["username"], data["email"])
+    
+    # In a real app, hash the password
+    user = User(username=data["username"], email=data["email"], hashed_password=data["password"])
+    Session.add(user)
+    try:
+        Session.commit()
+    except IntegrityError:
+        # username 和 email 有唯一约束
+        Session.rollback()
+        logger.warning("Failed to create user: username %s or email %s already exists", data["username"], data["email"])
+        abort(409, description="Username or email already registered")
+    
+    logger.info("User created successfully with ID: %s", user.id)
+    return user_to_dict(user)
+
+
+@bp.get("/")
+def get_users():
+    """分页获取用户；include=orders 时一次加载本页所有用户的订单，每个用户最多 ORDERS_PER_USER 个"""
+    limit = query_int("limit", DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE)
+    after = query_int("after")
+    include = request.args.get("include")
+    if include not in (None, "orders"):
+        abort(422, description="include must be 'orders'")
+    include_orders = include == "orders"
+    logger.info("Retrieving users, limit: %s, after: %s, include: %s", limit, after, include)
+    
+    users, next_cursor = paginate(select(User), User.id, limit, after)
+    orders_by_user = load_orders(users, config.ORDERS_PER_USER) if include_orders else {}
+    
+    logger.info("Retrieved %s users", len(users))
+    return paged_response([user_to_dict(user, orders_by_user.get(user.id)) for user in users], next_cursor)
+
+
+@bp.get("/<int:user_id>/orders")
+def get_user_orders(user_id):
+    """分页获取某个用户的订单"""
+    limit = query_int("limit", DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE)
+    after = query_int("after")
+    logger.info("Retrieving orders for user_id: %s, limit: %s, after: %s", user_id, limit, after)
+    
+    if Session.execute(select(User.id).where(User.id == user_id)).scalar() is None:
+        abort(404, description="User not found")
+    orders, next_cursor = paginate(select(Order).where(Order.user_id == user_id), Order.id, limit, after)
+    
+    logger.info("Retrieved %s orders for user_id: %s", len(orders), user_id)
+    return paged_response([order_to_dict(order) for order in orders], next_cursor)
@@ -0,0 +1,41 @@
+import os
+import sys
+import pytest
+from sqlalchemy.pool import StaticPool
+
+# 在导入应用之前切换到内存 SQLite，db 模块在导入时根据 DATABASE_URL 创建引擎
+os.environ["DATABASE_URL"] = "sqlite://"
+
+# Add the parent directory to sys.path to allow importing app modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import db
+from app import app
+from db import Base, Session
+
+# 所有连接共用同一个内存数据库
+engine = db.create_engine_from_settings("sqlite://", poolclass=StaticPool,
+                                        connect_args={"check_same_thread": False})
+Session.configure(bind=engine)
+
+
+@pytest.fixture
+def setup_database():
+    Base.metadata.create_all(engine)
+    yield
+    Session.remove()
+    Base.metadata.drop_all(engine)
+
+
+@pytest.fixture
+def client(setup_database):
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def test_user(client):
+    response = client.post("/users/", json={"username": "testuser", "email": "test@example.com", "password": "testpass"})
+    assert response.status_code == 200
+    return response.get_json()
@@ -0,0 +1,144 @@
+class TestUsersEndpoints:
+    """用户接口测试类"""
+    
+    def test_create_user(self, client):
+        response = client.post("/users/", json={"username": "alice", "email": "alice@example.com", "password": "secret"})
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data["username"] == "alice"
+        assert data["email"] == "alice@example.com"
+        assert "id" in data and "password" not in data
+    
+    def test_create_user_duplicate(self, client, test_user):
+        """测试用户名或邮箱重复时返回 409，而不是未处理的 IntegrityError"""
+        response = client.post("/users/", json={"username": "testuser", "email": "other@example.com", "password": "x"})
+        assert response.status_code == 409
+        assert response.get_json() == {"detail": "Username or email already registered"}
+        
+        # 回滚后同一线程的会话仍然可用
+        response = client.post("/users/", json={"username": "other", "email": "other@example.com", "password": "x"})
+        assert response.status_code == 200
+    
+    def test_create_user_invalid(self, client):
+        response = client.post("/users/", json={"username": "alice"})
+        assert response.status_code == 422
+        assert "detail" in response.get_json()
+    
+    def test_get_users_pagination(self, client):
+        ids = [
+            client.post("/users/", json={"username": f"user{i}", "email": f"user{i}@example.com", "password": "x"}).get_json()["id"]
+            for i in range(5)
+        ]
+        
+        response = client.get("/users/?limit=2")
+        assert response.status_code == 200
+        assert [user["id"] for user in response.get_json()] == ids[:2]
+        cursor = response.headers["X-Next-Cursor"]
+        
+        seen = []
+        while cursor is not None:
+            response = client.get(f"/users/?limit=2&after={cursor}")
+            seen.extend(user["id"] for user in response.get_json())
+            cursor = response.headers.get("X-Next-Cursor")
+        assert seen == ids[2:]
+    
+    def test_get_users_include_orders(self, client, test_user):
+        client.post("/orders/", json={"user_id": test_user["id"], "amount": 10.0})
+        
+        response = client.get("/users/?include=orders")
+        assert response.status_code == 200
+        assert [order["amount"] for order in response.get_json()[0]["orders"]] == [10.0]
+        
+        assert client.get("/users/?include=payments").status_code == 422
+    
+    def test_get_users_include_orders_is_capped(self, client, test_user, monkeypatch):
+        """测试每个用户最多返回 ORDERS_PER_USER 个订单，与 fastapi_async 一致"""
+        import config
+        monkeypatch.setattr(config, "ORDERS_PER_USER", 2)
+        other = client.post("/users/", json={"username": "other", "email": "other@example.com", "password": "x"}).get_json()
+        for amount in (1.0, 2.0, 3.0):
+            client.post("/orders/", json={"user_id": test_user["id"], "amount": amount})
+        
+        response = client.get("/users/?include=orders")
+        assert [[order["amount"] for order in user["orders"]] for user in response.get_json()] == [[1.0, 2.0], []]
+        assert response.get_json()[1]["id"] == other["id"]
+    
+    def test_get_users_invalid_limit(self, client):
+        assert client.get("/users/?limit=0").status_code == 422
+        assert client.get("/users/?limit=abc").status_code == 422
+    
+    def test_get_user_orders(self, client, test_user):
+        for amount in (1.0, 2.0, 3.0):
+            client.post("/orders/", json={"user_id": test_user["id"], "amount": amount})
+        
+        response = client.get(f"/users/{test_user['id']}/orders?limit=2")
+        assert response.status_code == 200
+        assert [order["amount"] for order in response.get_json()] == [1.0, 2.0]
+        assert "X-Next-Cursor" in response.headers
+        
+        assert client.get("/users/9999/orders").status_code == 404
+
+
+class TestOrdersEndpoints:
+    """订单接口测试类"""
+    
+    def test_create_and_get_order(self, client, test_user):
+        response = client.post("/orders/", json={"user_id": test_user["id"], "amount": 99.99})
+        assert response.status_code == 200
+        order = response.get_json()
+        assert order["status"] == "pending"
+        
+        response = client.get(f"/orders/{order['id']}")
+        assert response.status_code == 200
+        assert response.get_json() == order
+    
+    def test_create_order_user_not_found(self, client, setup_database):
+        response = client.post("/orders/", json={"user_id": 9999, "amount": 1.0})
+        assert response.status_code == 404
+        assert response.get_json() == {"detail": "User not found"}
+    
+    def test_create_order_invalid(self, client, test_user):
+        assert client.post("/orders/", json={"user_id": test_user["id"]}).status_code == 422
+        assert client.post("/orders/", json={"user_id": "abc", "amount": 1.0}).status_code == 422
+    
+    def test_get_order_not_found(self, client, setup_database):
+        response = client.get("/orders/9999")
+        assert response.status_code == 404
+        assert response.get_json() == {"detail": "Order not found"}
+    
+    def test_create_orders_bulk(self, client, test_user):
+        response = client.post("/orders/bulk", json={"orders": [
+            {"user_id": test_user["id"], "amount": 1.0},
+            {"user_id": 9999, "amount": 2.0},
+            {"user_id": test_user["id"], "amount": 3.0, "status": "completed"},
+        ]})
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data["created"] == 2 and data["failed"] == 1
+        assert [result["error"] for result in data["results"]] == [None, "User not found", None]
+        assert data["results"][2]["order"]["status"] == "completed"
+    
+    def test_create_orders_bulk_invalid(self, client, setup_database):
+        assert client.post("/orders/bulk", json={"orders": []}).status_code == 422
+        assert client.post("/orders/bulk", json={}).status_code == 422
+    
+    def test_get_orders_filters_and_pagination(self, client, test_user):
+        for status in ("pending", "completed", "pending", "pending"):
+            client.post("/orders/", json={"user_id": test_user["id"], "amount": 1.0, "status": status})
+        
+        response = client.get("/orders/?status=pending&limit=2")
+        assert response.status_code == 200
+        first_page = response.get_json()
+        assert len(first_page) == 2
+        
+        response = client.get(f"/orders/?status=pending&limit=2&after={response.headers['X-Next-Cursor']}")
+        second_page = response.get_json()
+        assert len(second_page) == 1
+        assert "X-Next-Cursor" not in response.headers
+        assert all(order["status"] == "pending" for order in first_page + second_page)
+        
+        assert client.get(f"/orders/?user_id={test_user['id'] + 1}").get_json() == []
+
+
+def test_ping(client):
+    assert client.get("/ping").get_json() == {"message": "pong"}